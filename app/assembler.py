@@ -0,0 +1,106 @@
+from datetime import datetime
+from . import models, schemas, crud, errors, video, pagination, trending, feed
+
+own_views = models.Viewer.alias('own_views')
+
+
+def select_video_rows():
+    return (models.Video
+            .select(models.Video.id, models.Video.video_name, models.Video.description,
+                    models.Video.creation_time, models.Video.number_of_views,
+                    models.User.id.alias('author_id'), models.User.username.alias('author_name'))
+            .join(models.User, on=(models.Video.author_id == models.User.id))
+            .where(models.Video.is_published == True))
+
+
+def select_viewed_video_rows(viewer_id: int):
+    return (select_video_rows()
+            .select_extend(own_views.viewing_time)
+            .join_from(models.Video, own_views,
+                       on=((own_views.video == models.Video.id) & (own_views.viewer == viewer_id))))
+
+
+def assemble_video_infs(rows) -> list[schemas.VideoInf]:
+    rows = list(rows)
+    preview_urls = video.VideoManager.get_video_image_preview_urls([row.id for row in rows])
+    return [schemas.VideoInf(id=row.id, video_name=row.video_name, description=row.description,
+                             preview_image_url=preview_urls.get(row.id), author_name=row.author_name,
+                             author_id=row.author_id, published_at=row.creation_time,
+                             number_of_views=row.number_of_views)
+            for row in rows]
+
+
+def get_video_infs(query) -> list[schemas.VideoInf]:
+    return assemble_video_infs(query.namedtuples())
+
+
+def get_video_inf_page(query, key_fields: list, key_types: tuple, cursor: str | None,
+                       limit: int | None) -> schemas.VideoInfPage:
+    rows, next_cursor = pagination.paginate(query.namedtuples(), key_fields, key_types, cursor, limit)
+    return schemas.VideoInfPage(items=assemble_video_infs(rows), next_cursor=next_cursor)
+
+
+def get_videos_page(cursor: str | None, limit: int | None, author_id: int | None = None) -> schemas.VideoInfPage:
+    query = select_video_rows()
+    if author_id is not None:
+        query = query.where(models.Video.author_id == author_id)
+    return get_video_inf_page(query, [models.Video.creation_time, models.Video.id], (datetime, int), cursor, limit)
+
+
+def get_viewed_videos_page(viewer_id: int, cursor: str | None, limit: int | None) -> schemas.VideoInfPage:
+    return get_video_inf_page(select_viewed_video_rows(viewer_id), [own_views.viewing_time, models.Video.id],
+                              (datetime, int), cursor, limit)
+
+
+def get_video_show(video_id: int, user_id: int) -> schemas.VideoShow:
+    video_show = crud.video_show_cache.get(video_id)
+    if video_show is None:
+        video_show = build_video_show(video_id)
+    return video_show.copy(update={'user_reaction': crud.get_user_reaction_to_video(user_id, video_id)})
+
+
+@crud.coalesced
+def build_video_show(video_id: int) -> schemas.VideoShow:
+    """Build and cache the part of the video page that is the same for every user; user_reaction is left neutral.
+
+    The result is not cached when the video changed while it was being built.
+    """
+    generation = crud.video_show_cache.generation(video_id)
+    video_db = crud.get_video_by_id(video_id)
+    if video_db is None:
+        raise errors.VideoNotExist
+    comments_page = crud.get_comments_page(video_id, cursor=None, limit=None)
+    reactions = schemas.VideoReactionsInf(number_of_likes=video_db.number_of_likes,
+                                          number_of_dislikes=video_db.number_of_dislikes)
+    video_show = schemas.VideoShow(video_url=video.VideoManager.get_video_url_by_id(video_id), reactionsInf=reactions,
+                                   video_name=video_db.video_name, description=video_db.description,
+                                   user_reaction='neutral',
+                                   comments=comments_page.items, comments_next_cursor=comments_page.next_cursor,
+                                   number_of_comments=video_db.number_of_comments,
+                                   number_of_views=video_db.number_of_views, published_at=video_db.creation_time,
+                                   author_id=video_db.author_id_id)
+    crud.video_show_cache.set(video_id, video_show, generation=generation)
+    return video_show
+
+
+def get_trending_videos(limit: int) -> list[schemas.VideoInf]:
+    video_ids = trending.ranker.top(limit)
+    rows = {row.id: row for row in select_video_rows().where(models.Video.id.in_(video_ids)).namedtuples()}
+    return assemble_video_infs([rows[video_id] for video_id in video_ids if video_id in rows])
+
+
+def get_subscription_feed(subscriber_id: int, cursor: str | None, limit: int | None) -> schemas.VideoInfPage:
+    video_ids, next_cursor = feed.get_feed_page(subscriber_id, cursor, limit)
+    rows = {row.id: row for row in select_video_rows().where(models.Video.id.in_(video_ids)).namedtuples()}
+    return schemas.VideoInfPage(items=assemble_video_infs([rows[video_id] for video_id in video_ids
+                                                           if video_id in rows]),
+                                next_cursor=next_cursor)
+
+
+def get_related_videos(video_id: int, limit: int) -> list[schemas.VideoInf]:
+    return get_video_infs(select_video_rows()
+                          .join_from(models.Video, models.RelatedVideo,
+                                     on=(models.RelatedVideo.related == models.Video.id))
+                          .where(models.RelatedVideo.video == video_id)
+                          .order_by(models.RelatedVideo.score.desc(), models.RelatedVideo.related)
+                          .limit(limit))
@@ -0,0 +1,170 @@
+from datetime import datetime
+from types import SimpleNamespace
+import anyio
+import asyncpg
+from starlette.concurrency import run_in_threadpool
+from . import models, schemas, crud, errors, assembler, pagination, video, database, dataloader
+from .singleflight import AsyncSingleFlight
+from .config import settings
+
+pool: asyncpg.Pool | None = None
+user_flight = AsyncSingleFlight('async_crud.get_user_by_id')
+video_show_flight = AsyncSingleFlight('async_crud.build_video_show')
+
+
+async def open_pool():
+    global pool
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.thread_pool_size
+    if settings.database_async_enabled:
+        pool = await asyncpg.create_pool(database=settings.database_name, user=settings.database_user,
+                                         password=settings.database_password, host=settings.database_host,
+                                         port=int(settings.database_port),
+                                         min_size=settings.database_async_min_size,
+                                         max_size=settings.database_async_max_size)
+
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+def with_connection(func, *args):
+    db = models.Video._meta.database
+    database.reset_state()
+    db._state.reset()
+    with db.connection_context():
+        return func(*args)
+
+
+async def run_sync(func, *args):
+    return await run_in_threadpool(with_connection, func, *args)
+
+
+class Loaders:
+    """Batching loaders shared by all calls of one HTTP request."""
+
+    def __init__(self):
+        self.users = dataloader.DataLoader(get_users_by_ids)
+        self.videos = dataloader.DataLoader(get_videos_by_ids)
+
+
+def get_loaders() -> Loaders:
+    loaders = dataloader.registry.get()
+    # Outside of an HTTP request every caller gets its own loaders, which still work but batch nothing.
+    return loaders if loaders is not None else Loaders()
+
+
+async def get_users_by_ids(user_ids: list[int]) -> dict[int, models.User]:
+    if pool is None:
+        return await run_sync(crud.get_users_by_ids, user_ids)
+    rows = await pool.fetch('SELECT * FROM "user" WHERE id = ANY($1::integer[])', user_ids)
+    return {row['id']: models.User(**row) for row in rows}
+
+
+async def get_videos_by_ids(video_ids: list[int]) -> dict[int, models.Video]:
+    if pool is None:
+        return await run_sync(crud.get_videos_by_ids, video_ids)
+    rows = await pool.fetch('SELECT * FROM video WHERE id = ANY($1::integer[]) AND is_published', video_ids)
+    return {row['id']: models.Video(**row) for row in rows}
+
+
+async def get_user_by_id(user_id: int):
+    user_db = crud.user_cache.get(user_id)
+    if user_db is not None:
+        return user_db
+    user_db = await user_flight.do(user_id, fetch_user, user_id)
+    if user_db is not None:
+        crud.user_cache.set(user_id, user_db)
+    return user_db
+
+
+async def fetch_user(user_id: int):
+    return await get_loaders().users.load(user_id)
+
+
+async def get_videos_page(cursor: str | None, limit: int | None) -> schemas.VideoInfPage:
+    if pool is None:
+        return await run_sync(assembler.get_videos_page, cursor, limit)
+    limit = pagination.clamp_limit(limit)
+    after_time, after_id = pagination.decode_cursor(cursor, (datetime, int)) if cursor else (None, None)
+    rows = await pool.fetch('''
+        SELECT v.id, v.video_name, v.description, v.creation_time, v.number_of_views,
+               u.id AS author_id, u.username AS author_name
+        FROM video v JOIN "user" u ON u.id = v.author_id
+        WHERE v.is_published AND ($1::timestamp IS NULL OR (v.creation_time, v.id) < ($1::timestamp, $2::integer))
+        ORDER BY v.creation_time DESC, v.id DESC
+        LIMIT $3''', after_time, after_id, limit + 1)
+    rows = [SimpleNamespace(**row) for row in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pagination.encode_cursor(rows[-1].creation_time, rows[-1].id)
+    # Presigning and its single-flight wait block, so they stay off the event loop.
+    items = await run_in_threadpool(assembler.assemble_video_infs, rows)
+    return schemas.VideoInfPage(items=items, next_cursor=next_cursor)
+
+
+async def get_video_show(video_id: int, user_id: int) -> schemas.VideoShow:
+    if pool is None:
+        return await run_sync(assembler.get_video_show, video_id, user_id)
+    video_show = crud.video_show_cache.get(video_id)
+    if video_show is None:
+        video_show = await video_show_flight.do(video_id, build_video_show, video_id)
+    reaction = await pool.fetchrow('SELECT is_like, is_dislike FROM reaction WHERE video_id = $1 AND user_id = $2',
+                                   video_id, user_id)
+    user_reaction = 'neutral'
+    if reaction is not None:
+        user_reaction = 'like' if reaction['is_like'] else 'dislike' if reaction['is_dislike'] else 'neutral'
+    return video_show.copy(update={'user_reaction': user_reaction})
+
+
+async def build_video_show(video_id: int) -> schemas.VideoShow:
+    generation = crud.video_show_cache.generation(video_id)
+    video_db = await get_loaders().videos.load(video_id)
+    if video_db is None:
+        raise errors.VideoNotExist
+    comments_page = await get_comments_page(video_id, cursor=None, limit=None)
+    video_url = await run_in_threadpool(video.VideoManager.get_video_url_by_id, video_id)
+    reactions = schemas.VideoReactionsInf(number_of_likes=video_db.number_of_likes,
+                                          number_of_dislikes=video_db.number_of_dislikes)
+    video_show = schemas.VideoShow(video_url=video_url, reactionsInf=reactions,
+                                   video_name=video_db.video_name, description=video_db.description,
+                                   user_reaction='neutral', comments=comments_page.items,
+                                   comments_next_cursor=comments_page.next_cursor,
+                                   number_of_comments=video_db.number_of_comments,
+                                   number_of_views=video_db.number_of_views, published_at=video_db.creation_time,
+                                   author_id=video_db.author_id_id)
+    crud.video_show_cache.set(video_id, video_show, generation=generation)
+    return video_show
+
+
+async def get_comments_page(video_id: int, cursor: str | None, limit: int | None) -> schemas.CommentShowPage:
+    if pool is None:
+        return await run_sync(crud.get_comments_page, video_id, cursor, limit)
+    limit = pagination.clamp_limit(limit)
+    after_time, after_id = pagination.decode_cursor(cursor, (datetime, int)) if cursor else (None, None)
+    rows = await pool.fetch('''
+        SELECT c.id, u.username AS author_name, c.text, c.published_at
+        FROM comment c JOIN "user" u ON u.id = c.author_id
+        WHERE c.video_id = $1 AND ($2::timestamp IS NULL OR (c.published_at, c.id) > ($2::timestamp, $3::integer))
+        ORDER BY c.published_at, c.id
+        LIMIT $4''', video_id, after_time, after_id, limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pagination.encode_cursor(rows[-1]['published_at'], rows[-1]['id'])
+    return schemas.CommentShowPage(items=[schemas.CommentShow(author_name=row['author_name'], text=row['text'],
+                                                              published_at=row['published_at'])
+                                          for row in rows],
+                                   next_cursor=next_cursor)
+
+
+async def is_user_subscribed_to_author(user_id: int, author_id: int) -> bool:
+    if pool is None:
+        return await run_sync(crud.is_user_subscribed_to_author, user_id, author_id)
+    if user_id == author_id:
+        return False
+    return await pool.fetchval('SELECT EXISTS (SELECT 1 FROM subscriber WHERE subscriber_id = $1 AND author_id = $2)',
+                               user_id, author_id)
@@ -1,21 +1,28 @@
-import os
+import hashlib
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
+from jose import ExpiredSignatureError, JWTError, jwt
 from . import errors, schemas
+from .cache import TTLCache
+from .config import settings
 
-
+try:
+    import jwt as pyjwt
+except ImportError:
+    pyjwt = None
 
 
 class TokenManager:
-    __SECRET_KEY = os.getenv('SECRET_KEY')
+    __SECRET_KEY = settings.secret_key
     __ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES = 15
     REFRESH_TOKEN_EXPIRE_DAYS = 60
 
+    verified_tokens = TTLCache(maxsize=settings.token_cache_size)
+
     @staticmethod
     def create_token(user_id: int, expire: timedelta):
         to_encode = {"user_id": user_id, "exp": datetime.utcnow() + expire}
-        encoded_jwt = jwt.encode(to_encode, os.getenv('SECRET_KEY'), algorithm=TokenManager.__ALGORITHM)
+        encoded_jwt = jwt.encode(to_encode, TokenManager.__SECRET_KEY, algorithm=TokenManager.__ALGORITHM)
         return encoded_jwt
 
     @staticmethod
@@ -26,14 +33,33 @@ class TokenManager:
 
     @staticmethod
     def try_get_user_id_from_token(token: str) -> int:
-        try:
-            payload = jwt.decode(token, os.getenv('SECRET_KEY'), algorithms=[TokenManager.__ALGORITHM])
-            if datetime.fromtimestamp(int(payload.get("exp"))) < datetime.now():
+        digest = hashlib.sha256(token.encode()).digest()
+        user_id = TokenManager.verified_tokens.get(digest)
+        if user_id is not None:
+            return user_id
+        payload = TokenManager.__decode(token)
+        user_id = payload.get("user_id")
+        if user_id is None:
+            raise errors.TokenSubError
+        TokenManager.verified_tokens.set(digest, int(user_id), expires_at=int(payload["exp"]))
+        return int(user_id)
+
+    @staticmethod
+    def __decode(token: str) -> dict:
+        if settings.jwt_backend == 'pyjwt' and pyjwt is not None:
+            try:
+                return pyjwt.decode(token, TokenManager.__SECRET_KEY, algorithms=[TokenManager.__ALGORITHM],
+                                    options={'require': ['exp']})
+            except pyjwt.ExpiredSignatureError:
                 raise errors.TokenExpireError
-            user_id: str = payload.get("user_id")
-            if user_id is None:
-                raise errors.TokenSubError
+            except pyjwt.InvalidTokenError:
+                raise errors.TokenError
+        try:
+            payload = jwt.decode(token, TokenManager.__SECRET_KEY, algorithms=[TokenManager.__ALGORITHM])
+        except ExpiredSignatureError:
+            raise errors.TokenExpireError
         except JWTError:
             raise errors.TokenError
-        return int(user_id)
-
+        if payload.get("exp") is None:
+            raise errors.TokenError
+        return payload
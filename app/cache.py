@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire at a wall-clock timestamp.
+
+    `pop` also advances the generation of its key. A caller that reads `generation(key)` before loading a value
+    and passes it to `set` stores nothing when the key was invalidated in between, so a load that raced with
+    an invalidation cannot put the old value back.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        # Generations of recently invalidated keys, oldest first; every other key is at the newest evicted one.
+        self.__generations = OrderedDict()
+        self.__evicted_generation = 0
+        self.__last_generation = 0
+        self.__lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.__entries[key]
+            self.misses += 1
+            return default
+
+    def generation(self, key) -> int:
+        with self.__lock:
+            return self.__generations.get(key, self.__evicted_generation)
+
+    def set(self, key, value, expires_at: float | None = None, generation: int | None = None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        with self.__lock:
+            if generation is not None and self.__generations.get(key, self.__evicted_generation) != generation:
+                return
+            self.__entries[key] = (value, expires_at)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            self.__last_generation += 1
+            self.__generations[key] = self.__last_generation
+            self.__generations.move_to_end(key)
+            while len(self.__generations) > self.maxsize:
+                _, self.__evicted_generation = self.__generations.popitem(last=False)
+        return entry[0] if entry is not None else None
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__last_generation += 1
+            self.__generations.clear()
+            self.__evicted_generation = self.__last_generation
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.__entries),
+                'hit_ratio': self.hits / requests if requests else 0.0}
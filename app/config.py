@@ -8,12 +8,61 @@ class Settings(BaseSettings):
     database_password: str
     database_host: str
     database_port: str
+    database_pool_enabled: bool = True
+    database_max_connections: int = 20
+    database_stale_timeout: int = 300
+    database_pool_timeout: int = 10
+    database_pool_health_check: bool = True
+    database_pool_health_check_idle_seconds: float = 30
+    database_async_enabled: bool = True
+    database_async_min_size: int = 1
+    database_async_max_size: int = 10
+    thread_pool_size: int = 40
+    view_buffer_enabled: bool = True
+    view_buffer_size: int = 100000
+    view_flush_interval_ms: int = 500
+    view_flush_batch_size: int = 1000
+    view_buffer_put_timeout: float = 0.05
     secret_key: str
     aws_access_key_id: str
     aws_secret_access_key: str
     SECRET_KEY: str
     AWS_ACCESS_KEY_ID: str
     AWS_SECRET_ACCESS_KEY: str
+    s3_endpoint_url: str = 'https://storage.yandexcloud.net'
+    s3_max_pool_connections: int = 50
+    s3_multipart_chunksize: int = 16 * 1024 * 1024
+    s3_multipart_concurrency: int = 8
+    upload_part_size: int = 16 * 1024 * 1024
+    upload_part_max_size: int = 64 * 1024 * 1024
+    presigned_url_expire_seconds: int = 3600
+    presigned_url_reissue_seconds: int = 1800
+    presigned_url_cache_size: int = 100000
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: float = 5
+    video_show_cache_size: int = 10000
+    video_show_cache_ttl_seconds: float = 60
+    suggest_refresh_interval_seconds: float = 600
+    trending_half_life_hours: float = 24
+    trending_window_half_lives: int = 5
+    trending_top_k: int = 100
+    trending_refresh_interval_seconds: float = 300
+    trending_view_weight: float = 1
+    trending_reaction_weight: float = 5
+    trending_comment_weight: float = 3
+    feed_fanout_max_subscribers: int = 1000
+    feed_backfill_size: int = 50
+    related_videos_top_k: int = 20
+    related_videos_chunk_size: int = 1024
+    related_videos_fetch_size: int = 10000
+    related_videos_watermark_lag_seconds: float = 60
+    dataloader_batch_window_ms: float = 1
+    dataloader_max_batch_size: int = 500
+    metrics_refresh_interval_seconds: float = 15
+    token_cache_size: int = 100000
+    jwt_backend: str = 'jose'
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
 
     class Config:
         env_file = f"{pathlib.Path(__file__).resolve().parent}/.env"
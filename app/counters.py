@@ -0,0 +1,37 @@
+from peewee import fn
+from . import models
+
+
+def count_rows(model, foreign_key, owner_field, condition=None):
+    query = model.select(fn.COUNT(foreign_key)).where(foreign_key == owner_field)
+    if condition is not None:
+        query = query.where(condition)
+    return query
+
+
+def reconcile_counters():
+    """Rebuild the denormalized counters on Video and User from the source tables."""
+    with models.Video._meta.database.atomic():
+        models.Video.update({
+            models.Video.number_of_views: count_rows(models.Viewer, models.Viewer.video, models.Video.id),
+            models.Video.number_of_likes: count_rows(models.Reaction, models.Reaction.video, models.Video.id,
+                                                     models.Reaction.is_like == True),
+            models.Video.number_of_dislikes: count_rows(models.Reaction, models.Reaction.video, models.Video.id,
+                                                        models.Reaction.is_dislike == True),
+            models.Video.number_of_comments: count_rows(models.Comment, models.Comment.video_id, models.Video.id),
+        }).execute()
+        models.User.update({
+            models.User.number_of_subscribers: count_rows(models.Subscriber, models.Subscriber.author,
+                                                          models.User.id),
+            models.User.number_of_videos: count_rows(models.Video, models.Video.author_id, models.User.id,
+                                                     models.Video.is_published == True),
+        }).execute()
+
+
+if __name__ == '__main__':
+    db = models.Video._meta.database
+    db.connect()
+    try:
+        reconcile_counters()
+    finally:
+        db.close()
@@ -1,9 +1,17 @@
-from . import models, schemas, errors
-from passlib.context import CryptContext
+from . import models, schemas, errors, pagination, passwords, singleflight, suggest, trending, feed
+from .cache import TTLCache
+from .config import settings
+from peewee import EXCLUDED, SQL, Case, SqliteDatabase
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from enum import Enum
 import datetime
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+user_cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl_seconds)
+video_show_cache = TTLCache(maxsize=settings.video_show_cache_size, ttl=settings.video_show_cache_ttl_seconds)
+# Callbacks waiting for the outermost atomic() block of the current context to commit.
+pending_after_commit: ContextVar = ContextVar('pending_after_commit', default=None)
 
 
 class Reaction(str, Enum):
@@ -12,56 +20,192 @@ class Reaction(str, Enum):
     NEUTRAL = 'neutral'
 
 
+@contextmanager
+def atomic():
+    if pending_after_commit.get() is not None:
+        with models.Video._meta.database.atomic():
+            yield
+        return
+    callbacks = []
+    token = pending_after_commit.set(callbacks)
+    try:
+        with models.Video._meta.database.atomic():
+            yield
+    finally:
+        pending_after_commit.reset(token)
+    for callback, args in callbacks:
+        callback(*args)
+
+
+def after_commit(callback, *args):
+    """Run `callback` once the outermost atomic() block commits, or right away outside of one.
+
+    In-process indexes are updated this way, so a rolled back transaction leaves nothing behind in them.
+    """
+    callbacks = pending_after_commit.get()
+    if callbacks is None:
+        callback(*args)
+    else:
+        callbacks.append((callback, args))
+
+
+def coalesced(func):
+    return singleflight.coalesced(func, bypass=lambda: models.Video._meta.database.in_transaction())
+
+
+def increment_video_counters(video_id: int, **deltas: int):
+    deltas = {getattr(models.Video, name): getattr(models.Video, name) + delta
+              for name, delta in deltas.items() if delta}
+    if deltas:
+        models.Video.update(deltas).where(models.Video.id == video_id).execute()
+
+
+def increment_user_counters(user_id: int, **deltas: int):
+    deltas = {getattr(models.User, name): getattr(models.User, name) + delta
+              for name, delta in deltas.items() if delta}
+    if deltas:
+        models.User.update(deltas).where(models.User.id == user_id).execute()
+
+
+@coalesced
 def get_user_by_id(user_id: int):
     return models.User.filter(models.User.id == user_id).first()
 
 
+def get_users_by_ids(user_ids: list[int]) -> dict[int, models.User]:
+    return {user_db.id: user_db for user_db in models.User.select().where(models.User.id.in_(user_ids))}
+
+
 def get_user_by_email(email: str):
     return models.User.filter(models.User.email == email).first()
 
 
 def get_user_by_email_and_password(email: str, password: str):
     db_user = get_user_by_email(email)
-    if db_user is not None and pwd_context.verify(password, db_user.hashed_password):
-        return db_user
+    if db_user is None:
+        return None
+    is_valid, new_hash = passwords.verify_and_update(password, db_user.hashed_password)
+    if not is_valid:
+        return None
+    if new_hash is not None:
+        update_user_hashed_password(db_user.id, new_hash)
+        db_user.hashed_password = new_hash
+    return db_user
+
+
+def update_user_hashed_password(user_id: int, hashed_password: str):
+    models.User.update({models.User.hashed_password: hashed_password}).where(models.User.id == user_id).execute()
 
 
-def create_user(user: schemas.UserCreate):
+def create_user(user: schemas.UserCreate, hashed_password: str | None = None):
     if user.username == '' or user.email == '' or user.password == '':
         raise errors.AuthError
-    hashed_password = pwd_context.hash(user.password)
+    if hashed_password is None:
+        hashed_password = passwords.hash_password(user.password)
     db_user = models.User(email=user.email, username=user.username, hashed_password=hashed_password)
     try:
         db_user.save()
     except:
         raise errors.RegisterError
     else:
+        after_commit(suggest.suggest_index.add, suggest.CHANNEL, db_user.id, db_user.username)
         return db_user
 
 
 def delete_user_by_id(user_id: int):
     q = models.User.delete().where(models.User.id == user_id)
     q.execute()
+    user_cache.pop(user_id)
+    suggest.suggest_index.remove(suggest.CHANNEL, user_id)
 
 
 def delete_user_by_email(email: str):
+    user_ids = [user_db.id for user_db in models.User.select(models.User.id).where(models.User.email == email)]
     q = models.User.delete().where(models.User.email == email)
     q.execute()
+    for user_id in user_ids:
+        user_cache.pop(user_id)
+        suggest.suggest_index.remove(suggest.CHANNEL, user_id)
 
 
 def update_user_refresh_token(user_id: int, refresh_token: str):
     q = (models.User.update({models.User.refresh_token: refresh_token}).where(models.User.id == user_id))
     q.execute()
+    user_cache.pop(user_id)
+
+
+def create_video(video_base: schemas.VideoCreate, user_id: int, is_published: bool = True):
+    db_video = models.Video(video_name=video_base.video_name, author_id=user_id, description=video_base.description,
+                            is_published=is_published)
+    with atomic():
+        db_video.save()
+        if is_published:
+            increment_user_counters(user_id, number_of_videos=1)
+            feed.fan_out(db_video.id, user_id, db_video.creation_time)
+            after_commit(suggest.suggest_index.add, suggest.VIDEO, db_video.id, db_video.video_name)
+    return db_video
 
 
-def create_video(video_base: schemas.VideoCreate, user_id: int):
-    db_video = models.Video(video_name=video_base.video_name, author_id=user_id, description=video_base.description)
-    db_video.save()
-    return db_video
+def publish_video(video_id: int):
+    with atomic():
+        q = models.Video.update({models.Video.is_published: True}).where(
+            (models.Video.id == video_id) & (models.Video.is_published == False))
+        video_db = models.Video.get_by_id(video_id) if q.execute() else None
+        if video_db is not None:
+            increment_user_counters(video_db.author_id_id, number_of_videos=1)
+            feed.fan_out(video_id, video_db.author_id_id, video_db.creation_time)
+            after_commit(suggest.suggest_index.add, suggest.VIDEO, video_id, video_db.video_name,
+                         video_db.number_of_views)
+    video_show_cache.pop(video_id)
+
+
+def create_upload_session(user_id: int, video_id: int, s3_upload_id: str):
+    return models.UploadSession.create(user=user_id, video=video_id, s3_upload_id=s3_upload_id)
+
+
+def get_upload_session(session_id: str, user_id: int):
+    try:
+        return models.UploadSession.get((models.UploadSession.id == session_id) &
+                                        (models.UploadSession.user == user_id))
+    except (models.UploadSession.DoesNotExist, ValueError):
+        raise errors.UploadSessionNotFound
+
+
+def save_uploaded_part(session_id: str, part_number: int, etag: str, size: int):
+    q = (models.UploadedPart
+         .insert(session=session_id, part_number=part_number, etag=etag, size=size)
+         .on_conflict(conflict_target=[models.UploadedPart.session, models.UploadedPart.part_number],
+                      update={models.UploadedPart.etag: etag, models.UploadedPart.size: size}))
+    q.execute()
+
+
+def get_uploaded_parts(session_id: str) -> list:
+    return list(models.UploadedPart.select()
+                .where(models.UploadedPart.session == session_id)
+                .order_by(models.UploadedPart.part_number))
+
+
+def mark_upload_session_preview(session_id: str):
+    q = models.UploadSession.update({models.UploadSession.has_preview: True}).where(
+        models.UploadSession.id == session_id)
+    q.execute()
 
 
+def delete_upload_session(session_id: str):
+    with atomic():
+        models.UploadedPart.delete().where(models.UploadedPart.session == session_id).execute()
+        models.UploadSession.delete().where(models.UploadSession.id == session_id).execute()
+
+
+# Unpublished videos are uploads still in flight, so lookups by id treat them as missing.
+@coalesced
 def get_video_by_id(video_id: int):
-    return models.Video.filter(models.Video.id == video_id).first()
+    return models.Video.filter((models.Video.id == video_id) & models.Video.is_published).first()
+
+
+def get_videos_by_ids(video_ids: list[int]) -> dict[int, models.Video]:
+    return {video_db.id: video_db for video_db in
+            models.Video.select().where(models.Video.id.in_(video_ids) & models.Video.is_published)}
 
 
 def get_all_videos():
@@ -74,37 +218,36 @@ def rate_video(user_id: int, video_id: int, user_reaction: Reaction):
     if get_user_by_id(user_id) is None:
         raise errors.AccountNotFound
 
-    try:
-        db_reaction = models.Reaction.get(
-            (models.Reaction.user == user_id) &
-            (models.Reaction.video == video_id))
-    except models.Reaction.DoesNotExist:
-        db_reaction = models.Reaction.create(
-            user_id=user_id, video_id=video_id, is_like=user_reaction == Reaction.LIKE,
-            is_dislike=user_reaction == Reaction.DISLIKE
-        )
-    else:
-        if user_reaction == Reaction.NEUTRAL:
-            db_reaction.is_like = False
-            db_reaction.is_dislike = False
-        elif user_reaction == Reaction.LIKE:
-            db_reaction.is_like = True
-            db_reaction.is_dislike = False
-        else:
-            db_reaction.is_like = False
-            db_reaction.is_dislike = True
+    with atomic():
+        # The row is created neutral if missing and then read locked, so concurrent reactions of the same user
+        # apply their deltas one after another. SQLite has no row locks, but the insert already holds its
+        # write lock for the rest of the transaction.
+        models.Reaction.insert(user=user_id, video=video_id).on_conflict_ignore().execute()
+        query = models.Reaction.select().where((models.Reaction.user == user_id) & (models.Reaction.video == video_id))
+        if models.Reaction._meta.database.for_update:
+            query = query.for_update()
+        db_reaction = query.get()
+        was_like, was_dislike = db_reaction.is_like, db_reaction.is_dislike
+        db_reaction.is_like = user_reaction == Reaction.LIKE
+        db_reaction.is_dislike = user_reaction == Reaction.DISLIKE
+        db_reaction.reacted_at = datetime.datetime.now()
         db_reaction.save()
+        increment_video_counters(video_id, number_of_likes=db_reaction.is_like - was_like,
+                                 number_of_dislikes=db_reaction.is_dislike - was_dislike)
+    video_show_cache.pop(video_id)
+    trending.ranker.record(video_id, settings.trending_reaction_weight * (
+            (db_reaction.is_like - was_like) - (db_reaction.is_dislike - was_dislike)))
     return db_reaction
 
 
+@coalesced
 def get_video_number_of_likes_and_dislikes(video_id: int) -> schemas.VideoReactionsInf:
-    number_of_likes = models.Reaction.select().where(
-        (models.Reaction.video == video_id) & (models.Reaction.is_like == Reaction.LIKE)).count()
-    number_of_dislike = models.Reaction.select().where(
-        (models.Reaction.video == video_id) & (models.Reaction.is_dislike == Reaction.DISLIKE)).count()
-
-    return schemas.VideoReactionsInf(number_of_likes=number_of_likes,
-                                     number_of_dislikes=number_of_dislike)
+    video_db = (models.Video.select(models.Video.number_of_likes, models.Video.number_of_dislikes)
+                .where(models.Video.id == video_id).first())
+    if video_db is None:
+        return schemas.VideoReactionsInf(number_of_likes=0, number_of_dislikes=0)
+    return schemas.VideoReactionsInf(number_of_likes=video_db.number_of_likes,
+                                     number_of_dislikes=video_db.number_of_dislikes)
 
 
 def get_user_reaction_to_video(user_id: int, video_id: int) -> str:
@@ -120,26 +263,51 @@ def get_user_reaction_to_video(user_id: int, video_id: int) -> str:
 
 
 def create_comment(comment_inf: schemas.CommentCreate):
+    if get_video_by_id(comment_inf.video_id) is None:
+        raise errors.VideoNotExist
     comment_db = models.Comment(video_id=comment_inf.video_id, author_id=comment_inf.author_id, text=comment_inf.text)
-    comment_db.save()
+    with atomic():
+        comment_db.save()
+        increment_video_counters(comment_inf.video_id, number_of_comments=1)
+    video_show_cache.pop(comment_inf.video_id)
+    trending.ranker.record(comment_inf.video_id, settings.trending_comment_weight)
     return comment_db
 
 
+def select_comment_rows(video_id: int):
+    return (models.Comment
+            .select(models.Comment.id, models.Comment.text, models.Comment.published_at,
+                    models.User.username.alias('author_name'))
+            .join(models.User, on=(models.Comment.author_id == models.User.id))
+            .where(models.Comment.video_id == video_id)
+            .namedtuples())
+
+
 def get_comments_show_inf_from_video(video_id: int) -> list[schemas.CommentShow]:
-    comments = models.Video.get_by_id(video_id).comments
-    result = []
-    for comment in comments:
-        author_name = models.User.get(models.User.id == comment.author_id).username
-        result.append(
-            schemas.CommentShow(author_name=author_name, text=comment.text, published_at=comment.published_at))
-    return result
+    query = select_comment_rows(video_id).order_by(models.Comment.published_at, models.Comment.id)
+    return [schemas.CommentShow(author_name=row.author_name, text=row.text, published_at=row.published_at)
+            for row in query]
+
+
+@coalesced
+def get_comments_page(video_id: int, cursor: str | None, limit: int | None) -> schemas.CommentShowPage:
+    rows, next_cursor = pagination.paginate(select_comment_rows(video_id),
+                                            [models.Comment.published_at, models.Comment.id], (datetime.datetime, int),
+                                            cursor, limit, descending=False)
+    return schemas.CommentShowPage(items=[schemas.CommentShow(author_name=row.author_name, text=row.text,
+                                                              published_at=row.published_at)
+                                          for row in rows],
+                                   next_cursor=next_cursor)
 
 
 def subscribe(subscriber_id: int, author_id: int):
     if subscriber_id == author_id:
         raise errors.SubscribeToYourself
     try:
-        models.Subscriber.create(subscriber=subscriber_id, author=author_id)
+        with atomic():
+            models.Subscriber.create(subscriber=subscriber_id, author=author_id)
+            increment_user_counters(author_id, number_of_subscribers=1)
+            feed.backfill(subscriber_id, author_id)
     except:
         raise errors.SubscribedError
 
@@ -148,9 +316,11 @@ def unsubscribe(subscriber_id: int, author_id: int):
     if subscriber_id == author_id:
         raise errors.SubscribeToYourself
     try:
-        q = models.Subscriber.delete().where(
-            (models.Subscriber.subscriber == subscriber_id) & (models.Subscriber.author == author_id))
-        q.execute()
+        with atomic():
+            q = models.Subscriber.delete().where(
+                (models.Subscriber.subscriber == subscriber_id) & (models.Subscriber.author == author_id))
+            increment_user_counters(author_id, number_of_subscribers=-q.execute())
+            feed.remove_author(subscriber_id, author_id)
     except:
         raise errors.AlreadySubscribed
 
@@ -167,29 +337,86 @@ def is_user_subscribed_to_author(user_id: int, author_id: int) ->bool:
 
 
 def watch_video(user_id: int, video_id: int):
-    try:
-        models.Viewer.create(viewer=user_id, video=video_id)
-    except:
-        viewer_db = models.Viewer.get((models.Viewer.viewer == user_id) & (models.Viewer.video == video_id))
-        viewer_db.viewing_time = datetime.datetime.now
-
-
+    record_views([(user_id, video_id, datetime.datetime.now())])
+
+
+def record_views(events: list[tuple[int, int, datetime.datetime]]):
+    latest = {}
+    for user_id, video_id, viewing_time in events:
+        latest[(user_id, video_id)] = max(viewing_time, latest.get((user_id, video_id), viewing_time))
+    if not latest:
+        return
+    with atomic():
+        video_ids = {video_id for _, video_id in latest}
+        existing_videos = {video_db.id for video_db in
+                           models.Video.select(models.Video.id).where(models.Video.id.in_(video_ids) &
+                                                                      models.Video.is_published)}
+        latest = {pair: viewing_time for pair, viewing_time in latest.items() if pair[1] in existing_videos}
+        if not latest:
+            return
+        new_views = upsert_views([(user_id, video_id, viewing_time)
+                                  for (user_id, video_id), viewing_time in latest.items()])
+        if new_views:
+            models.Video.update(
+                number_of_views=models.Video.number_of_views + Case(models.Video.id, list(new_views.items()), 0)
+            ).where(models.Video.id.in_(list(new_views))).execute()
+    for video_id, views in new_views.items():
+        video_show_cache.pop(video_id)
+        suggest.suggest_index.add_weight(suggest.VIDEO, video_id, views)
+    for (_, video_id), viewing_time in latest.items():
+        trending.ranker.record(video_id, settings.trending_view_weight, viewing_time.timestamp())
+
+
+def upsert_views(rows: list[tuple[int, int, datetime.datetime]]) -> Counter:
+    """Insert or refresh Viewer rows and count, per video, the viewers that had not seen it before.
+
+    The count comes from the write itself rather than from a read before it, so two flushes of the same
+    new viewer in concurrent transactions count it once.
+    """
+    fields = [models.Viewer.viewer, models.Viewer.video, models.Viewer.viewing_time]
+    upsert = models.Viewer.insert_many(rows, fields=fields).on_conflict(
+        conflict_target=[models.Viewer.viewer, models.Viewer.video],
+        update={models.Viewer.viewing_time: EXCLUDED.viewing_time},
+    )
+    if not isinstance(models.Viewer._meta.database, SqliteDatabase):
+        # xmax is 0 only in rows the statement inserted, not in the ones it updated.
+        written = upsert.returning(models.Viewer.video, SQL('(xmax = 0)')).tuples().execute()
+        return Counter(video_id for video_id, is_new in written if is_new)
+    rows_by_video = defaultdict(list)
+    for row in rows:
+        rows_by_video[row[1]].append(row)
+    new_views = Counter()
+    for video_id, video_rows in rows_by_video.items():
+        inserted = models.Viewer.insert_many(video_rows, fields=fields).on_conflict_ignore().as_rowcount().execute()
+        if inserted:
+            new_views[video_id] = inserted
+    upsert.execute()
+    return new_views
+
+
+@coalesced
 def get_number_of_views(video_id: int) -> int:
-    video_db = models.Video.get_by_id(video_id)
-    number_of_views = video_db.views.count()
-    if number_of_views is None:
+    video_db = models.Video.select(models.Video.number_of_views).where(models.Video.id == video_id).first()
+    if video_db is None:
         return 0
-    return number_of_views
+    return video_db.number_of_views
+
+def discard_video(video_id: int):
+    """Delete a video that was never published, such as one whose upload failed; errors are not masked."""
+    with atomic():
+        models.Video.get_by_id(video_id).delete_instance(recursive=True)
+    video_show_cache.pop(video_id)
 
-def get_viewed_videos(viewer_id:int):
-    videos = []
-    for viewing_inf in models.Viewer.select().where(models.Viewer.viewer == viewer_id).order_by(models.Viewer.viewing_time):
-        videos.append(models.Video.get_by_id(viewing_inf.video.id))
-    return videos
 
 def delete_video(video_id:int):
     try:
-        video_db = models.Video.get_by_id(video_id)
-        video_db.delete_instance(recursive=True)
+        with atomic():
+            video_db = models.Video.get_by_id(video_id)
+            video_db.delete_instance(recursive=True)
+            if video_db.is_published:
+                increment_user_counters(video_db.author_id_id, number_of_videos=-1)
     except:
-        raise errors.VideoNotExist
\ No newline at end of file
+        raise errors.VideoNotExist
+    video_show_cache.pop(video_id)
+    suggest.suggest_index.remove(suggest.VIDEO, video_id)
+    trending.ranker.remove(video_id)
@@ -1,5 +1,10 @@
+import threading
+import time
+from contextlib import contextmanager
 from contextvars import ContextVar
 import peewee
+import psycopg2
+from playhouse import pool
 from .config import settings
 
 DATABASE_NAME = settings.database_name
@@ -8,10 +13,85 @@ DATABASE_PASSWORD = settings.database_password
 DATABASE_HOST = settings.database_host
 DATABASE_PORT = settings.database_port
 
-db_state_default = {"closed": None, "conn": None, "ctx": None, "transactions": None}
+db_state_default = {"closed": None, "conn": None, "ctx": None, "transactions": None, "query_stats": None}
 db_state = ContextVar("db_state", default=db_state_default.copy())
 
 
+class QueryStats:
+    """Number of queries, total SQL time and the slowest statement of one JSON-RPC call."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+        self.__lock = threading.Lock()
+
+    def record(self, sql: str, seconds: float):
+        with self.__lock:
+            self.count += 1
+            self.seconds += seconds
+            if self.slowest_sql is None or seconds > self.slowest_seconds:
+                self.slowest_seconds, self.slowest_sql = seconds, sql
+
+    def __str__(self):
+        if not self.count:
+            return '0 queries'
+        return (f'{self.count} queries in {self.seconds * 1000:.1f} ms, '
+                f'slowest {self.slowest_seconds * 1000:.1f} ms: {self.slowest_sql}')
+
+
+def reset_state():
+    """Give the current context a fresh connection state, keeping the query stats of the call it belongs to."""
+    state = db_state_default.copy()
+    state["query_stats"] = db_state.get().get("query_stats")
+    db_state.set(state)
+
+
+def start_query_stats() -> QueryStats:
+    """Start counting the queries of the current context and everything it runs in worker threads."""
+    stats = QueryStats()
+    # The new state starts without a connection, as if peewee had just reset it.
+    state = dict(db_state_default, closed=True, ctx=[], transactions=[], query_stats=stats)
+    db_state.set(state)
+    return stats
+
+
+def instrument(database: peewee.Database):
+    """Record every statement executed through `database` in the QueryStats of the current context."""
+    if getattr(database, "instrumented", False):
+        return
+    execute_sql = database.execute_sql
+
+    def timed_execute_sql(sql, params=None, *args, **kwargs):
+        stats = db_state.get().get("query_stats")
+        if stats is None:
+            return execute_sql(sql, params, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return execute_sql(sql, params, *args, **kwargs)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+
+    database.execute_sql = timed_execute_sql
+    database.instrumented = True
+
+
+@contextmanager
+def query_budget(limit: int):
+    """Fail with AssertionError when the block runs more than `limit` queries on an instrumented database."""
+    stats = QueryStats()
+    state = db_state.get().copy()
+    state["query_stats"] = stats
+    token = db_state.set(state)
+    try:
+        yield stats
+    finally:
+        db_state.reset(token)
+    if stats.count > limit:
+        raise AssertionError(f'query budget of {limit} exceeded: {stats}')
+
+
 class PeeweeConnectionState(peewee._ConnectionState):
     def __init__(self, **kwargs):
         super().__setattr__("_state", db_state)
@@ -24,6 +104,59 @@ class PeeweeConnectionState(peewee._ConnectionState):
         return self._state.get()[name]
 
 
-db = peewee.PostgresqlDatabase(DATABASE_NAME, user=DATABASE_USER, password=DATABASE_PASSWORD, host=DATABASE_HOST,
-                               port=DATABASE_PORT)
+class PooledPostgresqlDatabase(pool.PooledPostgresqlDatabase):
+    """Pings a connection on checkout only when it sat in the pool longer than the health check threshold.
+
+    A connection returned moments ago is almost always still alive, so requests do not pay a round trip for it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.returned_at = {}
+
+    def _close(self, conn, close_conn=False):
+        key = self.conn_key(conn)
+        returned = not close_conn and key in self._in_use
+        super()._close(conn, close_conn)
+        if returned and not conn.closed:
+            self.returned_at[key] = time.monotonic()
+        else:
+            self.returned_at.pop(key, None)
+
+    def _is_closed(self, conn):
+        key = self.conn_key(conn)
+        if super()._is_closed(conn):
+            self.returned_at.pop(key, None)
+            return True
+        if not settings.database_pool_health_check:
+            return False
+        returned_at = self.returned_at.get(key)
+        idle_seconds = time.monotonic() - returned_at if returned_at is not None else None
+        if idle_seconds is not None and idle_seconds < settings.database_pool_health_check_idle_seconds:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+        except psycopg2.Error:
+            self.returned_at.pop(key, None)
+            return True
+        return False
+
+
+if settings.database_pool_enabled:
+    db = PooledPostgresqlDatabase(DATABASE_NAME, user=DATABASE_USER, password=DATABASE_PASSWORD,
+                                  host=DATABASE_HOST, port=DATABASE_PORT,
+                                  max_connections=settings.database_max_connections,
+                                  stale_timeout=settings.database_stale_timeout,
+                                  timeout=settings.database_pool_timeout)
+else:
+    db = peewee.PostgresqlDatabase(DATABASE_NAME, user=DATABASE_USER, password=DATABASE_PASSWORD,
+                                   host=DATABASE_HOST, port=DATABASE_PORT)
 db._state = PeeweeConnectionState()
+instrument(db)
+
+
+def close_pool():
+    if isinstance(db, pool.PooledDatabase):
+        db.close_all()
@@ -0,0 +1,82 @@
+import asyncio
+from contextvars import ContextVar
+from .config import settings
+
+# Loaders of the current HTTP request. fastapi_jsonrpc runs the calls of a batch as tasks spawned from
+# the request task, so they all inherit the same value.
+registry: ContextVar = ContextVar('dataloaders', default=None)
+
+
+class DataLoader:
+    """Collects the keys requested within one batch window and resolves them with a single `batch_load` call.
+
+    `batch_load` receives a list of distinct keys and returns a dict; keys missing from it resolve to None.
+    Results are kept for the lifetime of the loader, so a key is fetched at most once per request.
+    """
+
+    def __init__(self, batch_load, max_batch_size: int | None = None):
+        self.batch_load = batch_load
+        self.max_batch_size = max_batch_size or settings.dataloader_max_batch_size
+        self.__futures = {}
+        self.__queue = []
+        self.__handle = None
+        # The event loop only keeps weak references to tasks, so running batches are held here until done.
+        self.__tasks = set()
+
+    async def load(self, key):
+        future = self.__futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.__futures[key] = loop.create_future()
+            self.__queue.append(key)
+            if len(self.__queue) >= self.max_batch_size:
+                self.__dispatch()
+            elif self.__handle is None:
+                self.__handle = loop.call_later(settings.dataloader_batch_window_ms / 1000, self.__dispatch)
+        # Shielded so that a cancelled caller does not cancel the result other callers are waiting for.
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys) -> list:
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def __dispatch(self):
+        if self.__handle is not None:
+            self.__handle.cancel()
+            self.__handle = None
+        keys, self.__queue = self.__queue, []
+        if keys:
+            task = asyncio.get_running_loop().create_task(self.__resolve(keys))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __resolve(self, keys: list):
+        try:
+            values = await self.batch_load(keys)
+        except Exception as error:
+            for key in keys:
+                future = self.__futures.pop(key)
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for key in keys:
+            future = self.__futures[key]
+            if not future.done():
+                future.set_result(values.get(key))
+
+
+class DataLoaderMiddleware:
+    """ASGI middleware that gives every HTTP request a fresh set of loaders built by `factory`."""
+
+    def __init__(self, app, factory):
+        self.app = app
+        self.factory = factory
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        token = registry.set(self.factory())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            registry.reset(token)
@@ -55,6 +55,26 @@ class VideoNotExist(jsonrpc.BaseError):
     CODE = 5000
     MESSAGE = 'No video with this id found'
 
+class VideoUploadError(jsonrpc.BaseError):
+    CODE = 5000
+    MESSAGE = 'Video upload failed'
+
+class UploadSessionNotFound(jsonrpc.BaseError):
+    CODE = 5000
+    MESSAGE = 'No upload session with this id found'
+
+class InvalidPartNumber(jsonrpc.BaseError):
+    CODE = 5000
+    MESSAGE = 'Part number must be between 1 and 10000'
+
+class PartTooLarge(jsonrpc.BaseError):
+    CODE = 5000
+    MESSAGE = 'Part is too large'
+
+class PreviewMissingError(jsonrpc.BaseError):
+    CODE = 5000
+    MESSAGE = 'Upload the preview image before completing the upload'
+
 class InvalidVideoFormat(jsonrpc.BaseError):
     CODE = 5000
     MESSAGE = 'Invalid video format'
@@ -90,4 +110,9 @@ class SubscribeToYourself(jsonrpc.BaseError):
 
 class CantDeleteVideo(jsonrpc.BaseError):
     CODE = 5000
-    MESSAGE = "You can't delete this video"
\ No newline at end of file
+    MESSAGE = "You can't delete this video"
+
+
+class InvalidCursorError(jsonrpc.BaseError):
+    CODE = 9000
+    MESSAGE = 'Invalid pagination cursor'
@@ -0,0 +1,114 @@
+import heapq
+from datetime import datetime
+import itertools
+from peewee import SQL, Select, Tuple, Value
+from . import models, pagination
+from .config import settings
+
+# Authors with more subscribers than this are not fanned out on write; their videos are merged into
+# each feed at read time instead.
+LARGE_AUTHOR_BRANCHES_PER_QUERY = 100
+
+
+def is_large_author(number_of_subscribers: int) -> bool:
+    return number_of_subscribers > settings.feed_fanout_max_subscribers
+
+
+def fan_out(video_id: int, author_id: int, created_at) -> int:
+    """Append a newly published video to the feed of every subscriber of a small author."""
+    author = models.User.select(models.User.number_of_subscribers).where(models.User.id == author_id).first()
+    if author is None or author.number_of_subscribers == 0 or is_large_author(author.number_of_subscribers):
+        return 0
+    subscribers = (models.Subscriber
+                   .select(models.Subscriber.subscriber, Value(video_id), Value(author_id), Value(created_at))
+                   .where(models.Subscriber.author == author_id))
+    return (models.FeedItem
+            .insert_from(subscribers, fields=[models.FeedItem.subscriber, models.FeedItem.video,
+                                              models.FeedItem.author, models.FeedItem.created_at])
+            .on_conflict_ignore()
+            .execute())
+
+
+def backfill(subscriber_id: int, author_id: int) -> int:
+    """Copy the latest videos of a small author into the feed of a new subscriber."""
+    author = models.User.select(models.User.number_of_subscribers).where(models.User.id == author_id).first()
+    if author is None or is_large_author(author.number_of_subscribers):
+        return 0
+    videos = (models.Video
+              .select(Value(subscriber_id), models.Video.id, models.Video.author_id, models.Video.creation_time)
+              .where((models.Video.author_id == author_id) & (models.Video.is_published == True))
+              .order_by(models.Video.creation_time.desc(), models.Video.id.desc())
+              .limit(settings.feed_backfill_size))
+    return (models.FeedItem
+            .insert_from(videos, fields=[models.FeedItem.subscriber, models.FeedItem.video,
+                                         models.FeedItem.author, models.FeedItem.created_at])
+            .on_conflict_ignore()
+            .execute())
+
+
+def remove_author(subscriber_id: int, author_id: int):
+    (models.FeedItem
+     .delete()
+     .where((models.FeedItem.subscriber == subscriber_id) & (models.FeedItem.author == author_id))
+     .execute())
+
+
+def followed_large_authors(subscriber_id: int) -> list[int]:
+    return [author.id for author in
+            models.User
+            .select(models.User.id)
+            .join(models.Subscriber, on=(models.Subscriber.author == models.User.id))
+            .where((models.Subscriber.subscriber == subscriber_id) &
+                   (models.User.number_of_subscribers > settings.feed_fanout_max_subscribers))]
+
+
+def fanned_out_run(subscriber_id: int, large_authors: list[int], after: tuple | None, size: int) -> list[tuple]:
+    query = (models.FeedItem
+             .select(models.FeedItem.created_at, models.FeedItem.video)
+             .where(models.FeedItem.subscriber == subscriber_id))
+    if large_authors:
+        query = query.where(models.FeedItem.author.not_in(large_authors))
+    if after is not None:
+        query = query.where(Tuple(models.FeedItem.created_at, models.FeedItem.video) < Tuple(*after))
+    return list(query.order_by(models.FeedItem.created_at.desc(), models.FeedItem.video.desc()).limit(size).tuples())
+
+
+def large_author_runs(large_authors: list[int], after: tuple | None, size: int) -> list[list[tuple]]:
+    """Read the newest `size` videos of every large author, one (author_id, creation_time) index range each.
+
+    The ranges are sent as UNION ALL branches so a batch of authors costs one round trip.
+    """
+    runs = {}
+    db = models.Video._meta.database
+    for start in range(0, len(large_authors), LARGE_AUTHOR_BRANCHES_PER_QUERY):
+        branches = []
+        for author_id in large_authors[start:start + LARGE_AUTHOR_BRANCHES_PER_QUERY]:
+            branch = (models.Video
+                      .select(models.Video.creation_time, models.Video.id, models.Video.author_id)
+                      .where((models.Video.author_id == author_id) & (models.Video.is_published == True)))
+            if after is not None:
+                branch = branch.where(Tuple(models.Video.creation_time, models.Video.id) < Tuple(*after))
+            branch = branch.order_by(models.Video.creation_time.desc(), models.Video.id.desc()).limit(size)
+            branches.append(Select([branch.alias(f'run{author_id}')], [SQL('*')]))
+        query = branches[0]
+        for branch in branches[1:]:
+            query = query + branch
+        for creation_time, video_id, author_id in query.bind(db).tuples():
+            runs.setdefault(author_id, []).append((models.Video.creation_time.python_value(creation_time), video_id))
+    return [sorted(run, reverse=True) for run in runs.values()]
+
+
+def get_feed_page(subscriber_id: int, cursor: str | None, limit: int | None) -> tuple[list[int], str | None]:
+    """Return the ids of the next feed page, newest first, and the cursor for the page after it."""
+    limit = pagination.clamp_limit(limit)
+    after = pagination.decode_cursor(cursor, (datetime, int)) if cursor else None
+    large_authors = followed_large_authors(subscriber_id)
+    runs = [fanned_out_run(subscriber_id, large_authors, after, limit + 1)]
+    if large_authors:
+        runs.extend(large_author_runs(large_authors, after, limit + 1))
+    entries = list(itertools.islice(heapq.merge(*runs, reverse=True), limit + 1))
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = pagination.encode_cursor(*entries[-1])
+    return [video_id for _, video_id in entries], next_cursor
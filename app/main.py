@@ -1,22 +1,28 @@
-from fastapi import Depends, Body, Header, UploadFile
+import asyncio
+from fastapi import Depends, Body, Header, UploadFile, Request, Response
 import fastapi_jsonrpc as jsonrpc
 import logging
 from contextlib import asynccontextmanager
 from typing import Annotated
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 
-from . import crud, schemas, errors, authentication, database, models, video, avatar
-from .database import db_state_default
+from . import crud, schemas, errors, authentication, database, models, video, avatar, assembler, pagination, \
+    migrations, storage, config, async_crud, view_buffer, passwords, search, suggest, trending, dataloader, \
+    metrics, presign
 
 logger = logging.getLogger(__name__)
+tables = [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer,
+          models.FeedItem, models.RelatedVideo, models.JobWatermark, models.UploadSession, models.UploadedPart]
 database.db.connect()
-database.db.create_tables(
-    [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer])
+database.db.create_tables(tables)
+migrations.add_missing_columns(database.db, tables)
+search.install(database.db)
 database.db.close()
 
 
 async def reset_db_state():
-    database.db._state._state.set(db_state_default.copy())
+    database.reset_state()
     database.db._state.reset()
 
 
@@ -33,23 +39,29 @@ async def get_current_user(access_token: str = Header(None, alias='access-token'
     if not access_token:
         raise errors.AccessTokenMissingError
     user_id = authentication.TokenManager.try_get_user_id_from_token(access_token)
-    user_db = crud.get_user_by_id(user_id=user_id)
+    user_db = await async_crud.get_user_by_id(user_id)
     return user_db
 
 
 @asynccontextmanager
 async def logging_middleware(ctx: jsonrpc.JsonRpcContext):
+    query_stats = database.start_query_stats()
     logger.info('Request: %r', ctx.raw_request)
     try:
         yield
     finally:
         logger.info('Response: %r', ctx.raw_response)
+        logger.info('Queries: %s', query_stats)
 
 
 api = jsonrpc.Entrypoint(
     '/api',
-    middlewares=[logging_middleware],
+    middlewares=[logging_middleware, metrics.metrics_middleware],
 )
+metrics.caches.update({'user': crud.user_cache, 'video_show': crud.video_show_cache,
+                       'presigned_url': presign.presigned_urls.cache,
+                       'verified_token': authentication.TokenManager.verified_tokens})
+metrics.pools.update({'peewee': lambda: database.db, 'asyncpg': lambda: async_crud.pool})
 
 
 @api.method(dependencies=[Depends(get_db)])
@@ -65,26 +77,43 @@ def get_new_refresh_and_access_token(refresh_token: str = Header(None, alias='re
     return new_tokens
 
 
-@api.method(dependencies=[Depends(get_db)])
-def register_user(user_data: schemas.UserCreate = Body()) -> schemas.Tokens:
-    user_db = crud.get_user_by_email(email=user_data.email)
-    if user_db:
-        raise errors.RegisterError
+def create_account(user_data: schemas.UserCreate, hashed_password: str) -> schemas.Tokens:
+    with crud.atomic():
+        user_db = crud.get_user_by_email(email=user_data.email)
+        if user_db:
+            raise errors.RegisterError
 
-    user_db = crud.create_user(user=user_data)
-    new_tokens = authentication.TokenManager.create_access_and_refresh_token(user_db.id)
-    crud.update_user_refresh_token(user_db.id, new_tokens.refresh_token)
+        user_db = crud.create_user(user=user_data, hashed_password=hashed_password)
+        new_tokens = authentication.TokenManager.create_access_and_refresh_token(user_db.id)
+        crud.update_user_refresh_token(user_db.id, new_tokens.refresh_token)
     return new_tokens
 
 
-@api.method(dependencies=[Depends(get_db)])
-def login(user_data: schemas.UserInf = Body()) -> schemas.Tokens:
-    user_db = crud.get_user_by_email_and_password(email=user_data.email, password=user_data.password)
+def save_login(user_id: int, refresh_token: str, new_hash: str | None):
+    with crud.atomic():
+        if new_hash is not None:
+            crud.update_user_hashed_password(user_id, new_hash)
+        crud.update_user_refresh_token(user_id, refresh_token)
+
+
+# Password hashing is awaited on the hashing workers; only the database work takes a threadpool thread.
+@api.method()
+async def register_user(user_data: schemas.UserCreate = Body()) -> schemas.Tokens:
+    hashed_password = await passwords.hash_password_async(user_data.password)
+    return await async_crud.run_sync(create_account, user_data, hashed_password)
+
+
+@api.method()
+async def login(user_data: schemas.UserInf = Body()) -> schemas.Tokens:
+    user_db = await async_crud.run_sync(crud.get_user_by_email, user_data.email)
     if user_db is None:
         raise errors.AccountNotFound
+    is_valid, new_hash = await passwords.verify_and_update_async(user_data.password, user_db.hashed_password)
+    if not is_valid:
+        raise errors.AccountNotFound
 
     new_tokens = authentication.TokenManager.create_access_and_refresh_token(user_db.id)
-    crud.update_user_refresh_token(user_db.id, new_tokens.refresh_token)
+    await async_crud.run_sync(save_login, user_db.id, new_tokens.refresh_token, new_hash)
     return new_tokens
 
 
@@ -95,69 +124,80 @@ def get_current_user_information(user: Annotated[schemas.User, Depends(get_curre
 
 @api.method(dependencies=[Depends(get_db)])
 def get_user_profile(user: Annotated[schemas.User, Depends(get_current_user)],
-                     user_id: int) -> schemas.UserProfileInformation:
+                     user_id: int, cursor: str | None = None,
+                     limit: int = pagination.DEFAULT_LIMIT) -> schemas.UserProfileInformation:
     user_db = models.User.get_by_id(user_id)
-    user_videos_db = user_db.videos
-    videos_show_inf = []
-    for user_video in user_videos_db:
-        preview_image_url = video.VideoManager.get_video_image_preview_url(user_video.id)
-        author_name = user_db.username
-        number_of_views = crud.get_number_of_views(user_video.id)
-        videos_show_inf.append(
-            schemas.VideoInf(video_name=user_video.video_name, description=user_video.description, id=user_video.id,
-                             preview_image_url=preview_image_url, author_name=author_name, author_id=user_id,
-                             published_at=user_video.creation_time, number_of_views=number_of_views))
-    number_of_subscribers = user_db.subscribers.count()
-    number_of_videos = len(videos_show_inf)
+    videos_page = assembler.get_videos_page(cursor, limit, author_id=user_id)
+    number_of_subscribers = user_db.number_of_subscribers
+    number_of_videos = user_db.number_of_videos
     user_avatar_url = avatar.AvatarManager.get_avatar_url(user_id)
 
     return schemas.UserProfileInformation(username=user_db.username,
                                           number_of_subscribers=number_of_subscribers,
                                           number_of_videos=number_of_videos,
-                                          user_videos=videos_show_inf,
+                                          user_videos=videos_page.items,
+                                          next_cursor=videos_page.next_cursor,
                                           user_avatar_url=user_avatar_url)
 
 
+# The list methods below keep their original result for existing clients, capped at `limit` entries;
+# the *_page methods return a cursor to the next page as well.
+@api.method()
+async def get_all_videos_inf(user: Annotated[schemas.User, Depends(get_current_user)],
+                             limit: int = pagination.MAX_LIMIT) -> list[schemas.VideoInf]:
+    # The newest videos, oldest first as before.
+    return (await async_crud.get_videos_page(None, limit)).items[::-1]
+
+
+@api.method()
+async def get_all_videos_inf_page(user: Annotated[schemas.User, Depends(get_current_user)], cursor: str | None = None,
+                                  limit: int = pagination.DEFAULT_LIMIT) -> schemas.VideoInfPage:
+    return await async_crud.get_videos_page(cursor, limit)
+
+
 @api.method(dependencies=[Depends(get_db)])
-def get_all_videos_inf(user: Annotated[schemas.User, Depends(get_current_user)]) -> list[schemas.VideoInf]:
-    videos = []
-    for video_inf in crud.get_all_videos():
-        preview_image_url = video.VideoManager.get_video_image_preview_url(video_inf.id)
-        author_name = crud.get_user_by_id(video_inf.author_id).username
+def search_videos(user: Annotated[schemas.User, Depends(get_current_user)], query: str, cursor: str | None = None,
+                  limit: int = pagination.DEFAULT_LIMIT) -> schemas.VideoInfPage:
+    return search.search_videos(query, cursor, limit)
 
-        number_of_views = crud.get_number_of_views(video_inf.id)
-        videos.append(
-            schemas.VideoInf(id=video_inf.id, video_name=video_inf.video_name, description=video_inf.description,
-                             preview_image_url=preview_image_url, author_name=author_name,
-                             author_id=video_inf.author_id.id,
-                             published_at=video_inf.creation_time, number_of_views=number_of_views))
-    return videos
+
+@api.method(dependencies=[Depends(get_db)])
+def get_trending_videos(user: Annotated[schemas.User, Depends(get_current_user)],
+                        limit: int = pagination.DEFAULT_LIMIT) -> list[schemas.VideoInf]:
+    return assembler.get_trending_videos(pagination.clamp_limit(limit))
 
 
 @api.method(dependencies=[Depends(get_db)])
-def get_video_show_inf_by_id(user: Annotated[schemas.User, Depends(get_current_user)],
-                             video_id: int) -> schemas.VideoShow:
-    video_db = crud.get_video_by_id(video_id)
-    author_id = video_db.author_id.id
-    video_name, description = video_db.video_name, video_db.description
-    video_url = video.VideoManager.get_video_url_by_id(video_id)
-    reactions = crud.get_video_number_of_likes_and_dislikes(video_id)
-    user_reaction = crud.get_user_reaction_to_video(user.id, video_id)
-    comments = crud.get_comments_show_inf_from_video(video_id)
-    number_of_views = crud.get_number_of_views(video_id)
-    published_at = video_db.creation_time
-
-    return schemas.VideoShow(video_url=video_url, reactionsInf=reactions, video_name=video_name,
-                             description=description, user_reaction=user_reaction, comments=comments,
-                             number_of_views=number_of_views, published_at=published_at, author_id=author_id)
+def get_subscription_feed(user: Annotated[schemas.User, Depends(get_current_user)], cursor: str | None = None,
+                          limit: int = pagination.DEFAULT_LIMIT) -> schemas.VideoInfPage:
+    return assembler.get_subscription_feed(user.id, cursor, limit)
 
 
 @api.method(dependencies=[Depends(get_db)])
-def get_user_channel_information(user: Annotated[schemas.User, Depends(get_current_user)],
-                                 user_id: int) -> schemas.UserChannelInformation:
-    user_db = crud.get_user_by_id(user_id)
-    user_avatar_url = avatar.AvatarManager.get_avatar_url(user_id)
-    return schemas.UserChannelInformation(username=user_db.username, number_of_subscribers=user_db.subscribers.count(),
+def get_related_videos(user: Annotated[schemas.User, Depends(get_current_user)], video_id: int,
+                       limit: int = 10) -> list[schemas.VideoInf]:
+    return assembler.get_related_videos(video_id, pagination.clamp_limit(limit))
+
+
+@api.method(name='suggest')
+async def suggest_completions(user: Annotated[schemas.User, Depends(get_current_user)], prefix: str,
+                              limit: int = 10) -> list[schemas.Suggestion]:
+    # A short prefix may need its candidates rebuilt from a large slice, which must not stall the event loop.
+    return await run_in_threadpool(suggest.suggest_index.suggest, prefix, pagination.clamp_limit(limit))
+
+
+@api.method()
+async def get_video_show_inf_by_id(user: Annotated[schemas.User, Depends(get_current_user)],
+                                   video_id: int) -> schemas.VideoShow:
+    return await async_crud.get_video_show(video_id, user.id)
+
+
+@api.method()
+async def get_user_channel_information(user: Annotated[schemas.User, Depends(get_current_user)],
+                                       user_id: int) -> schemas.UserChannelInformation:
+    user_db = await async_crud.get_loaders().users.load(user_id)
+    user_avatar_url = await run_in_threadpool(avatar.AvatarManager.get_avatar_url, user_id)
+    return schemas.UserChannelInformation(username=user_db.username, number_of_subscribers=user_db.number_of_subscribers,
                                           user_avatar_url=user_avatar_url)
 
 
@@ -166,9 +206,9 @@ def get_user_avatar_image(user: Annotated[schemas.User, Depends(get_current_user
     return avatar.AvatarManager.get_avatar_url(user_id)
 
 
-@api.method(dependencies=[Depends(get_db)])
+@api.method()
 def watch_video(user: Annotated[schemas.User, Depends(get_current_user)], video_id: int):
-    crud.watch_video(user_id=user.id, video_id=video_id)
+    view_buffer.view_buffer.record(user_id=user.id, video_id=video_id)
 
 
 @api.method(dependencies=[Depends(get_db)])
@@ -182,10 +222,17 @@ def add_comment_to_video(user: Annotated[schemas.User, Depends(get_current_user)
     crud.create_comment(comment_inf)
 
 
-@api.method(dependencies=[Depends(get_db)])
-def get_comments_from_video(user: Annotated[schemas.User, Depends(get_current_user)], video_id: int) -> list[
-    schemas.CommentShow]:
-    return crud.get_comments_show_inf_from_video(video_id)
+@api.method()
+async def get_comments_from_video(user: Annotated[schemas.User, Depends(get_current_user)], video_id: int,
+                                  limit: int = pagination.MAX_LIMIT) -> list[schemas.CommentShow]:
+    return (await async_crud.get_comments_page(video_id, None, limit)).items
+
+
+@api.method()
+async def get_comments_from_video_page(user: Annotated[schemas.User, Depends(get_current_user)], video_id: int,
+                                       cursor: str | None = None,
+                                       limit: int = pagination.DEFAULT_LIMIT) -> schemas.CommentShowPage:
+    return await async_crud.get_comments_page(video_id, cursor, limit)
 
 
 @api.method(dependencies=[Depends(get_db)])
@@ -198,23 +245,51 @@ def unsubscribe(user: Annotated[schemas.User, Depends(get_current_user)], author
     return crud.unsubscribe(subscriber_id=user.id, author_id=author_id)
 
 
+@api.method()
+async def is_subscribed_to_author(user: Annotated[schemas.User, Depends(get_current_user)], author_id: int) -> bool:
+    return await async_crud.is_user_subscribed_to_author(user_id=user.id, author_id=author_id)
+
+
+@api.method(dependencies=[Depends(get_db)])
+def get_latest_viewed_videos(user: Annotated[schemas.User, Depends(get_current_user)],
+                             limit: int = pagination.MAX_LIMIT) -> list[schemas.VideoInf]:
+    # The most recently viewed videos, in viewing order as before.
+    return assembler.get_viewed_videos_page(user.id, None, limit).items[::-1]
+
+
+@api.method(dependencies=[Depends(get_db)])
+def get_latest_viewed_videos_page(user: Annotated[schemas.User, Depends(get_current_user)], cursor: str | None = None,
+                                  limit: int = pagination.DEFAULT_LIMIT) -> schemas.VideoInfPage:
+    return assembler.get_viewed_videos_page(user.id, cursor, limit)
+
+
+@api.method(dependencies=[Depends(get_db)])
+def start_upload_session(user: Annotated[schemas.User, Depends(get_current_user)], video_name: str,
+                         video_descr: str = '') -> schemas.UploadSessionInf:
+    session = video.VideoManager.start_upload_session(video_name=video_name, video_description=video_descr,
+                                                      author_id=user.id)
+    return schemas.UploadSessionInf(session_id=str(session.id), video_id=session.video_id,
+                                    part_size=config.settings.upload_part_size)
+
+
+@api.method(dependencies=[Depends(get_db)])
+def get_upload_session_parts(user: Annotated[schemas.User, Depends(get_current_user)],
+                             session_id: str) -> list[schemas.UploadedPartInf]:
+    session = crud.get_upload_session(session_id, user.id)
+    return [schemas.UploadedPartInf(part_number=part.part_number, size=part.size)
+            for part in crud.get_uploaded_parts(session.id)]
+
+
 @api.method(dependencies=[Depends(get_db)])
-def is_subscribed_to_author(user: Annotated[schemas.User, Depends(get_current_user)], author_id: int) -> bool:
-    return crud.is_user_subscribed_to_author(user_id=user.id, author_id=author_id)
+def complete_upload_session(user: Annotated[schemas.User, Depends(get_current_user)], session_id: str) -> int:
+    session = crud.get_upload_session(session_id, user.id)
+    return video.VideoManager.complete_upload_session(session)
 
 
 @api.method(dependencies=[Depends(get_db)])
-def get_latest_viewed_videos(user: Annotated[schemas.User, Depends(get_current_user)]) -> list[schemas.VideoInf]:
-    videos_db = crud.get_viewed_videos(user.id)
-    result = []
-    for video_db in videos_db:
-        preview_image_url = video.VideoManager.get_video_image_preview_url(video_db.id)
-        author_name = crud.get_user_by_id(video_db.author_id.id).username
-        number_of_views = crud.get_number_of_views(video_db.id)
-        result.append(schemas.VideoInf(video_name=video_db.video_name, description=video_db.description, id=video_db.id,
-                                       preview_image_url=preview_image_url, author_name=author_name,  author_id = video_db.author_id.id,
-                                       published_at=video_db.creation_time, number_of_views=number_of_views))
-    return result
+def abort_upload_session(user: Annotated[schemas.User, Depends(get_current_user)], session_id: str):
+    session = crud.get_upload_session(session_id, user.id)
+    video.VideoManager.abort_upload_session(session)
 
 
 @api.method(dependencies=[Depends(get_db)])
@@ -226,9 +301,46 @@ def delete_video(user: Annotated[schemas.User, Depends(get_current_user)], video
     video.VideoManager.delete_video(video_id)
 
 
-app = jsonrpc.API()
+async def refresh_periodically(load, target, interval: float):
+    while True:
+        try:
+            await run_in_threadpool(async_crud.with_connection, load, target)
+        except Exception:
+            logger.exception('Failed to run %s', load.__qualname__)
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    passwords.start()
+    await storage.storage_clients.open()
+    await async_crud.open_pool()
+    if config.settings.view_buffer_enabled:
+        view_buffer.view_buffer.start()
+    refresh_tasks = [
+        asyncio.create_task(refresh_periodically(suggest.load_index, suggest.suggest_index,
+                                                 config.settings.suggest_refresh_interval_seconds)),
+        asyncio.create_task(refresh_periodically(trending.load_scores, trending.ranker,
+                                                 config.settings.trending_refresh_interval_seconds)),
+        asyncio.create_task(metrics.collect_periodically(config.settings.metrics_refresh_interval_seconds)),
+    ]
+    try:
+        yield
+    finally:
+        for task in refresh_tasks:
+            task.cancel()
+        await run_in_threadpool(view_buffer.view_buffer.stop)
+        passwords.shutdown()
+        await async_crud.close_pool()
+        await storage.storage_clients.close()
+        database.close_pool()
+        metrics.shutdown()
+
+
+app = jsonrpc.API(lifespan=lifespan)
 app.bind_entrypoint(api)
 
+app.add_middleware(dataloader.DataLoaderMiddleware, factory=async_crud.Loaders)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=['*'],
@@ -238,6 +350,12 @@ app.add_middleware(
 )
 
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    content, content_type = metrics.render()
+    return Response(content, media_type=content_type)
+
+
 @app.post("/api/upload-video-file", dependencies=[Depends(get_db)])
 async def upload_video_file(user: Annotated[schemas.User, Depends(get_current_user)], video_name: str,
                             video_data: UploadFile,
@@ -257,6 +375,22 @@ async def upload_video_file(user: Annotated[schemas.User, Depends(get_current_us
     return int(db_video.id)
 
 
+@app.put("/api/upload-sessions/{session_id}/parts/{part_number}", dependencies=[Depends(get_db)])
+async def upload_session_part(user: Annotated[schemas.User, Depends(get_current_user)], session_id: str,
+                              part_number: int, request: Request):
+    session = crud.get_upload_session(session_id, user.id)
+    await video.VideoManager.upload_session_part(session, part_number, request.stream())
+
+
+@app.put("/api/upload-sessions/{session_id}/preview", dependencies=[Depends(get_db)])
+async def upload_session_preview(user: Annotated[schemas.User, Depends(get_current_user)], session_id: str,
+                                 preview_image_data: UploadFile):
+    if preview_image_data.content_type not in ['image/jpeg', 'image/png']:
+        raise errors.InvalidImageFormat
+    session = crud.get_upload_session(session_id, user.id)
+    await video.VideoManager.upload_session_preview(session, preview_image_data.file)
+
+
 @app.post("/api/upload-avatar", dependencies=[Depends(get_db)])
 def upload_avatar(user: Annotated[schemas.User, Depends(get_current_user)], avatar_data: UploadFile):
     if not avatar_data:
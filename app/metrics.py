@@ -0,0 +1,140 @@
+"""Prometheus metrics for the API, served in text format at `/metrics`.
+
+With several uvicorn workers every process keeps its own values, so set `PROMETHEUS_MULTIPROC_DIR` to an
+empty directory shared by the workers before the server starts: each worker then writes its samples there
+and `/metrics` aggregates all of them, whichever worker answers.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+import fastapi_jsonrpc as jsonrpc
+from playhouse import pool as peewee_pool
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, \
+    generate_latest, multiprocess
+from . import singleflight
+
+logger = logging.getLogger(__name__)
+
+rpc_requests = Counter('rpc_requests_total', 'JSON-RPC calls by method.', ['method'])
+rpc_errors = Counter('rpc_errors_total', 'JSON-RPC calls that returned an error, by method and error class.',
+                     ['method', 'error'])
+rpc_duration = Histogram('rpc_request_duration_seconds', 'JSON-RPC call latency by method.', ['method'],
+                         buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+s3_duration = Histogram('s3_operation_duration_seconds', 'S3 call latency by operation.', ['operation'],
+                        buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+s3_errors = Counter('s3_operation_errors_total', 'S3 calls that raised, by operation.', ['operation'])
+db_pool_connections = Gauge('db_pool_connections', 'Database pool connections by pool and state.',
+                            ['pool', 'state'], multiprocess_mode='livesum')
+cache_hits = Counter('cache_hits_total', 'In-process cache hits.', ['cache'])
+cache_misses = Counter('cache_misses_total', 'In-process cache misses.', ['cache'])
+cache_entries = Gauge('cache_entries', 'Entries held by in-process caches.', ['cache'], multiprocess_mode='livesum')
+cache_hit_ratio = Gauge('cache_hit_ratio', 'Hit ratio of in-process caches since the worker started.', ['cache'],
+                        multiprocess_mode='liveall')
+singleflight_calls = Counter('singleflight_calls_total', 'Calls made through a single-flight group.', ['group'])
+singleflight_coalesced = Counter('singleflight_coalesced_total', 'Calls that shared the result of another call.',
+                                 ['group'])
+
+# Filled by app.main: cache name -> TTLCache, pool name -> callable returning the pool (or None).
+caches = {}
+pools = {}
+# The caches and single-flight groups count from process start; the counters above are advanced by the difference.
+_last_counts = {}
+
+
+def is_multiprocess() -> bool:
+    return 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ
+
+
+def method_label(ctx: jsonrpc.JsonRpcContext) -> str:
+    # Unknown method names come from the client, so they are not used as label values.
+    return ctx.method_route.name if ctx.method_route is not None else 'unknown'
+
+
+def error_label(exception: Exception) -> str:
+    return type(exception).__name__ if isinstance(exception, jsonrpc.BaseError) else 'InternalError'
+
+
+@asynccontextmanager
+async def metrics_middleware(ctx: jsonrpc.JsonRpcContext):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        method = method_label(ctx)
+        rpc_requests.labels(method).inc()
+        rpc_duration.labels(method).observe(time.perf_counter() - started)
+        if ctx.exception is not None:
+            rpc_errors.labels(method, error_label(ctx.exception)).inc()
+
+
+@contextmanager
+def s3_timer(operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        s3_errors.labels(operation).inc()
+        raise
+    finally:
+        s3_duration.labels(operation).observe(time.perf_counter() - started)
+
+
+def pool_usage(pool) -> dict | None:
+    if isinstance(pool, peewee_pool.PooledDatabase):
+        return {'in_use': len(pool._in_use), 'idle': len(pool._connections), 'max': pool._max_connections}
+    if pool is not None and hasattr(pool, 'get_idle_size'):
+        idle = pool.get_idle_size()
+        return {'in_use': pool.get_size() - idle, 'idle': idle, 'max': pool.get_max_size()}
+    return None
+
+
+def advance(counter, label: str, count: int):
+    last = _last_counts.get((counter, label), 0)
+    # A count below the last one means the source was recreated, so all of it is new.
+    counter.labels(label).inc(count - last if count >= last else count)
+    _last_counts[(counter, label)] = count
+
+
+def collect():
+    """Copy pool usage, cache and single-flight statistics of this process into the metrics."""
+    for name, get_pool in pools.items():
+        usage = pool_usage(get_pool())
+        for state, value in (usage or {}).items():
+            db_pool_connections.labels(name, state).set(value)
+    for name, cache in caches.items():
+        stats = cache.stats()
+        advance(cache_hits, name, stats['hits'])
+        advance(cache_misses, name, stats['misses'])
+        cache_entries.labels(name).set(stats['size'])
+        cache_hit_ratio.labels(name).set(stats['hit_ratio'])
+    for name, stats in singleflight.stats().items():
+        advance(singleflight_calls, name, stats['calls'])
+        advance(singleflight_coalesced, name, stats['coalesced'])
+
+
+async def collect_periodically(interval: float):
+    # In multiprocess mode a scrape only runs collect() in the worker that answers it, so every worker
+    # refreshes its own values in the background as well.
+    while True:
+        try:
+            collect()
+        except Exception:
+            logger.exception('Failed to collect runtime metrics')
+        await asyncio.sleep(interval)
+
+
+def render() -> tuple[bytes, str]:
+    collect()
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def shutdown():
+    if is_multiprocess():
+        multiprocess.mark_process_dead(os.getpid())
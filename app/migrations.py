@@ -0,0 +1,15 @@
+from playhouse.migrate import SchemaMigrator, migrate
+
+
+def add_missing_columns(db, models: list):
+    migrator = SchemaMigrator.from_database(db)
+    operations = []
+    for model in models:
+        table_name = model._meta.table_name
+        existing_columns = {column.name for column in db.get_columns(table_name)}
+        for field in model._meta.sorted_fields:
+            if field.column_name not in existing_columns:
+                operations.append(migrator.add_column(table_name, field.column_name, field))
+    if operations:
+        with db.atomic():
+            migrate(*operations)
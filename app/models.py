@@ -1,6 +1,7 @@
 from peewee import *
 from .database import db
 import datetime
+import uuid
 
 
 class BaseModel(Model):
@@ -14,6 +15,8 @@ class User(BaseModel):
     hashed_password = CharField()
     refresh_token = CharField(null=True)
     is_active = BooleanField(default=True)
+    number_of_subscribers = IntegerField(default=0)
+    number_of_videos = IntegerField(default=0)
 
 
 class Video(BaseModel):
@@ -21,6 +24,16 @@ class Video(BaseModel):
     author_id = ForeignKeyField(User, backref="videos")
     description = TextField(default='')
     creation_time = DateTimeField(default=datetime.datetime.now)
+    number_of_views = IntegerField(default=0)
+    number_of_likes = IntegerField(default=0)
+    number_of_dislikes = IntegerField(default=0)
+    number_of_comments = IntegerField(default=0)
+    is_published = BooleanField(default=True)
+
+    class Meta:
+        indexes = (
+            (('author_id', 'creation_time'), False),
+        )
 
 
 class Reaction(BaseModel):
@@ -28,6 +41,7 @@ class Reaction(BaseModel):
     user = ForeignKeyField(User, backref='reactions')
     is_like = BooleanField(default=False)
     is_dislike = BooleanField(default=False)
+    reacted_at = DateTimeField(default=datetime.datetime.now)
 
     class Meta:
         primary_key = CompositeKey('video', 'user')
@@ -39,6 +53,11 @@ class Comment(BaseModel):
     text = TextField()
     published_at = DateTimeField(default=datetime.datetime.now)
 
+    class Meta:
+        indexes = (
+            (('video_id', 'published_at'), False),
+        )
+
 
 class Subscriber(BaseModel):
     subscriber = ForeignKeyField(User, backref='subscribedToUsers')
@@ -55,3 +74,52 @@ class Viewer(BaseModel):
 
     class Meta:
         primary_key = CompositeKey('viewer', 'video')
+
+
+class FeedItem(BaseModel):
+    subscriber = ForeignKeyField(User, backref='feed_items')
+    video = ForeignKeyField(Video, backref='feed_items')
+    author = ForeignKeyField(User, backref='fanned_out_items')
+    created_at = DateTimeField()
+
+    class Meta:
+        primary_key = CompositeKey('subscriber', 'video')
+        indexes = (
+            (('subscriber', 'created_at'), False),
+        )
+
+
+class RelatedVideo(BaseModel):
+    video = ForeignKeyField(Video, backref='related_videos')
+    related = ForeignKeyField(Video, backref='related_to')
+    score = FloatField()
+
+    class Meta:
+        primary_key = CompositeKey('video', 'related')
+        indexes = (
+            (('video', 'score'), False),
+        )
+
+
+class JobWatermark(BaseModel):
+    job = CharField(primary_key=True)
+    watermark = DateTimeField()
+
+
+class UploadSession(BaseModel):
+    id = UUIDField(primary_key=True, default=uuid.uuid4)
+    user = ForeignKeyField(User, backref='upload_sessions')
+    video = ForeignKeyField(Video, backref='upload_sessions')
+    s3_upload_id = CharField()
+    has_preview = BooleanField(default=False)
+    created_at = DateTimeField(default=datetime.datetime.now)
+
+
+class UploadedPart(BaseModel):
+    session = ForeignKeyField(UploadSession, backref='parts')
+    part_number = IntegerField()
+    etag = CharField()
+    size = BigIntegerField()
+
+    class Meta:
+        primary_key = CompositeKey('session', 'part_number')
@@ -0,0 +1,55 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from peewee import Tuple
+from . import errors
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100
+
+
+def clamp_limit(limit: int | None) -> int:
+    if limit is None:
+        return DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def encode_cursor(*values) -> str:
+    raw = [{'dt': value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode()
+
+
+def matches_type(value, expected: type) -> bool:
+    if isinstance(value, bool):
+        return False
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor: str, key_types: tuple) -> tuple:
+    """Decode a cursor made by encode_cursor; it must hold exactly one value of each of `key_types`."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values = tuple(datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value for value in raw)
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise errors.InvalidCursorError
+    if len(values) != len(key_types) or not all(map(matches_type, values, key_types)):
+        raise errors.InvalidCursorError
+    return values
+
+
+def paginate(query, key_fields: list, key_types: tuple, cursor: str | None, limit: int | None,
+             descending: bool = True):
+    limit = clamp_limit(limit)
+    if cursor:
+        key, after = Tuple(*key_fields), Tuple(*decode_cursor(cursor, key_types))
+        query = query.where(key < after if descending else key > after)
+    query = query.order_by(*[field.desc() if descending else field.asc() for field in key_fields])
+    rows = list(query.limit(limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*[getattr(rows[-1], field.name) for field in key_fields])
+    return rows, next_cursor
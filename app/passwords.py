@@ -0,0 +1,73 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+from .config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def start():
+    """Start the hashing workers; until then, and with no workers configured, hashing runs in the caller."""
+    global _executor
+    if settings.password_hash_workers <= 0:
+        return
+    with _executor_lock:
+        if _executor is None:
+            # The server already runs threads here, and forking a threaded process can copy locks held by
+            # them, so workers come from a forkserver instead.
+            _executor = ProcessPoolExecutor(max_workers=settings.password_hash_workers,
+                                            mp_context=multiprocessing.get_context('forkserver'))
+
+
+def _run(func, *args):
+    executor = _executor
+    if executor is None:
+        return func(*args)
+    return executor.submit(func, *args).result()
+
+
+async def _run_async(func, *args):
+    # Awaited rather than waited on, so a hash holds neither the event loop nor a threadpool thread.
+    executor = _executor
+    if executor is None:
+        return await run_in_threadpool(func, *args)
+    return await asyncio.wrap_future(executor.submit(func, *args))
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def hash_password(password: str) -> str:
+    return _run(_hash, password)
+
+
+def verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Check a password and return a new hash when the stored one uses outdated settings."""
+    return _run(_verify_and_update, password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_async(_hash, password)
+
+
+async def verify_and_update_async(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await _run_async(_verify_and_update, password, hashed_password)
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
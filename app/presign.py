@@ -0,0 +1,78 @@
+import math
+import time
+from botocore.exceptions import ClientError
+from .cache import TTLCache
+from .config import settings
+from .singleflight import SingleFlight
+from .storage import storage_clients
+
+
+class PresignedUrlCache:
+    """Signs S3 GET URLs once per reissue window.
+
+    Every URL for a (bucket, key) pair is reused until the end of the current window, which is aligned to
+    multiples of `reissue` seconds, so clients and CDNs see a byte-identical URL for the whole window, whichever
+    process signed it.
+    `expire` must be larger than `reissue`: a URL served at the end of its window stays valid for at
+    least `expire - reissue` seconds.
+    """
+
+    def __init__(self, maxsize: int, expire: int, reissue: int):
+        self.expire = expire
+        self.reissue = reissue
+        self.cache = TTLCache(maxsize)
+        # Objects overwritten in the current window, whose aligned URL clients may already hold.
+        self.overwritten = TTLCache(maxsize)
+        self.flight = SingleFlight('presign')
+
+    def window_end(self) -> float:
+        return (time.time() // self.reissue + 1) * self.reissue
+
+    def expires_in(self, bucket: str, key: str, window_end: float) -> int:
+        if self.overwritten.get((bucket, key)) is not None:
+            return self.expire
+        # The expiry is counted from the window rather than from now, so every process signing the object
+        # within the window produces the same URL. Rounded up, as botocore adds the whole seconds to its own,
+        # slightly later, reading of the clock.
+        return math.ceil(window_end + self.expire - self.reissue - time.time())
+
+    def sign(self, bucket: str, key: str, window_end: float) -> str:
+        client = storage_clients.get_client()
+        return client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key},
+                                             ExpiresIn=self.expires_in(bucket, key, window_end))
+
+    def get_url(self, bucket: str, key: str) -> str:
+        url = self.cache.get((bucket, key))
+        if url is None:
+            expires_at = self.window_end()
+            url = self.flight.do((bucket, key), self.sign, bucket, key, expires_at)
+            self.cache.set((bucket, key), url, expires_at=expires_at)
+        return url
+
+    def invalidate(self, bucket: str, key: str):
+        """Forget the URL of an object that was overwritten, so clients get a new URL instead of a cached one.
+
+        Until the window ends the object is signed from the current time, as its aligned URL is already out.
+        """
+        self.cache.pop((bucket, key))
+        self.overwritten.set((bucket, key), True, expires_at=self.window_end())
+
+    def get_urls(self, bucket: str, keys: list[str]) -> dict[str, str | None]:
+        expires_at = self.window_end()
+        result = {}
+        for key in keys:
+            url = self.cache.get((bucket, key))
+            if url is None:
+                try:
+                    url = self.flight.do((bucket, key), self.sign, bucket, key, expires_at)
+                except ClientError:
+                    result[key] = None
+                    continue
+                self.cache.set((bucket, key), url, expires_at=expires_at)
+            result[key] = url
+        return result
+
+
+presigned_urls = PresignedUrlCache(maxsize=settings.presigned_url_cache_size,
+                                   expire=settings.presigned_url_expire_seconds,
+                                   reissue=settings.presigned_url_reissue_seconds)
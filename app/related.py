@@ -0,0 +1,181 @@
+"""Offline "viewers also watched" neighbours computed from the Viewer co-view matrix.
+
+Run as a batch job, not from the API process:
+
+    python -m app.related          # only videos with views newer than the last run
+    python -m app.related --full   # every video
+"""
+import argparse
+import array
+import datetime
+import uuid
+import numpy as np
+from peewee import SqliteDatabase, fn
+from scipy import sparse
+from . import models
+from .config import settings
+
+JOB_NAME = 'related_videos'
+
+
+def stream_rows(query, fetch_size: int):
+    """Yield the rows of `query` without loading the whole result; on Postgres through a server-side cursor."""
+    db = query.model._meta.database
+    if isinstance(db, SqliteDatabase):
+        # sqlite3 cursors already step through the result lazily.
+        yield from query.tuples().iterator()
+        return
+    sql, params = query.sql()
+    with db.atomic():
+        cursor = db.connection().cursor(name=f'{JOB_NAME}_{uuid.uuid4().hex}')
+        try:
+            cursor.itersize = fetch_size
+            cursor.execute(sql, params)
+            yield from cursor
+        finally:
+            cursor.close()
+
+
+def load_matrix(query, fetch_size: int) -> tuple[sparse.csc_matrix, np.ndarray]:
+    """Build a binary viewer x video matrix from (viewer_id, video_id) rows; returns it with the column video ids."""
+    viewers, videos = array.array('q'), array.array('q')
+    for viewer_id, video_id in stream_rows(query, fetch_size):
+        viewers.append(viewer_id)
+        videos.append(video_id)
+    viewer_ids, rows = np.unique(np.frombuffer(viewers, dtype=np.int64), return_inverse=True)
+    video_ids, columns = np.unique(np.frombuffer(videos, dtype=np.int64), return_inverse=True)
+    del viewers, videos
+    matrix = sparse.csc_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                               shape=(len(viewer_ids), len(video_ids)))
+    return matrix, video_ids
+
+
+def top_neighbours(block: sparse.csr_matrix, own_columns: np.ndarray, top_k: int):
+    """Yield (row, neighbour columns, scores) with the best `top_k` entries of each row of a similarity block."""
+    for row, own_column in enumerate(own_columns):
+        start, end = block.indptr[row], block.indptr[row + 1]
+        columns, scores = block.indices[start:end], block.data[start:end]
+        keep = columns != own_column
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            columns, scores = columns[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        yield row, columns[order], scores[order]
+
+
+def compute_related(matrix: sparse.csc_matrix, video_ids: np.ndarray, view_counts: np.ndarray,
+                    targets: np.ndarray, top_k: int, chunk_size: int):
+    """Yield (video_id, [(related_id, cosine)]) for every column in `targets`.
+
+    Columns are scaled by 1/sqrt(views) so the product of two columns is their cosine similarity. Only
+    `chunk_size` target columns are multiplied at a time, which bounds the size of the similarity block.
+    """
+    scale = sparse.diags((1 / np.sqrt(np.maximum(view_counts, 1))).astype(np.float32))
+    normalized = (matrix @ scale).tocsc()
+    transposed = normalized.T.tocsr()
+    for start in range(0, len(targets), chunk_size):
+        chunk = targets[start:start + chunk_size]
+        block = (transposed[chunk] @ normalized).tocsr()
+        for row, columns, scores in top_neighbours(block, chunk, top_k):
+            yield int(video_ids[chunk[row]]), [(int(video_ids[column]), float(score))
+                                               for column, score in zip(columns, scores)]
+
+
+def save_related(results: list[tuple[int, list]]):
+    with models.RelatedVideo._meta.database.atomic():
+        (models.RelatedVideo
+         .delete()
+         .where(models.RelatedVideo.video.in_([video_id for video_id, _ in results]))
+         .execute())
+        rows = [(video_id, related_id, score) for video_id, neighbours in results
+                for related_id, score in neighbours]
+        if rows:
+            models.RelatedVideo.insert_many(rows, fields=[models.RelatedVideo.video, models.RelatedVideo.related,
+                                                          models.RelatedVideo.score]).execute()
+
+
+def get_watermark() -> datetime.datetime | None:
+    state = models.JobWatermark.get_or_none(models.JobWatermark.job == JOB_NAME)
+    return state.watermark if state is not None else None
+
+
+def set_watermark(watermark: datetime.datetime):
+    (models.JobWatermark
+     .insert(job=JOB_NAME, watermark=watermark)
+     .on_conflict(conflict_target=[models.JobWatermark.job], preserve=[models.JobWatermark.watermark])
+     .execute())
+
+
+def run(full: bool = False, top_k: int | None = None, chunk_size: int | None = None,
+        lag_seconds: float | None = None) -> int:
+    """Recompute related videos and return how many videos were updated.
+
+    An incremental run only recomputes videos viewed since the previous run. It loads the views of
+    everyone who watched one of them, which holds every co-view those videos have, and takes the
+    column norms from the full view counts. Neighbour lists of other videos are left as they are
+    until they get new views themselves or the next full run.
+
+    The view buffer writes rows with the time of the view, up to a flush later, so the watermark never
+    moves past `lag_seconds` ago: views younger than that are left for the next run, when every view
+    stamped before them has been written.
+    """
+    top_k = top_k or settings.related_videos_top_k
+    chunk_size = chunk_size or settings.related_videos_chunk_size
+    if lag_seconds is None:
+        lag_seconds = max(settings.related_videos_watermark_lag_seconds, settings.view_flush_interval_ms / 1000)
+    since = None if full else get_watermark()
+    latest = models.Viewer.select(fn.MAX(models.Viewer.viewing_time)).scalar()
+    if latest is None:
+        return 0
+    watermark = min(latest, datetime.datetime.now() - datetime.timedelta(seconds=lag_seconds))
+
+    query = models.Viewer.select(models.Viewer.viewer, models.Viewer.video)
+    if since is not None:
+        touched = (models.Viewer
+                   .select(models.Viewer.video)
+                   .where((models.Viewer.viewing_time > since) & (models.Viewer.viewing_time <= watermark)))
+        viewers = models.Viewer.select(models.Viewer.viewer).where(models.Viewer.video.in_(touched))
+        query = query.where(models.Viewer.viewer.in_(viewers))
+    matrix, video_ids = load_matrix(query, settings.related_videos_fetch_size)
+
+    if since is None:
+        view_counts = np.asarray(matrix.sum(axis=0)).ravel()
+        targets = np.arange(len(video_ids))
+    else:
+        touched_ids = np.array([video_id for video_id, in touched.distinct().tuples()], dtype=np.int64)
+        targets = np.flatnonzero(np.isin(video_ids, touched_ids))
+        counts = {}
+        for start in range(0, len(video_ids), settings.related_videos_fetch_size):
+            batch = video_ids[start:start + settings.related_videos_fetch_size].tolist()
+            counts.update(models.Viewer
+                          .select(models.Viewer.video, fn.COUNT(models.Viewer.viewer))
+                          .where(models.Viewer.video.in_(batch))
+                          .group_by(models.Viewer.video)
+                          .tuples())
+        view_counts = np.array([counts.get(int(video_id), 0) for video_id in video_ids], dtype=np.float32)
+
+    updated = 0
+    results = []
+    for result in compute_related(matrix, video_ids, view_counts, targets, top_k, chunk_size):
+        results.append(result)
+        if len(results) >= chunk_size:
+            save_related(results)
+            updated, results = updated + len(results), []
+    if results:
+        save_related(results)
+        updated += len(results)
+    set_watermark(watermark)
+    return updated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--full', action='store_true', help='recompute every video instead of the recently viewed')
+    args = parser.parse_args()
+    db = models.Video._meta.database
+    db.connect()
+    try:
+        print(run(full=args.full))
+    finally:
+        db.close()
@@ -31,6 +31,11 @@ class CommentShow(BaseModel):
     published_at: datetime = Field(example='2008-09-15T15:53:00+05:00')
 
 
+class CommentShowPage(BaseModel):
+    items: list[CommentShow]
+    next_cursor: str | None = Field(example='W3siZHQiOiAiMjAwOC0wOS0xNVQxNTo1MzowMCJ9LCAxMl0=')
+
+
 class VideoCreate(BaseModel):
     video_name: str = Field(example="Top 10 cats")
     description: str = Field(example="Videos about the funniest cats")
@@ -45,11 +50,35 @@ class VideoInf(VideoCreate):
     number_of_views: int = Field(example='3412')
 
 
+class VideoInfPage(BaseModel):
+    items: list[VideoInf]
+    next_cursor: str | None = Field(example='W3siZHQiOiAiMjAwOC0wOS0xNVQxNTo1MzowMCJ9LCAxMl0=')
+
+
+class Suggestion(BaseModel):
+    text: str = Field(example='Top 10 cats')
+    kind: str = Field(example='video')
+    id: int = Field(example=12)
+
+
+class UploadSessionInf(BaseModel):
+    session_id: str = Field(example='2f1c7c8e-6e3f-4a8c-9d0e-5b7a1e2c3d4f')
+    video_id: int = Field(example=1)
+    part_size: int = Field(example=16777216)
+
+
+class UploadedPartInf(BaseModel):
+    part_number: int = Field(example=1)
+    size: int = Field(example=16777216)
+
+
 class VideoShow(VideoCreate):
     video_url: str = Field()
     author_id: int = Field(example=1)
     reactionsInf: VideoReactionsInf
     comments: list[CommentShow]
+    comments_next_cursor: str | None = Field(example='W3siZHQiOiAiMjAwOC0wOS0xNVQxNTo1MzowMCJ9LCAxMl0=')
+    number_of_comments: int = Field(example=48)
     user_reaction: str = Field(example='like')
     published_at: datetime = Field(example='2008-09-15T15:53:00+05:00')
     number_of_views: int = Field(example='3412')
@@ -92,6 +121,7 @@ class UserProfileInformation(BaseModel):
     number_of_subscribers: int = Field(example=245)
     number_of_videos: int = Field(example=21)
     user_videos: list[VideoInf]
+    next_cursor: str | None = Field(example='W3siZHQiOiAiMjAwOC0wOS0xNVQxNTo1MzowMCJ9LCAxMl0=')
     user_avatar_url: str
 
 
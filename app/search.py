@@ -0,0 +1,84 @@
+import re
+from peewee import Column, Entity, NodeList, SQL, SqliteDatabase, Table, fn
+from . import models, schemas, assembler
+
+TEXT_SEARCH_CONFIG = 'simple'
+
+video_search = Table('video_search', ('rowid', 'video_name', 'description', 'username'))
+
+POSTGRES_SCHEMA = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'''ALTER TABLE video ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(video_name, '')), 'A') ||
+        setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(description, '')), 'B')) STORED''',
+    'CREATE INDEX IF NOT EXISTS video_search_vector_idx ON video USING GIN (search_vector)',
+    'CREATE INDEX IF NOT EXISTS video_video_name_trgm_idx ON video USING GIN (video_name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS user_username_trgm_idx ON "user" USING GIN (username gin_trgm_ops)',
+]
+
+SQLITE_SCHEMA = [
+    '''CREATE TRIGGER IF NOT EXISTS video_search_after_insert AFTER INSERT ON video BEGIN
+        INSERT INTO video_search (rowid, video_name, description, username)
+        SELECT NEW.id, NEW.video_name, NEW.description, username FROM "user" WHERE id = NEW.author_id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS video_search_after_update AFTER UPDATE OF video_name, description ON video BEGIN
+        UPDATE video_search SET video_name = NEW.video_name, description = NEW.description WHERE rowid = NEW.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS video_search_after_delete AFTER DELETE ON video BEGIN
+        DELETE FROM video_search WHERE rowid = OLD.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS video_search_after_rename AFTER UPDATE OF username ON "user" BEGIN
+        UPDATE video_search SET username = NEW.username
+        WHERE rowid IN (SELECT id FROM video WHERE author_id = NEW.id);
+    END''',
+]
+
+
+def install(db):
+    """Create the search index for `db`: a generated tsvector column on Postgres, an FTS5 table elsewhere."""
+    if not isinstance(db, SqliteDatabase):
+        with db.atomic():
+            for statement in POSTGRES_SCHEMA:
+                db.execute_sql(statement)
+        return
+    with db.atomic():
+        is_new = not db.table_exists('video_search')
+        db.execute_sql("CREATE VIRTUAL TABLE IF NOT EXISTS video_search "
+                       "USING fts5(video_name, description, username, tokenize='unicode61 remove_diacritics 2')")
+        for statement in SQLITE_SCHEMA:
+            db.execute_sql(statement)
+        if is_new:
+            db.execute_sql('INSERT INTO video_search (rowid, video_name, description, username) '
+                           'SELECT video.id, video.video_name, video.description, "user".username '
+                           'FROM video JOIN "user" ON "user".id = video.author_id')
+
+
+def select_ranked_ids(db, query: str, words: list[str]):
+    if not isinstance(db, SqliteDatabase):
+        search_vector = Column(models.Video, 'search_vector')
+        ts_query = fn.websearch_to_tsquery(TEXT_SEARCH_CONFIG, query)
+        rank = (fn.ts_rank(search_vector, ts_query) + fn.similarity(models.User.username, query) +
+                fn.similarity(models.Video.video_name, query))
+        return (models.Video
+                .select(models.Video.id, rank.cast('float8').alias('rank'))
+                .join(models.User, on=(models.Video.author_id == models.User.id))
+                .where(NodeList((search_vector, SQL('@@'), ts_query)) |
+                       NodeList((models.User.username, SQL('%%'), query)) |
+                       NodeList((models.Video.video_name, SQL('%%'), query))))
+    match = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+    return (video_search
+            .select(video_search.rowid.alias('id'),
+                    (fn.bm25(Entity('video_search'), 10.0, 2.0, 5.0) * -1).alias('rank'))
+            .where(NodeList((Entity('video_search'), SQL('MATCH'), match))))
+
+
+def search_videos(query: str, cursor: str | None, limit: int | None) -> schemas.VideoInfPage:
+    words = re.findall(r'\w+', query)
+    if not words:
+        return schemas.VideoInfPage(items=[], next_cursor=None)
+    ranked = select_ranked_ids(models.Video._meta.database, query, words)
+    rows = (assembler.select_video_rows()
+            .select_extend(ranked.c.rank)
+            .join_from(models.Video, ranked, on=(models.Video.id == ranked.c.id)))
+    return assembler.get_video_inf_page(rows, [ranked.c.rank, models.Video.id], (float, int), cursor,
+                                        limit)
@@ -0,0 +1,112 @@
+import asyncio
+import functools
+import threading
+
+groups = {}
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self.__in_flight = {}
+        self.__lock = threading.Lock()
+        groups[name] = self
+
+    def do(self, key, func, *args, **kwargs):
+        with self.__lock:
+            self.calls += 1
+            call = self.__in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self.__in_flight[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self.__lock:
+                del self.__in_flight[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced}
+
+
+class AsyncSingleFlight:
+    """Coroutine counterpart of SingleFlight for callers on one event loop.
+
+    The call runs in a task of its own, so cancelling one caller does not cancel the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self.__in_flight = {}
+        # The event loop only keeps weak references to tasks, so running calls are held here until done.
+        self.__tasks = set()
+        groups[name] = self
+
+    async def do(self, key, func, *args, **kwargs):
+        self.calls += 1
+        task = self.__in_flight.get(key)
+        if task is None:
+            task = self.__in_flight[key] = asyncio.ensure_future(func(*args, **kwargs))
+            self.__tasks.add(task)
+            task.add_done_callback(functools.partial(self.__finish, key))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def __finish(self, key, task: asyncio.Task):
+        self.__tasks.discard(task)
+        if self.__in_flight.get(key) is task:
+            del self.__in_flight[key]
+        if not task.cancelled():
+            # Retrieved here so that a failure nobody waits for any more is not logged as never retrieved.
+            task.exception()
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def coalesced(func, bypass=None):
+    """Wrap a blocking function so concurrent calls with equal arguments run it once.
+
+    `bypass` is an optional predicate; when it returns true the call runs on its own, which lets callers
+    inside a write transaction read their own uncommitted changes.
+    """
+    flight = SingleFlight(f'{func.__module__}.{func.__qualname__}')
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if bypass is not None and bypass():
+            return func(*args, **kwargs)
+        return flight.do((args, tuple(sorted(kwargs.items()))), func, *args, **kwargs)
+
+    wrapper.flight = flight
+    return wrapper
+
+
+def stats() -> dict:
+    return {name: group.stats() for name, group in groups.items()}
@@ -0,0 +1,62 @@
+import threading
+from contextlib import AsyncExitStack, asynccontextmanager
+import aioboto3
+import boto3
+from botocore.config import Config
+from .config import settings
+
+
+class StorageClientRegistry:
+    """Process-wide S3 clients shared by VideoManager and AvatarManager.
+
+    The boto3 client is thread-safe and keeps its own connection pool, so one instance serves every
+    request thread. The aioboto3 client is bound to the event loop and is opened in the app lifespan.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__client = None
+        self.__async_client = None
+        self.__exit_stack = None
+
+    @staticmethod
+    def client_options() -> dict:
+        return dict(service_name='s3',
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    endpoint_url=settings.s3_endpoint_url,
+                    config=Config(max_pool_connections=settings.s3_max_pool_connections))
+
+    def get_client(self):
+        if self.__client is None:
+            with self.__lock:
+                if self.__client is None:
+                    self.__client = boto3.session.Session().client(**self.client_options())
+        return self.__client
+
+    @asynccontextmanager
+    async def async_client(self):
+        if self.__async_client is not None:
+            yield self.__async_client
+            return
+        async with aioboto3.Session().client(**self.client_options()) as s3:
+            yield s3
+
+    async def open(self):
+        self.get_client()
+        self.__exit_stack = AsyncExitStack()
+        self.__async_client = await self.__exit_stack.enter_async_context(
+            aioboto3.Session().client(**self.client_options()))
+
+    async def close(self):
+        self.__async_client = None
+        if self.__exit_stack is not None:
+            await self.__exit_stack.aclose()
+            self.__exit_stack = None
+        with self.__lock:
+            if self.__client is not None:
+                self.__client.close()
+                self.__client = None
+
+
+storage_clients = StorageClientRegistry()
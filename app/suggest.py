@@ -0,0 +1,142 @@
+import bisect
+import heapq
+import threading
+import unicodedata
+from peewee import JOIN, fn
+from . import models, schemas, pagination
+
+VIDEO = 'video'
+CHANNEL = 'channel'
+
+_MAX_CHAR = chr(0x10FFFF)
+SHORT_PREFIX_LENGTH = 3
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(char for char in text if not unicodedata.combining(char)).split())
+
+
+def index_keys(text: str) -> set[str]:
+    """Every word-aligned suffix of the normalized text, so 'cats' also completes 'Funny cats'."""
+    words = normalize(text).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+def short_prefixes(key: str) -> list[str]:
+    return [key[:length] for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1)]
+
+
+class PrefixIndex:
+    """Sorted array of (key, kind, id) tuples; completions for a prefix are a contiguous slice found by bisect.
+
+    Slices for prefixes of up to SHORT_PREFIX_LENGTH characters can cover most of the index, so the best
+    entries for those prefixes are kept in small precomputed candidate sets. Removed entries are dropped
+    from the sets, which are rebuilt from the slice only once fewer candidates are left than a caller asks
+    for. Weight increases of entries outside a candidate set are picked up by the next `replace`.
+    """
+
+    def __init__(self):
+        self.__keys = []
+        self.__entries = {}
+        self.__short = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def add(self, kind: str, item_id: int, text: str, weight: int = 0):
+        with self.__lock:
+            self.__remove((kind, item_id))
+            self.__entries[(kind, item_id)] = [text, weight]
+            for key in index_keys(text):
+                bisect.insort(self.__keys, (key, kind, item_id))
+                for short_prefix in short_prefixes(key):
+                    candidates = self.__short.get(short_prefix)
+                    if candidates is not None:
+                        candidates.add((kind, item_id))
+                        if len(candidates) > 2 * pagination.MAX_LIMIT:
+                            self.__short[short_prefix] = self.__best(candidates, pagination.MAX_LIMIT)
+
+    def remove(self, kind: str, item_id: int):
+        with self.__lock:
+            self.__remove((kind, item_id))
+
+    def add_weight(self, kind: str, item_id: int, delta: int):
+        with self.__lock:
+            entry = self.__entries.get((kind, item_id))
+            if entry is not None:
+                entry[1] += delta
+
+    def replace(self, items):
+        """Swap in a fresh index built from (kind, id, text, weight) tuples."""
+        entries = {(kind, item_id): [text, weight] for kind, item_id, text, weight in items}
+        keys = sorted((key, kind, item_id) for (kind, item_id), (text, _) in entries.items()
+                      for key in index_keys(text))
+        short = {}
+        for key, kind, item_id in keys:
+            for short_prefix in short_prefixes(key):
+                short.setdefault(short_prefix, set()).add((kind, item_id))
+        short = {short_prefix: set(heapq.nlargest(pagination.MAX_LIMIT, refs,
+                                                  key=lambda ref: (entries[ref][1], ref[1])))
+                 for short_prefix, refs in short.items()}
+        with self.__lock:
+            self.__keys, self.__entries, self.__short = keys, entries, short
+
+    def suggest(self, prefix: str, limit: int) -> list[schemas.Suggestion]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self.__lock:
+            if len(prefix) <= SHORT_PREFIX_LENGTH:
+                refs = self.__short.get(prefix)
+                if refs is None or len(refs) < limit:
+                    refs = self.__short[prefix] = self.__best(self.__slice(prefix), pagination.MAX_LIMIT)
+            else:
+                refs = self.__slice(prefix)
+            best = self.__best(refs, limit)
+            return [schemas.Suggestion(text=self.__entries[ref][0], kind=ref[0], id=ref[1])
+                    for ref in sorted(best, key=self.__rank, reverse=True)]
+
+    def __slice(self, prefix: str) -> set[tuple]:
+        lo = bisect.bisect_left(self.__keys, (prefix,))
+        hi = bisect.bisect_left(self.__keys, (prefix + _MAX_CHAR,), lo)
+        return {(kind, item_id) for _, kind, item_id in self.__keys[lo:hi]}
+
+    def __rank(self, ref: tuple):
+        return self.__entries[ref][1], ref[1]
+
+    def __best(self, refs, limit: int) -> set[tuple]:
+        return set(heapq.nlargest(limit, refs, key=self.__rank))
+
+    def __remove(self, ref: tuple):
+        entry = self.__entries.pop(ref, None)
+        if entry is None:
+            return
+        for key in index_keys(entry[0]):
+            position = bisect.bisect_left(self.__keys, (key, *ref))
+            if position < len(self.__keys) and self.__keys[position] == (key, *ref):
+                del self.__keys[position]
+            for short_prefix in short_prefixes(key):
+                candidates = self.__short.get(short_prefix)
+                if candidates is not None:
+                    candidates.discard(ref)
+
+
+def load_index(index: PrefixIndex):
+    """Rebuild `index` from the database; videos are weighted by views, channels by the views of their videos."""
+    videos = (models.Video
+              .select(models.Video.id, models.Video.video_name, models.Video.number_of_views)
+              .where(models.Video.is_published == True)
+              .tuples())
+    channels = (models.User
+                .select(models.User.id, models.User.username, fn.COALESCE(fn.SUM(models.Video.number_of_views), 0))
+                .join(models.Video, JOIN.LEFT_OUTER,
+                      on=((models.Video.author_id == models.User.id) & (models.Video.is_published == True)))
+                .group_by(models.User.id, models.User.username)
+                .tuples())
+    index.replace([(VIDEO, video_id, name, views) for video_id, name, views in videos] +
+                  [(CHANNEL, user_id, username, views) for user_id, username, views in channels])
+
+
+suggest_index = PrefixIndex()
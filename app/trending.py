@@ -0,0 +1,110 @@
+import bisect
+import datetime
+import heapq
+import threading
+import time
+from . import models
+from .config import settings
+
+# Scores are stored scaled by 2 ** ((t - epoch) / half_life) at the time of each event instead of being
+# decayed in place. Every score shrinks by the same factor as time passes, so the order never changes
+# and nothing has to be rewritten. The epoch is moved forward before the scale factors get too large.
+MAX_EXPONENT = 64
+
+
+class TrendingRanker:
+    """Time-decayed per-video scores with the best `top_k` videos kept in a sorted list."""
+
+    def __init__(self, half_life: float, top_k: int):
+        self.half_life = half_life
+        self.top_k = top_k
+        self.__epoch = time.time()
+        self.__scores = {}
+        self.__top = []
+        self.__top_ids = set()
+        self.__lock = threading.Lock()
+
+    def record(self, video_id: int, weight: float, at: float | None = None):
+        at = time.time() if at is None else at
+        with self.__lock:
+            self.__rescale(at)
+            old_score = self.__scores.get(video_id, 0.0)
+            new_score = old_score + weight * 2 ** ((at - self.__epoch) / self.half_life)
+            self.__scores[video_id] = new_score
+            if video_id in self.__top_ids:
+                if new_score < old_score:
+                    self.__rebuild_top()
+                    return
+                del self.__top[bisect.bisect_left(self.__top, (old_score, video_id))]
+                bisect.insort(self.__top, (new_score, video_id))
+            elif len(self.__top) < self.top_k or (new_score, video_id) > self.__top[0]:
+                bisect.insort(self.__top, (new_score, video_id))
+                self.__top_ids.add(video_id)
+                if len(self.__top) > self.top_k:
+                    self.__top_ids.discard(self.__top.pop(0)[1])
+
+    def remove(self, video_id: int):
+        with self.__lock:
+            if self.__scores.pop(video_id, None) is not None and video_id in self.__top_ids:
+                self.__rebuild_top()
+
+    def replace(self, events):
+        """Reset all scores from (video_id, weight, timestamp) events."""
+        epoch = time.time()
+        scores = {}
+        for video_id, weight, at in events:
+            scores[video_id] = scores.get(video_id, 0.0) + weight * 2 ** ((at - epoch) / self.half_life)
+        with self.__lock:
+            self.__epoch, self.__scores = epoch, scores
+            self.__rebuild_top()
+
+    def top(self, limit: int) -> list[int]:
+        with self.__lock:
+            return [video_id for score, video_id in reversed(self.__top[-limit:]) if score > 0]
+
+    def __rebuild_top(self):
+        self.__top = sorted(heapq.nlargest(self.top_k, ((score, video_id)
+                                                        for video_id, score in self.__scores.items())))
+        self.__top_ids = {video_id for _, video_id in self.__top}
+
+    def __rescale(self, now: float):
+        exponent = int((now - self.__epoch) / self.half_life)
+        if exponent < MAX_EXPONENT:
+            return
+        factor = 2.0 ** -exponent
+        self.__epoch += exponent * self.half_life
+        self.__scores = {video_id: score * factor for video_id, score in self.__scores.items()}
+        self.__top = [(score * factor, video_id) for score, video_id in self.__top]
+
+
+def load_scores(ranker: TrendingRanker):
+    """Rebuild `ranker` from the events of the last `trending_window_half_lives` half-lives."""
+    since = time.time() - settings.trending_window_half_lives * ranker.half_life
+    since_dt = datetime.datetime.fromtimestamp(since)
+    views = (models.Viewer
+             .select(models.Viewer.video, models.Viewer.viewing_time)
+             .where(models.Viewer.viewing_time >= since_dt)
+             .tuples().iterator())
+    reactions = (models.Reaction
+                 .select(models.Reaction.video, models.Reaction.is_like, models.Reaction.is_dislike,
+                         models.Reaction.reacted_at)
+                 .where((models.Reaction.reacted_at >= since_dt) &
+                        ((models.Reaction.is_like == True) | (models.Reaction.is_dislike == True)))
+                 .tuples().iterator())
+    comments = (models.Comment
+                .select(models.Comment.video_id, models.Comment.published_at)
+                .where(models.Comment.published_at >= since_dt)
+                .tuples().iterator())
+
+    def events():
+        for video_id, viewing_time in views:
+            yield video_id, settings.trending_view_weight, viewing_time.timestamp()
+        for video_id, is_like, is_dislike, reacted_at in reactions:
+            yield video_id, settings.trending_reaction_weight * (is_like - is_dislike), reacted_at.timestamp()
+        for video_id, published_at in comments:
+            yield video_id, settings.trending_comment_weight, published_at.timestamp()
+
+    ranker.replace(events())
+
+
+ranker = TrendingRanker(half_life=settings.trending_half_life_hours * 3600, top_k=settings.trending_top_k)
@@ -1,81 +1,159 @@
-import boto3
-import os
+import asyncio
+import logging
+from boto3.s3.transfer import TransferConfig
 from dotenv import load_dotenv
-from app import schemas, crud, errors
+from app import schemas, crud, errors, metrics
+from app.config import settings
+from app.presign import presigned_urls
+from app.storage import storage_clients
 from botocore.exceptions import ClientError
-import asyncio
-import aioboto3
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 
 class VideoManager:
-    __AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
-    __AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
     __BUCKET_NAME_FOR_VIDEOS = 'just-watch-videos'
     __BUCKET_NAME_FOR_PREVIEWS = 'just-watch-video-preview'
 
+    __TRANSFER_CONFIG = TransferConfig(multipart_chunksize=settings.s3_multipart_chunksize,
+                                       max_concurrency=settings.s3_multipart_concurrency)
+
     @staticmethod
     async def upload_video(video_file, video_name: str, video_description: str, author_id: int, video_image_preview):
         if video_name == '':
             raise errors.VideoNameEmptyError
         video_base = schemas.VideoCreate(video_name=video_name, description=video_description)
-        db_video = crud.create_video(video_base, author_id)
-        session = aioboto3.Session()
-        async with session.client(service_name='s3', aws_access_key_id=VideoManager.__AWS_ACCESS_KEY_ID,
-                                  aws_secret_access_key=VideoManager.__AWS_SECRET_ACCESS_KEY,
-                                  endpoint_url='https://storage.yandexcloud.net') as s3:
-            await s3.upload_fileobj(video_file, VideoManager.__BUCKET_NAME_FOR_VIDEOS, str(db_video.id))
-            await s3.upload_fileobj(video_image_preview, VideoManager.__BUCKET_NAME_FOR_PREVIEWS, str(db_video.id))
+        db_video = crud.create_video(video_base, author_id, is_published=False)
+        key = str(db_video.id)
+        uploads = [(VideoManager.__BUCKET_NAME_FOR_VIDEOS, video_file),
+                   (VideoManager.__BUCKET_NAME_FOR_PREVIEWS, video_image_preview)]
+        async with storage_clients.async_client() as s3:
+            try:
+                results = await asyncio.gather(
+                    *[VideoManager.__upload_fileobj(s3, file, bucket, key) for bucket, file in uploads],
+                    return_exceptions=True)
+                failure = next((result for result in results if isinstance(result, BaseException)), None)
+                if failure is not None:
+                    raise errors.VideoUploadError from failure
+            except BaseException:
+                await asyncio.gather(*[VideoManager.__discard_upload(s3, bucket, key) for bucket, _ in uploads],
+                                     return_exceptions=True)
+                try:
+                    crud.discard_video(db_video.id)
+                except Exception:
+                    logger.exception('Failed to delete video %s after its upload failed', db_video.id)
+                raise
+        crud.publish_video(db_video.id)
         return db_video
 
+    @staticmethod
+    async def __upload_fileobj(s3, file, bucket: str, key: str):
+        with metrics.s3_timer('upload_fileobj'):
+            await s3.upload_fileobj(file, bucket, key, Config=VideoManager.__TRANSFER_CONFIG)
+
+    @staticmethod
+    async def __discard_upload(s3, bucket: str, key: str):
+        with metrics.s3_timer('list_multipart_uploads'):
+            pending_uploads = await s3.list_multipart_uploads(Bucket=bucket, Prefix=key)
+        for pending_upload in pending_uploads.get('Uploads', []):
+            if pending_upload['Key'] == key:
+                with metrics.s3_timer('abort_multipart_upload'):
+                    await s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=pending_upload['UploadId'])
+        with metrics.s3_timer('delete_objects'):
+            await s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key}]})
+
+    @staticmethod
+    def start_upload_session(video_name: str, video_description: str, author_id: int):
+        if video_name == '':
+            raise errors.VideoNameEmptyError
+        video_base = schemas.VideoCreate(video_name=video_name, description=video_description)
+        db_video = crud.create_video(video_base, author_id, is_published=False)
+        s3 = storage_clients.get_client()
+        with metrics.s3_timer('create_multipart_upload'):
+            response = s3.create_multipart_upload(Bucket=VideoManager.__BUCKET_NAME_FOR_VIDEOS, Key=str(db_video.id),
+                                                  ContentType='video/mp4')
+        return crud.create_upload_session(author_id, db_video.id, response['UploadId'])
+
+    @staticmethod
+    async def upload_session_part(session, part_number: int, stream):
+        if not 1 <= part_number <= 10000:
+            raise errors.InvalidPartNumber
+        data = bytearray()
+        async for chunk in stream:
+            data += chunk
+            if len(data) > settings.upload_part_max_size:
+                raise errors.PartTooLarge
+        async with storage_clients.async_client() as s3:
+            with metrics.s3_timer('upload_part'):
+                response = await s3.upload_part(Bucket=VideoManager.__BUCKET_NAME_FOR_VIDEOS,
+                                                Key=str(session.video_id), UploadId=session.s3_upload_id,
+                                                PartNumber=part_number, Body=data)
+        crud.save_uploaded_part(session.id, part_number, response['ETag'], len(data))
+
+    @staticmethod
+    async def upload_session_preview(session, video_image_preview):
+        async with storage_clients.async_client() as s3:
+            with metrics.s3_timer('upload_fileobj'):
+                await s3.upload_fileobj(video_image_preview, VideoManager.__BUCKET_NAME_FOR_PREVIEWS,
+                                        str(session.video_id))
+        crud.mark_upload_session_preview(session.id)
+
+    @staticmethod
+    def complete_upload_session(session) -> int:
+        if not session.has_preview:
+            raise errors.PreviewMissingError
+        parts = [{'PartNumber': part.part_number, 'ETag': part.etag} for part in crud.get_uploaded_parts(session.id)]
+        s3 = storage_clients.get_client()
+        try:
+            with metrics.s3_timer('complete_multipart_upload'):
+                s3.complete_multipart_upload(Bucket=VideoManager.__BUCKET_NAME_FOR_VIDEOS, Key=str(session.video_id),
+                                             UploadId=session.s3_upload_id, MultipartUpload={'Parts': parts})
+        except ClientError:
+            raise errors.VideoUploadError
+        crud.delete_upload_session(session.id)
+        crud.publish_video(session.video_id)
+        return session.video_id
+
+    @staticmethod
+    def abort_upload_session(session):
+        s3 = storage_clients.get_client()
+        with metrics.s3_timer('abort_multipart_upload'):
+            s3.abort_multipart_upload(Bucket=VideoManager.__BUCKET_NAME_FOR_VIDEOS, Key=str(session.video_id),
+                                      UploadId=session.s3_upload_id)
+        with metrics.s3_timer('delete_objects'):
+            s3.delete_objects(Bucket=VideoManager.__BUCKET_NAME_FOR_PREVIEWS,
+                              Delete={'Objects': [{'Key': str(session.video_id)}]})
+        crud.discard_video(session.video_id)
+
     @staticmethod
     def get_video_url_by_id(video_id: int):
-        expire = 3600
-        session = boto3.session.Session()
-        s3 = session.client(
-            service_name='s3',
-            aws_access_key_id=VideoManager.__AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=VideoManager.__AWS_SECRET_ACCESS_KEY,
-            endpoint_url='https://storage.yandexcloud.net'
-        )
         try:
-            response = s3.generate_presigned_url('get_object',
-                                                 Params={'Bucket': VideoManager.__BUCKET_NAME_FOR_VIDEOS,
-                                                         'Key': str(video_id)},
-                                                 ExpiresIn=expire)
+            response = presigned_urls.get_url(VideoManager.__BUCKET_NAME_FOR_VIDEOS, str(video_id))
         except ClientError:
             raise errors.VideoNotExist
         return response
 
     @staticmethod
     def get_video_image_preview_url(video_id: int):
-        expire = 3600
-        session = boto3.session.Session()
-        s3 = session.client(
-            service_name='s3',
-            aws_access_key_id=VideoManager.__AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=VideoManager.__AWS_SECRET_ACCESS_KEY,
-            endpoint_url='https://storage.yandexcloud.net'
-        )
         try:
-            response = s3.generate_presigned_url('get_object',
-                                                 Params={'Bucket': VideoManager.__BUCKET_NAME_FOR_PREVIEWS,
-                                                         'Key': str(video_id)},
-                                                 ExpiresIn=expire)
+            response = presigned_urls.get_url(VideoManager.__BUCKET_NAME_FOR_PREVIEWS, str(video_id))
             return response
         except ClientError:
             return None
 
+    @staticmethod
+    def get_video_image_preview_urls(video_ids: list[int]) -> dict[int, str | None]:
+        urls = presigned_urls.get_urls(VideoManager.__BUCKET_NAME_FOR_PREVIEWS,
+                                       [str(video_id) for video_id in video_ids])
+        return {video_id: urls[str(video_id)] for video_id in video_ids}
+
     @staticmethod
     def delete_video(video_id: int):
-        session = boto3.session.Session()
-        s3 = session.client(
-            service_name='s3',
-            aws_access_key_id=VideoManager.__AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=VideoManager.__AWS_SECRET_ACCESS_KEY,
-            endpoint_url='https://storage.yandexcloud.net'
-        )
+        s3 = storage_clients.get_client()
         forDeletion = [{'Key': str(video_id)}]
-        response = s3.delete_objects(Bucket=VideoManager.__BUCKET_NAME_FOR_VIDEOS, Delete={'Objects': forDeletion})
-        response = s3.delete_objects(Bucket=VideoManager.__BUCKET_NAME_FOR_PREVIEWS, Delete={'Objects': forDeletion})
+        with metrics.s3_timer('delete_objects'):
+            response = s3.delete_objects(Bucket=VideoManager.__BUCKET_NAME_FOR_VIDEOS, Delete={'Objects': forDeletion})
+        with metrics.s3_timer('delete_objects'):
+            response = s3.delete_objects(Bucket=VideoManager.__BUCKET_NAME_FOR_PREVIEWS,
+                                         Delete={'Objects': forDeletion})
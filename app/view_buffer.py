@@ -0,0 +1,96 @@
+import datetime
+import logging
+import queue
+import threading
+import time
+from . import crud, async_crud
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ViewBuffer:
+    """Collects view events in memory and writes them to the database in batches.
+
+    Events are flushed by a background thread every ``flush_interval`` seconds or as soon as
+    ``flush_size`` of them are pending. When the queue is full, ``record`` waits up to
+    ``put_timeout`` seconds and then writes the event itself, so memory stays bounded.
+    """
+
+    def __init__(self, maxsize: int, flush_interval: float, flush_size: int, put_timeout: float):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='view-buffer-flusher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        async_crud.with_connection(self.flush)
+
+    def record(self, user_id: int, video_id: int):
+        event = (user_id, video_id, datetime.datetime.now())
+        if self._thread is None:
+            async_crud.with_connection(self._write, [event])
+            return
+        try:
+            self._queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            # The caller holds no database connection, so the fallback write opens its own.
+            async_crud.with_connection(self._write, [event])
+
+    def flush(self):
+        events = self._drain(len(self._queue.queue))
+        if events:
+            self._write(events)
+
+    def _drain(self, max_events: int) -> list:
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _run(self):
+        while not self._stopping.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            events = []
+            while len(events) < self.flush_size and not self._stopping.is_set():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    events.append(self._queue.get(timeout=min(timeout, 0.1)))
+                except queue.Empty:
+                    continue
+                events.extend(self._drain(self.flush_size - len(events)))
+            if events:
+                try:
+                    async_crud.with_connection(self._write, events)
+                except Exception:
+                    logger.exception('Failed to flush %d view events', len(events))
+
+    def _write(self, events: list):
+        with self._flush_lock:
+            crud.record_views(events)
+
+
+view_buffer = ViewBuffer(maxsize=settings.view_buffer_size,
+                         flush_interval=settings.view_flush_interval_ms / 1000,
+                         flush_size=settings.view_flush_batch_size,
+                         put_timeout=settings.view_buffer_put_timeout)
@@ -0,0 +1,215 @@
+"""Throughput and p50/p95/p99 latency of the JSON-RPC API under concurrent load.
+
+Needs a database filled by `benchmarks.generate`; pass the same `--users` and `--videos`. Unless
+`--url` points at a server that is already running, it starts the local S3 stand-in from
+`benchmarks.s3` and `uvicorn app.main:app` with `s3_endpoint_url` pointing at it. Every scenario
+sends `--requests` calls from `--concurrency` concurrent clients. The results are printed and
+written as JSON to `--output` together with the commit they were measured on; `--baseline` prints
+the change against an earlier result file.
+
+    python -m benchmarks.api --output before.json
+    python -m benchmarks.api --output after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+from benchmarks import generate, s3
+
+SCENARIOS = ['login', 'get_all_videos_inf', 'get_video_show_inf_by_id', 'watch_video', 'rate_video', 'upload']
+# Just enough bytes for the content-type checks; moto does not look at the content.
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+class RpcError(Exception):
+    pass
+
+
+class Client:
+    def __init__(self, http: httpx.AsyncClient, users: int, videos: int, upload_size: int):
+        self.http = http
+        self.tokens = None
+        self.users = users
+        self.videos = videos
+        self.video_data = os.urandom(upload_size)
+        self.ids = itertools.count()
+        self.rng = random.Random(0)
+
+    async def call(self, method: str, params: dict, token: str | None = None):
+        headers = {'access-token': token} if token else {}
+        response = await self.http.post('/api', headers=headers, json={'jsonrpc': '2.0', 'id': next(self.ids),
+                                                                        'method': method, 'params': params})
+        response.raise_for_status()
+        body = response.json()
+        if 'error' in body:
+            raise RpcError(body['error'])
+        return body['result']
+
+    def video_id(self) -> int:
+        return generate.popular_video(self.rng, self.videos)
+
+    async def login(self):
+        user_number = self.rng.randint(1, self.users)
+        return await self.call('login', {'user_data': {'email': generate.email(user_number),
+                                                       'password': generate.PASSWORD}})
+
+    async def get_all_videos_inf(self):
+        await self.call('get_all_videos_inf', {'limit': 20}, next(self.tokens))
+
+    async def get_video_show_inf_by_id(self):
+        await self.call('get_video_show_inf_by_id', {'video_id': self.video_id()}, next(self.tokens))
+
+    async def watch_video(self):
+        await self.call('watch_video', {'video_id': self.video_id()}, next(self.tokens))
+
+    async def rate_video(self):
+        reaction = self.rng.choice(['like', 'dislike'])
+        await self.call('rate_video', {'video_id': self.video_id(), 'user_reaction': reaction}, next(self.tokens))
+
+    async def upload(self):
+        response = await self.http.post('/api/upload-video-file',
+                                        params={'video_name': 'benchmark upload', 'video_descr': ''},
+                                        headers={'access-token': next(self.tokens)},
+                                        files={'video_data': ('video.mp4', self.video_data, 'video/mp4'),
+                                               'preview_image_data': ('preview.png', PNG_HEADER, 'image/png')})
+        response.raise_for_status()
+
+
+def summarize(latencies: list[float], errors: int, seconds: float) -> dict:
+    result = {'requests': len(latencies) + errors, 'errors': errors,
+              'throughput_rps': round((len(latencies) + errors) / seconds, 1)}
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100)
+        result.update(p50_ms=round(percentiles[49], 2), p95_ms=round(percentiles[94], 2),
+                      p99_ms=round(percentiles[98], 2))
+    return result
+
+
+async def run_scenario(client: Client, name: str, requests: int, concurrency: int) -> dict:
+    scenario = getattr(client, name)
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                await scenario()
+            except (RpcError, httpx.HTTPError):
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run(args) -> dict:
+    async with httpx.AsyncClient(base_url=args.url, timeout=60,
+                                 limits=httpx.Limits(max_connections=args.concurrency)) as http:
+        client = Client(http, args.users, args.videos, args.upload_size)
+        tokens = [(await client.login())['access_token'] for _ in range(args.sessions)]
+        client.tokens = itertools.cycle(tokens)
+        results = {}
+        for name in args.scenarios:
+            requests = args.login_requests if name == 'login' else args.upload_requests if name == 'upload' \
+                else args.requests
+            results[name] = await run_scenario(client, name, requests, args.concurrency)
+            print(name, json.dumps(results[name]), file=sys.stderr)
+        return results
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            httpx.post(f'{url}/api', json=[], timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.5)
+    raise RuntimeError('server did not start in time')
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict):
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ['throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms']:
+            if before.get(key) and result.get(key) is not None:
+                changes.append(f'{key} {result[key] / before[key] - 1:+.1%}')
+        print(f'{name:<26} ' + '  '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='benchmark a server that is already running instead of starting one')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--s3-port', type=int, default=5100)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--videos', type=int, default=1000000)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--login-requests', type=int, default=200)
+    parser.add_argument('--upload-requests', type=int, default=200)
+    parser.add_argument('--upload-size', type=int, default=1024 * 1024)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--sessions', type=int, default=20, help='logged in users the other scenarios rotate through')
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    args = parser.parse_args()
+
+    s3_server = server = None
+    if args.url is None:
+        s3_server, endpoint_url = s3.start(port=args.s3_port)
+        args.url = f'http://127.0.0.1:{args.port}'
+        server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(args.port),
+                                   '--workers', str(args.workers), '--no-access-log', '--log-level', 'warning'],
+                                  env={**os.environ, 's3_endpoint_url': endpoint_url})
+    try:
+        if server is not None:
+            wait_until_ready(args.url, server)
+        results = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if s3_server is not None:
+            s3_server.stop()
+
+    report = {'commit': current_commit(), 'measured_at': datetime.datetime.now().isoformat(timespec='seconds'),
+              'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+              'results': results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Latency of the subscription feed for a reader following many channels.
+
+Creates `--authors` channels with `--videos-per-author` videos each and one reader subscribed to
+all of them, then reports p50/p95/p99 of `get_feed_page` twice: once with every channel fanned out
+into the reader's feed and once with every channel treated as large and merged at read time. The
+cost of fanning one video out to `--subscribers` subscribers is reported as well. By default it runs
+against the Postgres database from the usual environment variables; pass `--sqlite PATH` to use a
+local SQLite file instead. The target tables are dropped and recreated.
+
+    python -m benchmarks.feed --authors 1000
+"""
+import argparse
+import datetime
+import json
+import random
+import statistics
+import time
+import peewee
+
+from app import models, feed, pagination
+from app.config import settings
+
+TABLES = [models.User, models.Video, models.Subscriber, models.FeedItem]
+BATCH_SIZE = 10000
+
+
+def insert_batches(model, rows: list, fields: list):
+    for start in range(0, len(rows), BATCH_SIZE):
+        model.insert_many(rows[start:start + BATCH_SIZE], fields=fields).execute()
+
+
+def fill(db, authors: int, videos_per_author: int, subscribers: int, rng: random.Random) -> int:
+    db.drop_tables(TABLES)
+    db.create_tables(TABLES)
+    now = datetime.datetime.now()
+    with db.atomic():
+        insert_batches(models.User, [(f'user{i}@mail.ru', f'user{i}', '') for i in range(authors + subscribers + 1)],
+                       [models.User.email, models.User.username, models.User.hashed_password])
+        reader_id = authors + 1
+        insert_batches(models.Subscriber, [(reader_id, author_id) for author_id in range(1, authors + 1)],
+                       [models.Subscriber.subscriber, models.Subscriber.author])
+        insert_batches(models.Video,
+                       [(f'video {author_id}', author_id, now - datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 90)))
+                        for author_id in range(1, authors + 1) for _ in range(videos_per_author)],
+                       [models.Video.video_name, models.Video.author_id, models.Video.creation_time])
+        models.User.update(number_of_subscribers=1).where(models.User.id <= authors).execute()
+        for author_id in range(1, authors + 1):
+            feed.backfill(reader_id, author_id)
+    return reader_id
+
+
+def percentiles(latencies: list[float]) -> dict:
+    values = statistics.quantiles(latencies, n=100)
+    return {'p50_ms': values[49], 'p95_ms': values[94], 'p99_ms': values[98]}
+
+
+def measure_reads(reader_id: int, pages: int, limit: int) -> dict:
+    latencies = []
+    cursor = None
+    for _ in range(pages):
+        started = time.perf_counter()
+        _, cursor = feed.get_feed_page(reader_id, cursor, limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return percentiles(latencies)
+
+
+def measure_fan_out(db, author_id: int, subscribers: int, first_subscriber_id: int, repeats: int) -> dict:
+    with db.atomic():
+        insert_batches(models.Subscriber,
+                       [(subscriber_id, author_id)
+                        for subscriber_id in range(first_subscriber_id, first_subscriber_id + subscribers)],
+                       [models.Subscriber.subscriber, models.Subscriber.author])
+        models.User.update(number_of_subscribers=subscribers).where(models.User.id == author_id).execute()
+    latencies = []
+    for _ in range(repeats):
+        video = models.Video.create(video_name='fan out', author_id=author_id)
+        started = time.perf_counter()
+        with db.atomic():
+            feed.fan_out(video.id, author_id, video.creation_time)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return percentiles(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--videos-per-author', type=int, default=20)
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=pagination.DEFAULT_LIMIT)
+    parser.add_argument('--sqlite')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    if args.sqlite:
+        db = peewee.SqliteDatabase(args.sqlite)
+        db.bind(TABLES)
+    else:
+        db = models.Video._meta.database
+    db.connect()
+    try:
+        settings.feed_fanout_max_subscribers = max(args.subscribers, 1)
+        reader_id = fill(db, args.authors, args.videos_per_author, args.subscribers, rng)
+        fanned_out = measure_reads(reader_id, args.pages, args.limit)
+        settings.feed_fanout_max_subscribers = 0
+        merged = measure_reads(reader_id, args.pages, args.limit)
+        settings.feed_fanout_max_subscribers = max(args.subscribers, 1)
+        fan_out = measure_fan_out(db, 1, args.subscribers, reader_id + 1, max(args.pages // 10, 10))
+    finally:
+        db.close()
+    print(json.dumps({'authors': args.authors, 'videos_per_author': args.videos_per_author,
+                      'fanned_out_read': fanned_out, 'merged_read': merged,
+                      'fan_out_write': {'subscribers': args.subscribers, **fan_out}}))
+
+
+if __name__ == '__main__':
+    main()
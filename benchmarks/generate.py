@@ -0,0 +1,160 @@
+"""Synthetic data set for the API benchmarks.
+
+Creates `--users` users, `--videos` published videos, `--views` views, a share of reactions and a
+number of subscriptions per user with bulk `insert_many`, then rebuilds the denormalized counters.
+Every user is `user<N>@example.com` with the password `benchmark`. Video popularity is skewed, so a
+small share of videos gets most of the views. The same `--seed` always produces the same data.
+
+By default it writes to the Postgres database from the usual environment variables; pass
+`--sqlite PATH` to use a local SQLite file instead. All tables are dropped and recreated.
+
+    python -m benchmarks.generate --users 100000 --videos 1000000 --views 50000000
+"""
+import argparse
+import datetime
+import json
+import random
+import time
+import peewee
+
+from app import models, counters, passwords
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer,
+          models.FeedItem, models.RelatedVideo, models.JobWatermark, models.UploadSession, models.UploadedPart]
+PASSWORD = 'benchmark'
+BATCH_SIZE = 10000
+HISTORY = datetime.timedelta(days=365)
+# Larger values concentrate views on fewer videos.
+POPULARITY_SKEW = 3
+
+
+def email(user_number: int) -> str:
+    return f'user{user_number}@example.com'
+
+
+def insert_batches(db, model, rows, fields: list) -> int:
+    """Insert rows from an iterable in BATCH_SIZE transactions, so nothing bigger than a batch is held in memory."""
+    total, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            with db.atomic():
+                model.insert_many(batch, fields=fields).execute()
+            total, batch = total + len(batch), []
+    if batch:
+        with db.atomic():
+            model.insert_many(batch, fields=fields).execute()
+        total += len(batch)
+    return total
+
+
+def popular_video(rng: random.Random, videos: int) -> int:
+    return int(videos * rng.random() ** POPULARITY_SKEW) + 1
+
+
+def distinct_videos(rng: random.Random, videos: int, count: int) -> set[int]:
+    if count * 2 > videos:
+        return set(rng.sample(range(1, videos + 1), min(count, videos)))
+    picked = set()
+    while len(picked) < count:
+        picked.add(popular_video(rng, videos))
+    return picked
+
+
+def generate_users(users: int, hashed_password: str):
+    for number in range(1, users + 1):
+        yield email(number), f'user{number}', hashed_password
+
+
+def generate_videos(rng: random.Random, videos: int, users: int, now: datetime.datetime):
+    for number in range(1, videos + 1):
+        yield (f'video {number}', f'description of video {number}', rng.randint(1, users),
+               now - HISTORY * rng.random(), True)
+
+
+def generate_views(rng: random.Random, views: int, users: int, videos: int, now: datetime.datetime):
+    per_user, extra = divmod(views, users)
+    for user_id in range(1, users + 1):
+        for video_id in distinct_videos(rng, videos, per_user + (user_id <= extra)):
+            yield user_id, video_id, now - HISTORY * rng.random()
+
+
+def generate_reactions(rng: random.Random, reactions: int, users: int, videos: int, now: datetime.datetime):
+    per_user, extra = divmod(reactions, users)
+    for user_id in range(1, users + 1):
+        for video_id in distinct_videos(rng, videos, per_user + (user_id <= extra)):
+            is_like = rng.random() < 0.9
+            yield user_id, video_id, is_like, not is_like, now - HISTORY * rng.random()
+
+
+def generate_subscriptions(rng: random.Random, subscriptions_per_user: int, users: int):
+    for user_id in range(1, users + 1):
+        authors = set()
+        while len(authors) < min(subscriptions_per_user, users - 1):
+            author_id = popular_video(rng, users)
+            if author_id != user_id:
+                authors.add(author_id)
+        for author_id in authors:
+            yield user_id, author_id
+
+
+def fill(db, users: int, videos: int, views: int, reactions: int, subscriptions_per_user: int,
+         rng: random.Random) -> dict:
+    db.drop_tables(TABLES)
+    db.create_tables(TABLES)
+    now = datetime.datetime.now()
+    timings = {}
+
+    def timed(name, func, *args):
+        started = time.perf_counter()
+        count = func(*args)
+        timings[name] = {'rows': count, 'seconds': round(time.perf_counter() - started, 2)}
+
+    timed('users', insert_batches, db, models.User, generate_users(users, passwords.pwd_context.hash(PASSWORD)),
+          [models.User.email, models.User.username, models.User.hashed_password])
+    timed('videos', insert_batches, db, models.Video, generate_videos(rng, videos, users, now),
+          [models.Video.video_name, models.Video.description, models.Video.author_id, models.Video.creation_time,
+           models.Video.is_published])
+    timed('views', insert_batches, db, models.Viewer, generate_views(rng, views, users, videos, now),
+          [models.Viewer.viewer, models.Viewer.video, models.Viewer.viewing_time])
+    timed('reactions', insert_batches, db, models.Reaction, generate_reactions(rng, reactions, users, videos, now),
+          [models.Reaction.user, models.Reaction.video, models.Reaction.is_like, models.Reaction.is_dislike,
+           models.Reaction.reacted_at])
+    timed('subscriptions', insert_batches, db, models.Subscriber,
+          generate_subscriptions(rng, subscriptions_per_user, users),
+          [models.Subscriber.subscriber, models.Subscriber.author])
+    started = time.perf_counter()
+    counters.reconcile_counters()
+    timings['counters'] = {'seconds': round(time.perf_counter() - started, 2)}
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--videos', type=int, default=1000000)
+    parser.add_argument('--views', type=int, default=50000000)
+    parser.add_argument('--reactions', type=int, default=None, help='defaults to 5%% of --views')
+    parser.add_argument('--subscriptions-per-user', type=int, default=20)
+    parser.add_argument('--sqlite')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    reactions = args.views // 20 if args.reactions is None else args.reactions
+
+    if args.sqlite:
+        db = peewee.SqliteDatabase(args.sqlite)
+        db.bind(TABLES)
+    else:
+        db = models.Video._meta.database
+    db.connect()
+    try:
+        timings = fill(db, args.users, args.videos, args.views, reactions, args.subscriptions_per_user, rng)
+    finally:
+        db.close()
+    print(json.dumps({'users': args.users, 'videos': args.videos, 'views': args.views, 'reactions': reactions,
+                      'seed': args.seed, 'timings': timings}))
+
+
+if __name__ == '__main__':
+    main()
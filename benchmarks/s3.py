@@ -0,0 +1,47 @@
+"""Local S3 stand-in for the benchmarks, so uploads and presigned URLs never reach storage.yandexcloud.net.
+
+Runs moto in server mode and creates the buckets the app uses. Point the app at it with the
+`s3_endpoint_url` environment variable. It can also be started on its own:
+
+    python -m benchmarks.s3 --port 5000
+"""
+import argparse
+import threading
+import boto3
+from moto.server import ThreadedMotoServer
+
+from app.config import settings
+
+BUCKETS = ['just-watch-videos', 'just-watch-video-preview', 'just-watch-avatars']
+
+
+def start(host: str = '127.0.0.1', port: int = 5000) -> tuple[ThreadedMotoServer, str]:
+    """Start moto and create the buckets; returns the server and its endpoint URL."""
+    server = ThreadedMotoServer(ip_address=host, port=port)
+    server.start()
+    endpoint_url = f'http://{host}:{port}'
+    s3 = boto3.session.Session().client('s3', endpoint_url=endpoint_url, region_name='us-east-1',
+                                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
+    for bucket in BUCKETS:
+        s3.create_bucket(Bucket=bucket)
+    return server, endpoint_url
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    server, endpoint_url = start(args.host, args.port)
+    print(f's3_endpoint_url={endpoint_url}', flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
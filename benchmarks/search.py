@@ -0,0 +1,87 @@
+"""Latency of `search_videos` on a synthetic corpus.
+
+Fills a database with `--videos` videos spread over `--channels` channels, installs the search
+index and reports p50/p95/p99 latency over `--queries` random queries. By default it runs against
+the Postgres database from the usual environment variables; pass `--sqlite PATH` to use a local
+SQLite file instead. The target tables are dropped and recreated.
+
+    python -m benchmarks.search --videos 1000000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import peewee
+
+from app import models, search
+
+WORDS = ['cat', 'dog', 'music', 'guitar', 'cooking', 'pasta', 'travel', 'mountain', 'river', 'football', 'chess',
+         'lesson', 'review', 'unboxing', 'live', 'stream', 'news', 'game', 'speedrun', 'tutorial', 'python', 'peewee',
+         'postgres', 'funny', 'compilation', 'morning', 'evening', 'vlog', 'city', 'winter', 'summer', 'garden']
+TABLES = [models.User, models.Video]
+BATCH_SIZE = 10000
+
+
+def sentence(rng: random.Random, length: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+
+def fill(db, videos: int, channels: int, rng: random.Random):
+    if isinstance(db, peewee.SqliteDatabase):
+        db.execute_sql('DROP TABLE IF EXISTS video_search')
+    db.drop_tables(TABLES)
+    db.create_tables(TABLES)
+    with db.atomic():
+        for start in range(0, channels, BATCH_SIZE):
+            models.User.insert_many(
+                [(f'channel{i}@mail.ru', f'{rng.choice(WORDS)}_{i}', '')
+                 for i in range(start, min(start + BATCH_SIZE, channels))],
+                fields=[models.User.email, models.User.username, models.User.hashed_password]).execute()
+    for start in range(0, videos, BATCH_SIZE):
+        with db.atomic():
+            models.Video.insert_many(
+                [(sentence(rng, 3), sentence(rng, 12), rng.randint(1, channels))
+                 for _ in range(start, min(start + BATCH_SIZE, videos))],
+                fields=[models.Video.video_name, models.Video.description, models.Video.author_id]).execute()
+    search.install(db)
+
+
+def measure(queries: int, limit: int, rng: random.Random) -> dict:
+    latencies = []
+    for _ in range(queries):
+        query = sentence(rng, rng.randint(1, 2))
+        started = time.perf_counter()
+        search.search_videos(query, None, limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {'queries': queries, 'p50_ms': percentiles[49], 'p95_ms': percentiles[94], 'p99_ms': percentiles[98]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--videos', type=int, default=1000000)
+    parser.add_argument('--channels', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--sqlite')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    if args.sqlite:
+        db = peewee.SqliteDatabase(args.sqlite)
+        db.bind(TABLES)
+    else:
+        db = models.Video._meta.database
+    db.connect()
+    try:
+        fill(db, args.videos, args.channels, rng)
+        result = measure(args.queries, args.limit, rng)
+    finally:
+        db.close()
+    print(json.dumps({'videos': args.videos, **result}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Per-request cost of turning an access token into a user id.
+
+Run from the repository root with the usual environment variables set:
+
+    python -m benchmarks.token_verification
+"""
+import timeit
+from datetime import timedelta
+from jose import jwt
+
+from app import authentication
+from app.config import settings
+
+TokenManager = authentication.TokenManager
+NUMBER = 20000
+
+
+def uncached_jose(token: str) -> int:
+    return int(jwt.decode(token, settings.secret_key, algorithms=['HS256'])['user_id'])
+
+
+def report(name: str, func, token: str):
+    seconds = min(timeit.repeat(lambda: func(token), number=NUMBER, repeat=3))
+    print(f'{name:<24} {seconds / NUMBER * 1e6:8.2f} us/request')
+
+
+def main():
+    token = TokenManager.create_token(1, timedelta(minutes=15))
+    report('jose, no cache', uncached_jose, token)
+    if authentication.pyjwt is not None:
+        report('pyjwt, no cache',
+               lambda value: authentication.pyjwt.decode(value, settings.secret_key, algorithms=['HS256']), token)
+    report('TokenManager, cached', TokenManager.try_get_user_id_from_token, token)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+from datetime import datetime
+
+import pytest
+
+from app import schemas, models, crud, errors, assembler, pagination
+from app.database import PeeweeConnectionState
+import peewee
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind([models.User, models.Video, models.Viewer])
+test_db.drop_tables([models.User, models.Video, models.Viewer])
+test_db.create_tables([models.User, models.Video, models.Viewer])
+test_db.close()
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_video(author_id: int, video_name: str):
+    return crud.create_video(schemas.VideoCreate(video_name=video_name, description='descr'), author_id)
+
+
+def count_queries(func):
+    # Models are bound to the database of whichever test module was imported last, so count on that one.
+    db = models.Video._meta.database
+    executed = []
+    original_execute_sql = db.execute_sql
+
+    def execute_sql(sql, params=None, *args, **kwargs):
+        executed.append(sql)
+        return original_execute_sql(sql, params, *args, **kwargs)
+
+    db.execute_sql = execute_sql
+    try:
+        result = func()
+    finally:
+        db.execute_sql = original_execute_sql
+    return result, len(executed)
+
+
+def reset_tables():
+    test_db.drop_tables([models.User, models.Video, models.Viewer])
+    test_db.create_tables([models.User, models.Video, models.Viewer])
+
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    yield
+    reset_tables()
+
+
+def test_assemble_all_videos():
+    first_author = create_user('first@mail.ru', 'first')
+    second_author = create_user('second@mail.ru', 'second')
+    first_video = create_video(first_author.id, 'first video')
+    second_video = create_video(second_author.id, 'second video')
+    crud.watch_video(user_id=first_author.id, video_id=second_video.id)
+    crud.watch_video(user_id=second_author.id, video_id=second_video.id)
+
+    videos = {video_inf.id: video_inf for video_inf in assembler.get_video_infs(assembler.select_video_rows())}
+    assert len(videos) == 2
+    assert videos[first_video.id].author_name == first_author.username
+    assert videos[first_video.id].number_of_views == 0
+    assert videos[second_video.id].author_id == second_author.id
+    assert videos[second_video.id].number_of_views == 2
+    assert videos[second_video.id].preview_image_url
+
+
+def test_assemble_viewed_videos():
+    author = create_user('author@mail.ru', 'author')
+    viewer = create_user('viewer@mail.ru', 'viewer')
+    watched_video = create_video(author.id, 'watched')
+    create_video(author.id, 'not watched')
+    crud.watch_video(user_id=viewer.id, video_id=watched_video.id)
+
+    videos = assembler.get_video_infs(assembler.select_viewed_video_rows(viewer.id))
+    assert [video_inf.id for video_inf in videos] == [watched_video.id]
+    assert videos[0].number_of_views == 1
+
+
+@pytest.mark.parametrize("number_of_videos", [1, 10])
+def test_number_of_queries_does_not_depend_on_rows(number_of_videos):
+    author = create_user('author@mail.ru', 'author')
+    for i in range(number_of_videos):
+        create_video(author.id, f'video {i}')
+    videos, number_of_queries = count_queries(lambda: assembler.get_video_infs(assembler.select_video_rows()))
+    assert len(videos) == number_of_videos
+    assert number_of_queries == 1
+
+
+def test_videos_page_walks_all_videos_newest_first():
+    author = create_user('author@mail.ru', 'author')
+    videos_db = [create_video(author.id, f'video {i}') for i in range(5)]
+    received, cursor = [], None
+    while True:
+        page = assembler.get_videos_page(cursor, limit=2)
+        received.extend(video_inf.id for video_inf in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert received == [video_db.id for video_db in reversed(videos_db)]
+
+
+def test_viewed_videos_page():
+    author = create_user('author@mail.ru', 'author')
+    videos_db = [create_video(author.id, f'video {i}') for i in range(3)]
+    for video_db in videos_db:
+        crud.watch_video(user_id=author.id, video_id=video_db.id)
+    first_page = assembler.get_viewed_videos_page(author.id, None, limit=2)
+    second_page = assembler.get_viewed_videos_page(author.id, first_page.next_cursor, limit=2)
+    assert [video_inf.id for video_inf in first_page.items] == [videos_db[2].id, videos_db[1].id]
+    assert [video_inf.id for video_inf in second_page.items] == [videos_db[0].id]
+    assert second_page.next_cursor is None
+
+
+@pytest.mark.parametrize("cursor", ['not a cursor', pagination.encode_cursor(5), pagination.encode_cursor(1, 2, 3),
+                                    pagination.encode_cursor('yesterday', 1),
+                                    pagination.encode_cursor(datetime.now(), True)])
+def test_invalid_cursor(cursor):
+    with pytest.raises(errors.InvalidCursorError):
+        assembler.get_videos_page(cursor, limit=2)
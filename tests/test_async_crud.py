@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from app import schemas, models, crud, errors, async_crud, dataloader
+from app.database import PeeweeConnectionState
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer,
+          models.UploadSession, models.UploadedPart, models.FeedItem, models.RelatedVideo]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_video(author_id: int):
+    return crud.create_video(schemas.VideoCreate(video_name='fake video', description='fake video descr'), author_id)
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+    crud.user_cache.clear()
+    crud.video_show_cache.clear()
+
+
+def test_get_video_show_without_pool():
+    author = create_user('author@mail.ru', 'author')
+    video = create_video(author.id)
+    crud.rate_video(user_id=author.id, video_id=video.id, user_reaction=crud.Reaction.LIKE)
+    crud.create_comment(schemas.CommentCreate(video_id=video.id, author_id=author.id, text='some text'))
+    video_show = asyncio.run(async_crud.get_video_show(video.id, author.id))
+    assert video_show.video_name == video.video_name
+    assert video_show.author_id == author.id
+    assert video_show.user_reaction == 'like'
+    assert video_show.reactionsInf.number_of_likes == 1
+    assert [comment.text for comment in video_show.comments] == ['some text']
+    assert video_show.number_of_comments == 1
+    assert video_show.comments_next_cursor is None
+    reset_tables()
+
+
+def test_loaders_share_one_query_per_entity_within_a_request():
+    author = create_user('author@mail.ru', 'author')
+    other = create_user('other@mail.ru', 'other')
+    video = create_video(author.id)
+    queries = []
+
+    async def main():
+        dataloader.registry.set(async_crud.Loaders())
+        loaders = async_crud.get_loaders()
+        # The models stay bound to whichever test module was imported last, so count on their database.
+        db = models.User._meta.database
+        original = db.execute_sql
+
+        def execute_sql(sql, params=None, *args, **kwargs):
+            queries.append(sql)
+            return original(sql, params, *args, **kwargs)
+
+        db.execute_sql = execute_sql
+        try:
+            return await asyncio.gather(loaders.users.load(author.id), loaders.users.load(other.id),
+                                        loaders.users.load(9999), loaders.videos.load(video.id),
+                                        async_crud.get_user_by_id(author.id))
+        finally:
+            db.execute_sql = original
+
+    author_db, other_db, missing, video_db, cached_author = asyncio.run(main())
+    assert (author_db.username, other_db.username, missing) == ('author', 'other', None)
+    assert cached_author.id == author.id
+    assert video_db.number_of_views == 0
+    assert len(queries) == 2
+    reset_tables()
+
+
+def test_get_missing_video_show_without_pool():
+    author = create_user('author@mail.ru', 'author')
+    with pytest.raises(errors.VideoNotExist):
+        asyncio.run(async_crud.get_video_show(9999, author.id))
+    reset_tables()
+
+
+def test_unpublished_video_is_not_reachable_by_id():
+    author = create_user('author@mail.ru', 'author')
+    video = crud.create_video(schemas.VideoCreate(video_name='upload', description='descr'), author.id,
+                              is_published=False)
+    with pytest.raises(errors.VideoNotExist):
+        asyncio.run(async_crud.get_video_show(video.id, author.id))
+    with pytest.raises(errors.VideoNotExist):
+        crud.rate_video(user_id=author.id, video_id=video.id, user_reaction=crud.Reaction.LIKE)
+    with pytest.raises(errors.VideoNotExist):
+        crud.create_comment(schemas.CommentCreate(video_id=video.id, author_id=author.id, text='some text'))
+    crud.watch_video(user_id=author.id, video_id=video.id)
+    assert models.Viewer.select().count() == 0
+    reset_tables()
+
+
+def test_is_user_subscribed_to_author_without_pool():
+    author = create_user('author@mail.ru', 'author')
+    subscriber = create_user('subscriber@mail.ru', 'subscriber')
+    crud.subscribe(subscriber_id=subscriber.id, author_id=author.id)
+    assert asyncio.run(async_crud.is_user_subscribed_to_author(subscriber.id, author.id))
+    assert not asyncio.run(async_crud.is_user_subscribed_to_author(author.id, subscriber.id))
+    assert asyncio.run(async_crud.get_user_by_id(author.id)).username == author.username
+    reset_tables()
+
+
+def test_get_user_by_id_is_cached_until_invalidated():
+    user = create_user('user@mail.ru', 'user')
+    assert asyncio.run(async_crud.get_user_by_id(user.id)).id == user.id
+    assert asyncio.run(async_crud.get_user_by_id(user.id)).refresh_token is None
+    assert crud.user_cache.stats()['hits'] >= 1
+    crud.update_user_refresh_token(user.id, 'new token')
+    assert asyncio.run(async_crud.get_user_by_id(user.id)).refresh_token == 'new token'
+    crud.delete_user_by_email(user.email)
+    assert asyncio.run(async_crud.get_user_by_id(user.id)) is None
+    reset_tables()
+
+
+def test_video_show_is_cached_per_video_and_invalidated_by_writes():
+    author = create_user('author@mail.ru', 'author')
+    viewer = create_user('viewer@mail.ru', 'viewer')
+    video = create_video(author.id)
+    crud.rate_video(user_id=author.id, video_id=video.id, user_reaction=crud.Reaction.LIKE)
+    assert asyncio.run(async_crud.get_video_show(video.id, author.id)).user_reaction == 'like'
+    assert asyncio.run(async_crud.get_video_show(video.id, viewer.id)).user_reaction == 'neutral'
+    assert crud.video_show_cache.get(video.id) is not None
+
+    crud.rate_video(user_id=viewer.id, video_id=video.id, user_reaction=crud.Reaction.DISLIKE)
+    video_show = asyncio.run(async_crud.get_video_show(video.id, viewer.id))
+    assert video_show.user_reaction == 'dislike'
+    assert video_show.reactionsInf.number_of_dislikes == 1
+
+    crud.create_comment(schemas.CommentCreate(video_id=video.id, author_id=viewer.id, text='some text'))
+    assert asyncio.run(async_crud.get_video_show(video.id, viewer.id)).number_of_comments == 1
+
+    crud.watch_video(user_id=viewer.id, video_id=video.id)
+    assert asyncio.run(async_crud.get_video_show(video.id, viewer.id)).number_of_views == 1
+
+    crud.delete_video(video.id)
+    with pytest.raises(errors.VideoNotExist):
+        asyncio.run(async_crud.get_video_show(video.id, viewer.id))
+    reset_tables()
@@ -0,0 +1,86 @@
+import pytest
+
+from app import cache, presign
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    monkeypatch.setattr(presign.time, 'time', lambda: now[0])
+    return now
+
+
+def test_cache_evicts_least_recently_used():
+    lru = cache.TTLCache(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert lru.get('a') == 1
+    assert lru.get('b') is None
+    assert lru.get('c') == 3
+
+
+def test_cache_entry_expires(clock):
+    ttl_cache = cache.TTLCache(maxsize=10, ttl=5)
+    ttl_cache.set('a', 1)
+    clock[0] += 4
+    assert ttl_cache.get('a') == 1
+    clock[0] += 2
+    assert ttl_cache.get('a') is None
+    assert ttl_cache.stats()['hits'] == 1
+    assert ttl_cache.stats()['misses'] == 1
+
+
+def test_presigned_url_is_stable_within_window(clock):
+    urls = presign.PresignedUrlCache(maxsize=10, expire=3600, reissue=1800)
+    clock[0] = 1800 * 1000
+    first_url = urls.get_url('bucket', 'key')
+    clock[0] += 1799
+    assert urls.get_url('bucket', 'key') == first_url
+    clock[0] += 1
+    assert urls.get_url('bucket', 'key') != first_url
+
+
+def test_presigned_url_is_the_same_in_every_process(clock):
+    clock[0] = 1800 * 1000
+    first_url = presign.PresignedUrlCache(maxsize=10, expire=3600, reissue=1800).get_url('bucket', 'key')
+    clock[0] += 1000.5
+    assert presign.PresignedUrlCache(maxsize=10, expire=3600, reissue=1800).get_url('bucket', 'key') == first_url
+    assert 'Expires=1803600' in first_url
+
+
+def test_presigned_urls_batch_uses_cache(clock):
+    urls = presign.PresignedUrlCache(maxsize=10, expire=3600, reissue=1800)
+    single_url = urls.get_url('bucket', '1')
+    batch = urls.get_urls('bucket', ['1', '2'])
+    assert batch['1'] == single_url
+    assert batch['2'] == urls.get_url('bucket', '2')
+    assert urls.cache.stats()['hits'] == 2
+
+
+def test_invalidated_presigned_url_is_signed_again(clock):
+    urls = presign.PresignedUrlCache(maxsize=10, expire=3600, reissue=1800)
+    clock[0] = 1800 * 1000
+    first_url = urls.get_url('bucket', 'key')
+    clock[0] += 60
+    assert urls.get_url('bucket', 'key') == first_url
+    urls.invalidate('bucket', 'key')
+    assert urls.get_url('bucket', 'key') != first_url
+
+
+def test_set_after_invalidation_is_skipped():
+    lru = cache.TTLCache(maxsize=2)
+    generation = lru.generation('a')
+    lru.pop('a')
+    lru.set('a', 1, generation=generation)
+    assert lru.get('a') is None
+    lru.set('a', 2, generation=lru.generation('a'))
+    assert lru.get('a') == 2
+
+    generation = lru.generation('b')
+    for key in ['b', 'c', 'd']:
+        lru.pop(key)
+    lru.set('b', 3, generation=generation)
+    assert lru.get('b') is None
@@ -58,3 +58,28 @@ def test_get_comments_show_inf_from_video():
         assert comment_show_inf.author_name == author.username
     test_db.drop_tables([models.User, models.Video, models.Comment])
     test_db.create_tables([models.User, models.Video, models.Comment])
+
+
+def test_get_comments_page():
+    author = create_author()
+    video = create_video(author_id=author)
+    number_of_comments = 5
+    for i in range(number_of_comments):
+        crud.create_comment(schemas.CommentCreate(video_id=video.id, author_id=author.id, text=i))
+    first_page = crud.get_comments_page(video.id, cursor=None, limit=3)
+    second_page = crud.get_comments_page(video.id, cursor=first_page.next_cursor, limit=3)
+    texts = [comment.text for comment in first_page.items + second_page.items]
+    assert texts == [str(i) for i in range(number_of_comments)]
+    assert second_page.next_cursor is None
+    test_db.drop_tables([models.User, models.Video, models.Comment])
+    test_db.create_tables([models.User, models.Video, models.Comment])
+
+
+def test_create_comment_updates_counter():
+    author = create_author()
+    video = create_video(author_id=author)
+    for i in range(3):
+        crud.create_comment(schemas.CommentCreate(video_id=video.id, author_id=author.id, text=i))
+    assert crud.get_video_by_id(video.id).number_of_comments == 3
+    test_db.drop_tables([models.User, models.Video, models.Comment])
+    test_db.create_tables([models.User, models.Video, models.Comment])
@@ -0,0 +1,107 @@
+import pytest
+
+from app import schemas, models, crud, errors, counters
+from app.database import PeeweeConnectionState
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer,
+          models.UploadSession, models.UploadedPart, models.FeedItem, models.RelatedVideo]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_video(author_id: int):
+    return crud.create_video(schemas.VideoCreate(video_name='fake video', description='fake video descr'), author_id)
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+
+
+def test_watch_video_counts_each_viewer_once():
+    author = create_user('author@mail.ru', 'author')
+    video = create_video(author.id)
+    crud.watch_video(user_id=author.id, video_id=video.id)
+    crud.watch_video(user_id=author.id, video_id=video.id)
+    assert crud.get_number_of_views(video.id) == 1
+    reset_tables()
+
+
+def test_watch_video_again_updates_viewing_time():
+    author = create_user('author@mail.ru', 'author')
+    video = create_video(author.id)
+    crud.watch_video(user_id=author.id, video_id=video.id)
+    first_viewing_time = models.Viewer.get(models.Viewer.video == video.id).viewing_time
+    crud.watch_video(user_id=author.id, video_id=video.id)
+    assert models.Viewer.get(models.Viewer.video == video.id).viewing_time > first_viewing_time
+    reset_tables()
+
+
+def test_repeated_reactions_move_counters_once():
+    author = create_user('author@mail.ru', 'author')
+    video = create_video(author.id)
+    # A reaction row another request has just created is updated instead of failing the insert.
+    models.Reaction.create(user=author.id, video=video.id)
+    crud.rate_video(user_id=author.id, video_id=video.id, user_reaction=crud.Reaction.LIKE)
+    crud.rate_video(user_id=author.id, video_id=video.id, user_reaction=crud.Reaction.LIKE)
+    reactions = crud.get_video_number_of_likes_and_dislikes(video.id)
+    assert (reactions.number_of_likes, reactions.number_of_dislikes) == (1, 0)
+    crud.rate_video(user_id=author.id, video_id=video.id, user_reaction=crud.Reaction.DISLIKE)
+    crud.rate_video(user_id=author.id, video_id=video.id, user_reaction=crud.Reaction.NEUTRAL)
+    reactions = crud.get_video_number_of_likes_and_dislikes(video.id)
+    assert (reactions.number_of_likes, reactions.number_of_dislikes) == (0, 0)
+    reset_tables()
+
+
+def test_subscribe_and_unsubscribe_update_counter():
+    author = create_user('author@mail.ru', 'author')
+    subscriber = create_user('subscriber@mail.ru', 'subscriber')
+    crud.subscribe(subscriber_id=subscriber.id, author_id=author.id)
+    with pytest.raises(errors.SubscribedError):
+        crud.subscribe(subscriber_id=subscriber.id, author_id=author.id)
+    assert crud.get_user_by_id(author.id).number_of_subscribers == 1
+    crud.unsubscribe(subscriber_id=subscriber.id, author_id=author.id)
+    crud.unsubscribe(subscriber_id=subscriber.id, author_id=author.id)
+    assert crud.get_user_by_id(author.id).number_of_subscribers == 0
+    reset_tables()
+
+
+def test_create_and_delete_video_update_counter():
+    author = create_user('author@mail.ru', 'author')
+    video = create_video(author.id)
+    create_video(author.id)
+    assert crud.get_user_by_id(author.id).number_of_videos == 2
+    crud.delete_video(video.id)
+    assert crud.get_user_by_id(author.id).number_of_videos == 1
+    reset_tables()
+
+
+def test_reconcile_counters():
+    author = create_user('author@mail.ru', 'author')
+    subscriber = create_user('subscriber@mail.ru', 'subscriber')
+    video = create_video(author.id)
+    crud.watch_video(user_id=subscriber.id, video_id=video.id)
+    crud.rate_video(user_id=subscriber.id, video_id=video.id, user_reaction=crud.Reaction.LIKE)
+    crud.rate_video(user_id=author.id, video_id=video.id, user_reaction=crud.Reaction.DISLIKE)
+    crud.subscribe(subscriber_id=subscriber.id, author_id=author.id)
+    models.Video.update(number_of_views=10, number_of_likes=10, number_of_dislikes=10).execute()
+    models.User.update(number_of_subscribers=10, number_of_videos=10).execute()
+
+    counters.reconcile_counters()
+
+    video = crud.get_video_by_id(video.id)
+    author = crud.get_user_by_id(author.id)
+    assert (video.number_of_views, video.number_of_likes, video.number_of_dislikes) == (1, 1, 1)
+    assert (author.number_of_subscribers, author.number_of_videos) == (1, 1)
+    reset_tables()
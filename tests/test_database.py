@@ -0,0 +1,62 @@
+import time
+import psycopg2
+from playhouse import pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from app import database
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql):
+        if self.connection.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self, broken: bool):
+        self.broken = broken
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+
+def test_pool_drops_broken_connection(monkeypatch):
+    monkeypatch.setattr(database.settings, 'database_pool_health_check', True)
+    pooled_db = database.PooledPostgresqlDatabase(None)
+    assert not pooled_db._is_closed(FakeConnection(broken=False))
+    assert pooled_db._is_closed(FakeConnection(broken=True))
+
+
+def test_pool_health_check_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(database.settings, 'database_pool_health_check', False)
+    pooled_db = database.PooledPostgresqlDatabase(None)
+    assert not pooled_db._is_closed(FakeConnection(broken=True))
+
+
+def test_pool_skips_health_check_of_recently_returned_connection(monkeypatch):
+    monkeypatch.setattr(database.settings, 'database_pool_health_check', True)
+    monkeypatch.setattr(database.settings, 'database_pool_health_check_idle_seconds', 30)
+    pooled_db = database.PooledPostgresqlDatabase(None)
+    connection = FakeConnection(broken=True)
+    pooled_db._in_use[pooled_db.conn_key(connection)] = pool.PoolConnection(time.time(), connection, time.time())
+    pooled_db._close(connection)
+    assert not pooled_db._is_closed(connection)
+    monkeypatch.setattr(database.settings, 'database_pool_health_check_idle_seconds', 0)
+    assert pooled_db._is_closed(connection)
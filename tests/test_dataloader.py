@@ -0,0 +1,107 @@
+import asyncio
+import gc
+import weakref
+
+import pytest
+
+from app import dataloader
+
+
+class Source:
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    async def load(self, keys: list):
+        self.batches.append(sorted(keys))
+        if self.fail:
+            raise ValueError('broken')
+        return {key: key * 10 for key in keys if key != 0}
+
+
+def test_concurrent_loads_are_resolved_in_one_batch():
+    source = Source()
+    loader = dataloader.DataLoader(source.load)
+
+    async def main():
+        return await asyncio.gather(loader.load(1), loader.load(2), loader.load(1), loader.load(0))
+
+    assert asyncio.run(main()) == [10, 20, 10, None]
+    assert source.batches == [[0, 1, 2]]
+
+
+def test_loaded_keys_are_not_fetched_again():
+    source = Source()
+    loader = dataloader.DataLoader(source.load)
+
+    async def main():
+        first = await loader.load_many([1, 2])
+        second = await loader.load_many([2, 3])
+        return first, second
+
+    assert asyncio.run(main()) == ([10, 20], [20, 30])
+    assert source.batches == [[1, 2], [3]]
+
+
+def test_batches_are_split_at_max_batch_size():
+    source = Source()
+    loader = dataloader.DataLoader(source.load, max_batch_size=2)
+    assert asyncio.run(loader.load_many([1, 2, 3])) == [10, 20, 30]
+    assert source.batches == [[1, 2], [3]]
+
+
+def test_failed_batch_is_raised_to_every_caller_and_retried():
+    source = Source(fail=True)
+    loader = dataloader.DataLoader(source.load)
+
+    async def main():
+        return await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(main())] == [ValueError, ValueError]
+    source.fail = False
+    assert asyncio.run(loader.load(1)) == 10
+    assert len(source.batches) == 2
+
+
+def test_batch_outlives_its_cancelled_callers():
+    pending = []
+
+    async def load(keys: list):
+        # Only a weak reference leaves the batch, so nothing but the loader keeps its task alive.
+        waiter = asyncio.get_running_loop().create_future()
+        pending.append(weakref.ref(waiter))
+        await waiter
+        return {key: key * 10 for key in keys}
+
+    loader = dataloader.DataLoader(load)
+
+    async def main():
+        caller = asyncio.create_task(loader.load(1))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        gc.collect()
+        waiter = pending[0]()
+        assert waiter is not None
+        waiter.set_result(None)
+        return await loader.load(1)
+
+    assert asyncio.run(main()) == 10
+
+
+def test_middleware_gives_each_request_its_own_registry():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(dataloader.registry.get())
+
+    middleware = dataloader.DataLoaderMiddleware(app, factory=object)
+
+    async def main():
+        await middleware({'type': 'http'}, None, None)
+        await middleware({'type': 'http'}, None, None)
+        await middleware({'type': 'lifespan'}, None, None)
+
+    asyncio.run(main())
+    assert seen[0] is not None and seen[1] is not None and seen[0] is not seen[1]
+    assert seen[2] is None
+    assert dataloader.registry.get() is None
@@ -0,0 +1,81 @@
+import datetime
+
+from app import schemas, models, crud, feed, assembler
+from app.config import settings
+from app.database import PeeweeConnectionState
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer,
+          models.UploadSession, models.UploadedPart, models.FeedItem, models.RelatedVideo]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_video(author_id: int, minutes_ago: int, is_published: bool = True):
+    video = crud.create_video(schemas.VideoCreate(video_name='video', description='descr'), author_id, is_published)
+    creation_time = datetime.datetime.now() - datetime.timedelta(minutes=minutes_ago)
+    models.Video.update(creation_time=creation_time).where(models.Video.id == video.id).execute()
+    models.FeedItem.update(created_at=creation_time).where(models.FeedItem.video == video.id).execute()
+    return video.id
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+
+
+def test_small_author_is_fanned_out_on_publish():
+    author = create_user('author@mail.ru', 'author')
+    subscriber = create_user('subscriber@mail.ru', 'subscriber')
+    crud.subscribe(subscriber_id=subscriber.id, author_id=author.id)
+    video_id = create_video(author.id, minutes_ago=1)
+    draft_id = create_video(author.id, minutes_ago=0, is_published=False)
+    assert [item.video_id for item in models.FeedItem.select()] == [video_id]
+    crud.publish_video(draft_id)
+    assert feed.get_feed_page(subscriber.id, None, 10) == ([draft_id, video_id], None)
+    reset_tables()
+
+
+def test_subscribe_backfills_and_unsubscribe_removes():
+    author = create_user('author@mail.ru', 'author')
+    subscriber = create_user('subscriber@mail.ru', 'subscriber')
+    old_video_id = create_video(author.id, minutes_ago=2)
+    new_video_id = create_video(author.id, minutes_ago=1)
+    crud.subscribe(subscriber_id=subscriber.id, author_id=author.id)
+    assert feed.get_feed_page(subscriber.id, None, 10) == ([new_video_id, old_video_id], None)
+    crud.unsubscribe(subscriber_id=subscriber.id, author_id=author.id)
+    assert feed.get_feed_page(subscriber.id, None, 10) == ([], None)
+    reset_tables()
+
+
+def test_large_authors_are_merged_at_read_time(monkeypatch):
+    monkeypatch.setattr(settings, 'feed_fanout_max_subscribers', 1)
+    small = create_user('small@mail.ru', 'small')
+    large = create_user('large@mail.ru', 'large')
+    subscriber = create_user('subscriber@mail.ru', 'subscriber')
+    other = create_user('other@mail.ru', 'other')
+    for author in (small, large):
+        crud.subscribe(subscriber_id=subscriber.id, author_id=author.id)
+    crud.subscribe(subscriber_id=other.id, author_id=large.id)
+    expected = [create_video(author.id, minutes_ago=minutes_ago)
+                for author, minutes_ago in [(large, 1), (small, 2), (large, 3), (small, 4), (large, 5)]]
+    assert models.FeedItem.select().where(models.FeedItem.author == large.id).count() == 0
+
+    video_ids, cursor = feed.get_feed_page(subscriber.id, None, 2)
+    assert video_ids == expected[:2]
+    video_ids, cursor = feed.get_feed_page(subscriber.id, cursor, 2)
+    assert video_ids == expected[2:4]
+    page = assembler.get_subscription_feed(subscriber.id, cursor, 2)
+    assert [video.id for video in page.items] == expected[4:]
+    assert page.next_cursor is None
+    reset_tables()
@@ -0,0 +1,103 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app.main import app, get_db
+from app import models, metrics
+from app.cache import TTLCache
+from app.database import PeeweeConnectionState
+import peewee
+from playhouse.pool import PooledSqliteDatabase
+
+TABLES = [models.User, models.Video]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+def override_get_db():
+    try:
+        test_db.connect()
+        yield
+    finally:
+        if not test_db.is_closed():
+            test_db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+client = TestClient(app)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def call(method, params):
+    return client.post('/api', json={'jsonrpc': '2.0', 'id': 0, 'method': method, 'params': params}).json()
+
+
+def test_calls_and_errors_are_counted_per_method():
+    requests_before = sample('rpc_requests_total', method='login')
+    errors_before = sample('rpc_errors_total', method='login', error='AccountNotFound')
+    observed_before = sample('rpc_request_duration_seconds_count', method='login')
+    response = call('login', {'user_data': {'email': 'nobody@mail.ru', 'password': 'password'}})
+    assert response['error']['code'] == 1000
+    assert sample('rpc_requests_total', method='login') == requests_before + 1
+    assert sample('rpc_errors_total', method='login', error='AccountNotFound') == errors_before + 1
+    assert sample('rpc_request_duration_seconds_count', method='login') == observed_before + 1
+
+    unknown_before = sample('rpc_requests_total', method='unknown')
+    call('no_such_method', {})
+    assert sample('rpc_requests_total', method='unknown') == unknown_before + 1
+
+
+def test_s3_timer_counts_failures():
+    errors_before = sample('s3_operation_errors_total', operation='test_operation')
+    with metrics.s3_timer('test_operation'):
+        pass
+    with pytest.raises(ConnectionError):
+        with metrics.s3_timer('test_operation'):
+            raise ConnectionError('connection reset')
+    assert sample('s3_operation_duration_seconds_count', operation='test_operation') == 2
+    assert sample('s3_operation_errors_total', operation='test_operation') == errors_before + 1
+
+
+def test_cache_counters_follow_the_cache():
+    cache = TTLCache(maxsize=10)
+    metrics.caches['test_cache'] = cache
+    try:
+        cache.set('key', 'value')
+        cache.get('key')
+        cache.get('missing')
+        metrics.collect()
+        cache.get('key')
+        metrics.collect()
+        assert sample('cache_hits_total', cache='test_cache') == 2
+        assert sample('cache_misses_total', cache='test_cache') == 1
+        assert sample('cache_entries', cache='test_cache') == 1
+        assert sample('cache_hit_ratio', cache='test_cache') == pytest.approx(2 / 3)
+    finally:
+        del metrics.caches['test_cache']
+
+
+def test_pool_usage_of_a_peewee_pool():
+    pool = PooledSqliteDatabase("test.db", max_connections=4, check_same_thread=False)
+    pool.connect()
+    assert metrics.pool_usage(pool) == {'in_use': 1, 'idle': 0, 'max': 4}
+    pool.close()
+    assert metrics.pool_usage(pool) == {'in_use': 0, 'idle': 1, 'max': 4}
+    pool.close_all()
+    assert metrics.pool_usage(None) is None
+
+
+def test_metrics_route_serves_text_format():
+    call('login', {'user_data': {'email': 'nobody@mail.ru', 'password': 'password'}})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'rpc_request_duration_seconds_bucket{le="0.005",method="login"}' in response.text
+    assert 'cache_hit_ratio{cache="user"' in response.text
@@ -0,0 +1,50 @@
+import asyncio
+
+from passlib.context import CryptContext
+
+from app import schemas, models, crud, passwords
+from app.config import settings
+from app.database import PeeweeConnectionState
+import peewee
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind([models.User])
+test_db.drop_tables([models.User])
+test_db.create_tables([models.User])
+test_db.close()
+
+
+def test_hash_in_worker_pool(monkeypatch):
+    monkeypatch.setattr(settings, 'password_hash_workers', 2)
+    passwords.start()
+    try:
+        hashed_password = passwords.hash_password('somePassword')
+        assert passwords.verify_and_update('somePassword', hashed_password)[0]
+        assert not passwords.verify_and_update('otherPassword', hashed_password)[0]
+        hashed_password = asyncio.run(passwords.hash_password_async('somePassword'))
+        assert asyncio.run(passwords.verify_and_update_async('somePassword', hashed_password))[0]
+    finally:
+        passwords.shutdown()
+
+
+def test_login_rehashes_password_when_rounds_change(monkeypatch):
+    monkeypatch.setattr(settings, 'password_hash_workers', 0)
+    monkeypatch.setattr(passwords, 'pwd_context', CryptContext(schemes=["bcrypt"], bcrypt__rounds=4))
+    user = crud.create_user(schemas.UserCreate(email='user@mail.ru', username='user', password='somePassword'))
+    assert user.hashed_password.startswith('$2b$04$')
+
+    monkeypatch.setattr(passwords, 'pwd_context', CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+    assert crud.get_user_by_email_and_password('user@mail.ru', 'somePassword').id == user.id
+    assert crud.get_user_by_id(user.id).hashed_password.startswith('$2b$05$')
+    assert crud.get_user_by_email_and_password('user@mail.ru', 'wrongPassword') is None
+    test_db.drop_tables([models.User])
+    test_db.create_tables([models.User])
+
+
+def test_async_hash_without_workers(monkeypatch):
+    monkeypatch.setattr(settings, 'password_hash_workers', 0)
+    hashed_password = asyncio.run(passwords.hash_password_async('somePassword'))
+    assert asyncio.run(passwords.verify_and_update_async('somePassword', hashed_password)) == (True, None)
+    assert not asyncio.run(passwords.verify_and_update_async('otherPassword', hashed_password))[0]
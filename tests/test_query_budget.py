@@ -0,0 +1,103 @@
+import pytest
+
+from app import schemas, models, crud, assembler, database
+from app.database import PeeweeConnectionState, query_budget
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer,
+          models.UploadSession, models.UploadedPart, models.FeedItem, models.RelatedVideo]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_videos_with_comments(author_id: int, number_of_videos: int, comments_per_video: int):
+    videos = []
+    for _ in range(number_of_videos):
+        video = crud.create_video(schemas.VideoCreate(video_name='video', description='descr'), author_id)
+        for i in range(comments_per_video):
+            crud.create_comment(schemas.CommentCreate(video_id=video.id, author_id=author_id, text=f'comment {i}'))
+        videos.append(video)
+    return videos
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+    crud.video_show_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def instrumented_db():
+    # The models stay bound to whichever test module was imported last, so instrument their database.
+    db = models.User._meta.database
+    already_instrumented = getattr(db, 'instrumented', False)
+    database.instrument(db)
+    yield
+    if not already_instrumented:
+        del db.execute_sql
+        del db.instrumented
+
+
+def test_budget_counts_queries_and_keeps_the_slowest():
+    author = create_user('author@mail.ru', 'author')
+    with query_budget(2) as stats:
+        crud.get_users_by_ids([author.id])
+        models.User.select().where(models.User.username == 'author').count()
+    assert stats.count == 2
+    assert stats.slowest_sql is not None and stats.seconds >= stats.slowest_seconds
+    with pytest.raises(AssertionError, match='query budget of 0 exceeded'):
+        with query_budget(0):
+            crud.get_users_by_ids([author.id])
+    reset_tables()
+
+
+def test_video_lists_do_not_query_per_row():
+    author = create_user('author@mail.ru', 'author')
+    videos = create_videos_with_comments(author.id, number_of_videos=5, comments_per_video=3)
+    with query_budget(1):
+        page = assembler.get_videos_page(cursor=None, limit=None)
+    assert len(page.items) == 5
+    with query_budget(1):
+        comments = crud.get_comments_show_inf_from_video(videos[0].id)
+    assert len(comments) == 3
+    reset_tables()
+
+
+def test_video_show_query_budget():
+    author = create_user('author@mail.ru', 'author')
+    video = create_videos_with_comments(author.id, number_of_videos=1, comments_per_video=10)[0]
+    with query_budget(3):
+        video_show = assembler.get_video_show(video.id, author.id)
+    assert len(video_show.comments) == 10
+    with query_budget(1):
+        assembler.get_video_show(video.id, author.id)
+    reset_tables()
+
+
+def test_video_show_built_during_an_update_is_not_cached(monkeypatch):
+    author = create_user('author@mail.ru', 'author')
+    video = create_videos_with_comments(author.id, number_of_videos=1, comments_per_video=1)[0]
+    get_comments_page = crud.get_comments_page
+
+    def get_comments_page_racing_a_new_comment(video_id, cursor, limit):
+        page = get_comments_page(video_id, cursor=cursor, limit=limit)
+        crud.create_comment(schemas.CommentCreate(video_id=video_id, author_id=author.id, text='late comment'))
+        return page
+
+    monkeypatch.setattr(crud, 'get_comments_page', get_comments_page_racing_a_new_comment)
+    assert len(assembler.get_video_show(video.id, author.id).comments) == 1
+    assert crud.video_show_cache.get(video.id) is None
+    monkeypatch.undo()
+    assert len(assembler.get_video_show(video.id, author.id).comments) == 2
+    assert crud.video_show_cache.get(video.id) is not None
+    reset_tables()
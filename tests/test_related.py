@@ -0,0 +1,94 @@
+import datetime
+
+from app import schemas, models, crud, related, assembler
+from app.database import PeeweeConnectionState
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer,
+          models.UploadSession, models.UploadedPart, models.FeedItem, models.RelatedVideo, models.JobWatermark]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+def create_users(count: int):
+    return [crud.create_user(schemas.UserCreate(email=f'user{i}@mail.ru', username=f'user{i}',
+                                                password='somePassword')).id
+            for i in range(count)]
+
+
+def create_videos(author_id: int, count: int):
+    return [crud.create_video(schemas.VideoCreate(video_name=f'video{i}', description='descr'), author_id).id
+            for i in range(count)]
+
+
+def view(views: list[tuple[int, int]], minutes_ago: int):
+    crud.record_views([(user_id, video_id, datetime.datetime.now() - datetime.timedelta(minutes=minutes_ago))
+                       for user_id, video_id in views])
+
+
+def related_ids(video_id: int) -> list[int]:
+    return [video.id for video in assembler.get_related_videos(video_id, 10)]
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+
+
+def test_related_videos_are_ranked_by_cosine():
+    users = create_users(3)
+    a, b, c, d = create_videos(users[0], 4)
+    view([(users[0], a), (users[0], b), (users[1], a), (users[1], b), (users[1], c), (users[2], c), (users[2], d)],
+         minutes_ago=10)
+    assert related.run(full=True, chunk_size=2) == 4
+    assert related_ids(a) == [b, c]
+    assert related_ids(d) == [c]
+    scores = {row.related_id: row.score for row in models.RelatedVideo.select().where(models.RelatedVideo.video == a)}
+    assert abs(scores[b] - 1.0) < 1e-6
+    assert abs(scores[c] - 0.5) < 1e-6
+    reset_tables()
+
+
+def test_incremental_run_recomputes_only_newly_viewed_videos():
+    users = create_users(2)
+    a, b, c = create_videos(users[0], 3)
+    view([(users[0], a), (users[0], b)], minutes_ago=10)
+    assert related.run() == 2
+    assert related.run() == 0
+    view([(users[1], b), (users[1], c)], minutes_ago=2)
+    assert related.run(top_k=5) == 2
+    assert related_ids(b) == [a, c]
+    assert related_ids(c) == [b]
+    assert related_ids(a) == [b]
+    reset_tables()
+
+
+def test_incremental_run_waits_for_late_flushed_views():
+    users = create_users(2)
+    a, b, c = create_videos(users[0], 3)
+    view([(users[0], a), (users[0], b)], minutes_ago=10)
+    assert related.run() == 2
+    now = datetime.datetime.now()
+    crud.record_views([(users[1], b, now - datetime.timedelta(seconds=10))])
+    assert related.run() == 0
+    # A flush that was still pending writes a view stamped before the one above.
+    crud.record_views([(users[1], c, now - datetime.timedelta(seconds=20))])
+    assert related.run(lag_seconds=0) == 2
+    assert related_ids(c) == [b]
+    reset_tables()
+
+
+def test_deleted_video_disappears_from_related():
+    users = create_users(1)
+    a, b = create_videos(users[0], 2)
+    view([(users[0], a), (users[0], b)], minutes_ago=1)
+    related.run(full=True)
+    crud.delete_video(b)
+    assert related_ids(a) == []
+    reset_tables()
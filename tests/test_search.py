@@ -0,0 +1,73 @@
+import pytest
+
+from app import schemas, models, crud, search
+from app.database import PeeweeConnectionState
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Viewer, models.UploadSession,
+          models.UploadedPart, models.FeedItem, models.RelatedVideo]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.bind(TABLES)
+
+
+def reset_tables():
+    test_db.execute_sql('DROP TABLE IF EXISTS video_search')
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+    search.install(test_db)
+
+
+@pytest.fixture(autouse=True)
+def search_tables():
+    # Other test modules recreate the video table, which drops the index triggers, so install them per test.
+    reset_tables()
+    yield
+    reset_tables()
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_video(author_id: int, video_name: str, description: str = 'descr'):
+    return crud.create_video(schemas.VideoCreate(video_name=video_name, description=description), author_id)
+
+
+def test_search_ranks_name_matches_first():
+    author = create_user('author@mail.ru', 'author')
+    in_description = create_video(author.id, 'holiday', 'funny cats at home')
+    in_name = create_video(author.id, 'funny cats')
+    create_video(author.id, 'dogs')
+    page = search.search_videos('funny cat', None, limit=10)
+    assert [video_inf.id for video_inf in page.items] == [in_name.id, in_description.id]
+    assert page.items[0].author_name == 'author'
+
+
+def test_search_by_channel_name_and_skips_unpublished():
+    author = create_user('author@mail.ru', 'kitchen')
+    published = create_video(author.id, 'pasta')
+    crud.create_video(schemas.VideoCreate(video_name='soup', description='descr'), author.id, is_published=False)
+    assert [video_inf.id for video_inf in search.search_videos('kitchen', None, limit=10).items] == [published.id]
+
+
+def test_search_pages_through_results():
+    author = create_user('author@mail.ru', 'author')
+    videos = {create_video(author.id, f'cooking lesson {i}').id for i in range(5)}
+    received, cursor = [], None
+    while True:
+        page = search.search_videos('cooking', cursor, limit=2)
+        received.extend(video_inf.id for video_inf in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert sorted(received) == sorted(videos)
+
+
+def test_search_keeps_index_in_sync():
+    author = create_user('author@mail.ru', 'author')
+    video = create_video(author.id, 'guitar')
+    crud.delete_video(video.id)
+    assert search.search_videos('guitar', None, limit=10).items == []
+    assert search.search_videos('!!!', None, limit=10).items == []
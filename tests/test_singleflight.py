@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.singleflight import SingleFlight, AsyncSingleFlight, coalesced
+
+
+def test_concurrent_calls_share_one_computation():
+    flight = SingleFlight('test.shared')
+    started = threading.Event()
+    executions = []
+
+    def slow_lookup(key):
+        executions.append(key)
+        started.set()
+        time.sleep(0.2)
+        return key * 2
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do(21, slow_lookup, 21)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do(21, slow_lookup, 21))) for _ in range(4)]
+    for follower in followers:
+        follower.start()
+    for thread in [leader, *followers]:
+        thread.join()
+    assert results == [42] * 5
+    assert executions == [21]
+    assert flight.stats() == {'calls': 5, 'coalesced': 4}
+
+
+def test_error_is_raised_and_not_remembered():
+    flight = SingleFlight('test.errors')
+
+    def failing():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        flight.do('key', failing)
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_bypass_runs_call_directly():
+    calls = []
+    lookup = coalesced(lambda key: calls.append(key) or key, bypass=lambda: True)
+    assert lookup(1) == 1
+    assert lookup.flight.calls == 0
+
+
+def test_async_calls_share_one_computation():
+    flight = AsyncSingleFlight('test.async')
+    executions = []
+
+    async def lookup(key):
+        executions.append(key)
+        await asyncio.sleep(0.05)
+        return key * 2
+
+    async def run():
+        return await asyncio.gather(*[flight.do(21, lookup, 21) for _ in range(5)])
+
+    assert asyncio.run(run()) == [42] * 5
+    assert executions == [21]
+    assert flight.stats() == {'calls': 5, 'coalesced': 4}
+
+
+def test_cancelled_async_caller_does_not_cancel_the_others():
+    flight = AsyncSingleFlight('test.async_cancel')
+    executions = []
+
+    async def lookup(key):
+        executions.append(key)
+        await asyncio.sleep(0.05)
+        return key * 2
+
+    async def run():
+        first = asyncio.ensure_future(flight.do(21, lookup, 21))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do(21, lookup, 21))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await follower, await flight.do(21, lookup, 21)
+
+    assert asyncio.run(run()) == (42, 42)
+    assert executions == [21, 21]
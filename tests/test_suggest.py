@@ -0,0 +1,107 @@
+import pytest
+
+from app import schemas, models, crud, errors, suggest
+from app.database import PeeweeConnectionState
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Viewer, models.UploadSession,
+          models.UploadedPart, models.FeedItem, models.RelatedVideo]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_video(author_id: int, video_name: str):
+    return crud.create_video(schemas.VideoCreate(video_name=video_name, description='descr'), author_id)
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+    suggest.suggest_index.replace([])
+
+
+@pytest.fixture(autouse=True)
+def empty_index():
+    # Every crud write also updates the process-wide index, so start each test from an empty one.
+    reset_tables()
+    yield
+    reset_tables()
+
+
+def texts(prefix: str, limit: int = 10) -> list[str]:
+    return [suggestion.text for suggestion in suggest.suggest_index.suggest(prefix, limit)]
+
+
+def test_prefix_index_matches_word_prefixes_and_orders_by_weight():
+    index = suggest.PrefixIndex()
+    index.add(suggest.VIDEO, 1, 'Funny Cats', weight=5)
+    index.add(suggest.VIDEO, 2, 'Cat café tour', weight=50)
+    index.add(suggest.CHANNEL, 3, 'Catherine', weight=1)
+    index.add(suggest.VIDEO, 4, 'Dogs', weight=100)
+    assert [item.id for item in index.suggest('CAT', 10)] == [2, 1, 3]
+    assert [item.id for item in index.suggest('cafe', 10)] == [2]
+    assert [item.id for item in index.suggest('cat', 1)] == [2]
+    index.remove(suggest.VIDEO, 2)
+    index.add_weight(suggest.CHANNEL, 3, 10)
+    assert [item.id for item in index.suggest('cat', 10)] == [3, 1]
+    assert index.suggest('  ', 10) == []
+
+
+def test_removal_keeps_short_prefix_candidates():
+    index = suggest.PrefixIndex()
+    index.replace([(suggest.VIDEO, video_id, f'cat {video_id}', video_id) for video_id in range(1, 301)])
+    assert [item.id for item in index.suggest('c', 3)] == [300, 299, 298]
+    index.remove(suggest.VIDEO, 300)
+    index.remove(suggest.VIDEO, 298)
+    assert [item.id for item in index.suggest('c', 3)] == [299, 297, 296]
+    for video_id in range(201, 298):
+        index.remove(suggest.VIDEO, video_id)
+    assert [item.id for item in index.suggest('c', 3)] == [299, 200, 199]
+
+
+def test_index_follows_crud_changes():
+    author = create_user('author@mail.ru', 'cooking channel')
+    video = create_video(author.id, 'Pasta carbonara')
+    viewer = create_user('viewer@mail.ru', 'viewer')
+    crud.watch_video(user_id=viewer.id, video_id=video.id)
+    create_video(author.id, 'Pasta al pomodoro')
+    assert texts('pasta') == ['Pasta carbonara', 'Pasta al pomodoro']
+    assert texts('cook') == ['cooking channel']
+    crud.delete_video(video.id)
+    assert texts('pasta') == ['Pasta al pomodoro']
+
+
+def test_index_is_updated_only_when_the_transaction_commits():
+    with pytest.raises(errors.VideoNotExist):
+        with crud.atomic():
+            author = create_user('ghost@mail.ru', 'ghost channel')
+            create_video(author.id, 'Ghost stories')
+            raise errors.VideoNotExist
+    assert texts('ghost') == []
+
+    with crud.atomic():
+        author = create_user('ghost@mail.ru', 'ghost channel')
+        create_video(author.id, 'Ghost stories')
+        assert texts('ghost') == []
+    assert sorted(texts('ghost')) == ['Ghost stories', 'ghost channel']
+
+
+def test_load_index_from_database():
+    author = create_user('author@mail.ru', 'music')
+    create_video(author.id, 'Guitar lesson')
+    crud.create_video(schemas.VideoCreate(video_name='Guitar draft', description='descr'), author.id,
+                      is_published=False)
+    suggest.suggest_index.replace([])
+    suggest.load_index(suggest.suggest_index)
+    assert texts('guitar') == ['Guitar lesson']
+    assert texts('mus') == ['music']
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+import pytest
+
+from app import authentication, errors
+from app.config import settings
+
+TokenManager = authentication.TokenManager
+
+
+def test_verified_token_is_cached():
+    token = TokenManager.create_token(7, timedelta(minutes=15))
+    hits = TokenManager.verified_tokens.hits
+    assert TokenManager.try_get_user_id_from_token(token) == 7
+    assert TokenManager.try_get_user_id_from_token(token) == 7
+    assert TokenManager.verified_tokens.hits == hits + 1
+
+
+def test_expired_token():
+    token = TokenManager.create_token(7, timedelta(minutes=-1))
+    with pytest.raises(errors.TokenExpireError):
+        TokenManager.try_get_user_id_from_token(token)
+
+
+def test_invalid_token():
+    with pytest.raises(errors.TokenError):
+        TokenManager.try_get_user_id_from_token('not a token')
+
+
+@pytest.mark.skipif(authentication.pyjwt is None, reason='PyJWT is not installed')
+def test_pyjwt_backend(monkeypatch):
+    monkeypatch.setattr(settings, 'jwt_backend', 'pyjwt')
+    token = TokenManager.create_token(8, timedelta(minutes=15))
+    assert TokenManager.try_get_user_id_from_token(token) == 8
+    with pytest.raises(errors.TokenExpireError):
+        TokenManager.try_get_user_id_from_token(TokenManager.create_token(8, timedelta(minutes=-1)))
@@ -0,0 +1,72 @@
+import time
+
+from app import schemas, models, crud, trending, assembler
+from app.database import PeeweeConnectionState
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Viewer, models.UploadSession,
+          models.UploadedPart, models.FeedItem, models.RelatedVideo]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+HOUR = 3600
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_video(author_id: int, video_name: str = 'video'):
+    return crud.create_video(schemas.VideoCreate(video_name=video_name, description='descr'), author_id)
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+    trending.ranker.replace([])
+
+
+def test_older_events_weigh_less():
+    ranker = trending.TrendingRanker(half_life=HOUR, top_k=2)
+    now = time.time()
+    ranker.record(1, 3, at=now - 2 * HOUR)
+    ranker.record(2, 1, at=now)
+    assert ranker.top(10) == [2, 1]
+    ranker.record(1, 2, at=now)
+    assert ranker.top(10) == [1, 2]
+
+
+def test_top_keeps_best_k_and_drops_removed_videos():
+    ranker = trending.TrendingRanker(half_life=HOUR, top_k=2)
+    for video_id, weight in [(1, 1), (2, 5), (3, 3), (4, 2)]:
+        ranker.record(video_id, weight)
+    assert ranker.top(10) == [2, 3]
+    ranker.record(2, -10)
+    assert ranker.top(10) == [3, 4]
+    ranker.remove(3)
+    assert ranker.top(1) == [4]
+
+
+def test_write_paths_feed_the_ranking():
+    author = create_user('author@mail.ru', 'author')
+    viewer = create_user('viewer@mail.ru', 'viewer')
+    quiet, liked, discussed = create_video(author.id), create_video(author.id), create_video(author.id)
+    crud.watch_video(user_id=viewer.id, video_id=quiet.id)
+    crud.rate_video(user_id=viewer.id, video_id=liked.id, user_reaction=crud.Reaction.LIKE)
+    for text in ['first', 'second']:
+        crud.create_comment(schemas.CommentCreate(video_id=discussed.id, author_id=viewer.id, text=text))
+    expected = [discussed.id, liked.id, quiet.id]
+    assert [video_inf.id for video_inf in assembler.get_trending_videos(10)] == expected
+
+    trending.ranker.replace([])
+    trending.load_scores(trending.ranker)
+    assert trending.ranker.top(10) == expected
+    crud.delete_video(discussed.id)
+    assert trending.ranker.top(10) == [liked.id, quiet.id]
+    reset_tables()
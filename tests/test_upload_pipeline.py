@@ -0,0 +1,160 @@
+import asyncio
+import io
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app import schemas, models, crud, errors, video, assembler
+from app.database import PeeweeConnectionState
+import peewee
+
+TABLES = [models.User, models.Video, models.Reaction, models.Comment, models.Subscriber, models.Viewer,
+          models.UploadSession, models.UploadedPart, models.FeedItem, models.RelatedVideo]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+class FakeS3:
+    def __init__(self, failing_bucket=None):
+        self.failing_bucket = failing_bucket
+        self.objects = {}
+        self.aborted = []
+
+    async def upload_fileobj(self, file, bucket, key, Config=None):
+        await asyncio.sleep(0)
+        if bucket == self.failing_bucket:
+            raise ConnectionError('connection reset')
+        self.objects[(bucket, key)] = file.read()
+
+    async def list_multipart_uploads(self, Bucket, Prefix):
+        return {'Uploads': [{'Key': Prefix, 'UploadId': 'upload-id'}]} if Bucket == self.failing_bucket else {}
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append((Bucket, Key, UploadId))
+
+    async def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.objects.pop((Bucket, item['Key']), None)
+
+
+def use_fake_s3(monkeypatch, fake_s3):
+    @asynccontextmanager
+    async def async_client():
+        yield fake_s3
+
+    monkeypatch.setattr(video.storage_clients, 'async_client', async_client)
+
+
+def upload(author_id):
+    return asyncio.run(video.VideoManager.upload_video(io.BytesIO(b'video'), 'fake video', 'fake descr', author_id,
+                                                       io.BytesIO(b'preview')))
+
+
+def create_author():
+    return crud.create_user(schemas.UserCreate(email='author@mail.ru', username='author', password='password'))
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+
+
+def test_upload_video_and_preview(monkeypatch):
+    fake_s3 = FakeS3()
+    use_fake_s3(monkeypatch, fake_s3)
+    author = create_author()
+    db_video = upload(author.id)
+    assert fake_s3.objects[('just-watch-videos', str(db_video.id))] == b'video'
+    assert fake_s3.objects[('just-watch-video-preview', str(db_video.id))] == b'preview'
+    assert crud.get_video_by_id(db_video.id).is_published
+    assert crud.get_user_by_id(author.id).number_of_videos == 1
+    reset_tables()
+
+
+def test_failed_upload_is_rolled_back(monkeypatch):
+    fake_s3 = FakeS3(failing_bucket='just-watch-videos')
+    use_fake_s3(monkeypatch, fake_s3)
+    author = create_author()
+    with pytest.raises(errors.VideoUploadError):
+        upload(author.id)
+    assert fake_s3.objects == {}
+    assert fake_s3.aborted == [('just-watch-videos', '1', 'upload-id')]
+    assert models.Video.select().count() == 0
+    assert crud.get_user_by_id(author.id).number_of_videos == 0
+    assert assembler.get_videos_page(None, None).items == []
+    reset_tables()
+
+
+def test_failed_rollback_keeps_the_upload_error(monkeypatch):
+    use_fake_s3(monkeypatch, FakeS3(failing_bucket='just-watch-videos'))
+
+    def broken_discard_video(video_id):
+        raise peewee.OperationalError('connection lost')
+
+    monkeypatch.setattr(crud, 'discard_video', broken_discard_video)
+    author = create_author()
+    with pytest.raises(errors.VideoUploadError):
+        upload(author.id)
+    reset_tables()
+
+
+class FakeMultipartS3(FakeS3):
+    def __init__(self):
+        super().__init__()
+        self.parts = {}
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        return {'UploadId': 'upload-id'}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.parts[PartNumber] = bytes(Body)
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.objects[(Bucket, Key)] = b''.join(self.parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+
+async def as_stream(data: bytes):
+    yield data
+
+
+def test_resume_upload_session(monkeypatch):
+    fake_s3 = FakeMultipartS3()
+    use_fake_s3(monkeypatch, fake_s3)
+    monkeypatch.setattr(video.storage_clients, 'get_client', lambda: fake_s3)
+    author = create_author()
+    session = video.VideoManager.start_upload_session('fake video', 'fake descr', author.id)
+    asyncio.run(video.VideoManager.upload_session_part(session, 1, as_stream(b'first ')))
+    asyncio.run(video.VideoManager.upload_session_part(session, 2, as_stream(b'broken')))
+    asyncio.run(video.VideoManager.upload_session_part(session, 2, as_stream(b'second')))
+    session = crud.get_upload_session(str(session.id), author.id)
+    assert [(part.part_number, part.size) for part in crud.get_uploaded_parts(session.id)] == [(1, 6), (2, 6)]
+    with pytest.raises(errors.PreviewMissingError):
+        video.VideoManager.complete_upload_session(session)
+
+    asyncio.run(video.VideoManager.upload_session_preview(session, io.BytesIO(b'preview')))
+    session = crud.get_upload_session(str(session.id), author.id)
+    video_id = video.VideoManager.complete_upload_session(session)
+    assert fake_s3.objects[('just-watch-videos', str(video_id))] == b'first second'
+    assert crud.get_video_by_id(video_id).is_published
+    with pytest.raises(errors.UploadSessionNotFound):
+        crud.get_upload_session(str(session.id), author.id)
+    reset_tables()
+
+
+def test_upload_session_of_other_user_is_not_found(monkeypatch):
+    fake_s3 = FakeMultipartS3()
+    monkeypatch.setattr(video.storage_clients, 'get_client', lambda: fake_s3)
+    author = create_author()
+    session = video.VideoManager.start_upload_session('fake video', 'fake descr', author.id)
+    with pytest.raises(errors.UploadSessionNotFound):
+        crud.get_upload_session(str(session.id), author.id + 1)
+    with pytest.raises(errors.UploadSessionNotFound):
+        crud.get_upload_session('not-a-uuid', author.id)
+    reset_tables()
@@ -186,3 +186,20 @@ def test_non_existent_user_rate_video():
         crud.rate_video(user_id=9999, video_id=video_db.id, user_reaction=crud.Reaction.LIKE)
     test_db.drop_tables([models.User, models.Video, models.Reaction])
     test_db.create_tables([models.User, models.Video, models.Reaction])
+
+
+def test_change_reaction_updates_counters():
+    author = create_author()
+    video_base = schemas.VideoCreate(video_name=VIDEO_NAME, description=VIDEO_DESCRIPTION)
+    video_db = crud.create_video(video_base, author.id)
+    crud.rate_video(user_id=author.id, video_id=video_db.id, user_reaction=crud.Reaction.LIKE)
+    crud.rate_video(user_id=author.id, video_id=video_db.id, user_reaction=crud.Reaction.DISLIKE)
+    reactions_inf = crud.get_video_number_of_likes_and_dislikes(video_db.id)
+    assert reactions_inf.number_of_likes == 0
+    assert reactions_inf.number_of_dislikes == 1
+    crud.rate_video(user_id=author.id, video_id=video_db.id, user_reaction=crud.Reaction.NEUTRAL)
+    reactions_inf = crud.get_video_number_of_likes_and_dislikes(video_db.id)
+    assert reactions_inf.number_of_likes == 0
+    assert reactions_inf.number_of_dislikes == 0
+    test_db.drop_tables([models.User, models.Video, models.Reaction])
+    test_db.create_tables([models.User, models.Video, models.Reaction])
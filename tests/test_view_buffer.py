@@ -0,0 +1,85 @@
+import datetime
+
+from app import schemas, models, crud
+from app.database import PeeweeConnectionState
+from app.view_buffer import ViewBuffer
+import peewee
+
+TABLES = [models.User, models.Video, models.Viewer]
+
+test_db = peewee.SqliteDatabase("test.db", check_same_thread=False)
+test_db._state = PeeweeConnectionState()
+test_db.connect()
+test_db.bind(TABLES)
+test_db.drop_tables(TABLES)
+test_db.create_tables(TABLES)
+test_db.close()
+
+
+def create_user(email, username):
+    return crud.create_user(schemas.UserCreate(email=email, username=username, password='somePassword'))
+
+
+def create_video(author_id: int):
+    return crud.create_video(schemas.VideoCreate(video_name='video', description='descr'), author_id)
+
+
+def reset_tables():
+    test_db.drop_tables(TABLES)
+    test_db.create_tables(TABLES)
+
+
+def test_record_views_upserts_and_counts_new_viewers():
+    author = create_user('author@mail.ru', 'author')
+    viewer = create_user('viewer@mail.ru', 'viewer')
+    video = create_video(author.id)
+    first_time = datetime.datetime(2023, 1, 1)
+    last_time = datetime.datetime(2023, 1, 2)
+    crud.record_views([(author.id, video.id, first_time), (viewer.id, video.id, first_time),
+                       (viewer.id, video.id, last_time), (viewer.id, video.id + 100, last_time)])
+    crud.record_views([(author.id, video.id, last_time)])
+
+    assert crud.get_number_of_views(video.id) == 2
+    viewing_times = {row.viewer_id: row.viewing_time for row in models.Viewer.select()}
+    assert viewing_times == {author.id: last_time, viewer.id: last_time}
+    reset_tables()
+
+
+def test_record_views_counts_only_inserted_viewers_per_video():
+    author = create_user('author@mail.ru', 'author')
+    viewer = create_user('viewer@mail.ru', 'viewer')
+    first, second = create_video(author.id), create_video(author.id)
+    crud.record_views([(author.id, first.id, datetime.datetime(2023, 1, 1))])
+    crud.record_views([(author.id, first.id, datetime.datetime(2023, 1, 2)),
+                       (viewer.id, first.id, datetime.datetime(2023, 1, 2)),
+                       (author.id, second.id, datetime.datetime(2023, 1, 2)),
+                       (viewer.id, second.id, datetime.datetime(2023, 1, 2))])
+
+    assert (crud.get_number_of_views(first.id), crud.get_number_of_views(second.id)) == (2, 2)
+    assert {row.viewing_time for row in models.Viewer.select()} == {datetime.datetime(2023, 1, 2)}
+    reset_tables()
+
+
+def test_buffer_flushes_pending_views_on_stop():
+    author = create_user('author@mail.ru', 'author')
+    video = create_video(author.id)
+    buffer = ViewBuffer(maxsize=100, flush_interval=60, flush_size=100, put_timeout=0)
+    buffer.start()
+    buffer.record(author.id, video.id)
+    buffer.stop()
+    assert crud.get_number_of_views(video.id) == 1
+    reset_tables()
+
+
+def test_buffer_writes_through_when_full():
+    author = create_user('author@mail.ru', 'author')
+    videos = [create_video(author.id) for _ in range(3)]
+    buffer = ViewBuffer(maxsize=1, flush_interval=60, flush_size=100, put_timeout=0)
+    buffer._thread = object()
+    for video in videos:
+        buffer.record(author.id, video.id)
+    assert [crud.get_number_of_views(video.id) for video in videos] == [0, 1, 1]
+    buffer._thread = None
+    buffer.flush()
+    assert [crud.get_number_of_views(video.id) for video in videos] == [1, 1, 1]
+    reset_tables()